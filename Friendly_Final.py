@@ -1,21 +1,24 @@
 import os
 import asyncio
 import sys
-import time
-import glob
 import pandas as pd
 import numpy as np
-import edge_tts
-import whisper
-import sounddevice as sd
-from scipy.io.wavfile import write
-from sentence_transformers import SentenceTransformer, util
-from pydub import AudioSegment
-from pydub.playback import play
-from transformers import pipeline
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import warnings
+import audio_cache
+import tts_backends
+import affect
+import batching
+import service_routes
+import inference_backends
+import speech_input
+import stt_backends
+from embedding_store import EmbeddingStore
+from startup import Startup
+from similarity import SimilarityIndex
+from response_cache import ResponseCache
+from messages import WELCOME_MESSAGE, GOODBYE_MESSAGE, EXIT_COMMANDS, MATCH_ERROR_MESSAGE, INVALID_QUERY_MESSAGE
 
 # Fix tokenizer parallelism warning
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -30,144 +33,118 @@ app = Flask(__name__, static_url_path='/static')
 CORS(app)
 
 # Global variables
-whisper_model = None
 model = None
-sentiment_pipeline = None
-emotion_classifier = None
+sbert_revision = None  # version of the loaded weights; keys the embedding stores
+affect_analyzer = None
 user_queries = None
 responses = None
-query_embeddings = None
+query_index = None
+response_cache = ResponseCache()
 
-# -------- AUDIO FILE MANAGEMENT --------
-def cleanup_old_audio_files(max_files=5):
-    """Keep only the most recent audio files to prevent storage bloat"""
-    try:
-        files = sorted(glob.glob('static/response_*.mp3'), key=os.path.getmtime)
-        while len(files) > max_files:
-            os.remove(files.pop(0))
-    except Exception as e:
-        print(f"Error cleaning up audio files: {e}")
-
-def get_unique_filename():
-    """Generate unique filename with timestamp"""
-    return f"response_{int(time.time())}.mp3"
+VOICE = "en-US-AvaNeural"
 
 # -------- SPEAK FUNCTION --------
-async def speak(text, play_audio=False):
-    """Convert text to speech and optionally play it immediately"""
+async def speak(text):
+    """Convert text to speech and return the audio path (the server never plays it)"""
     try:
-        tts = edge_tts.Communicate(text, "en-US-AvaNeural")
-        
-        # Ensure the static directory exists
-        if not os.path.exists('static'):
-            os.makedirs('static')
-        
-        filename = get_unique_filename()
-        path = os.path.join('static', filename)
-        
-        await tts.save(path)
-        
-        if play_audio:
-            try:
-                audio = AudioSegment.from_file(path, format="mp3")
-                play(audio)
-            except Exception as e:
-                print(f"Error playing audio: {e}")
-        
-        cleanup_old_audio_files()
-        return path
-        
+        return await tts_backends.synthesize(text, VOICE)
     except Exception as e:
         print(f"Error in speak function: {e}")
         raise
 
-# -------- RECORD AUDIO --------
-def record_audio(filename="user_input.wav", duration=7, fs=16000):
-    """Record audio from microphone"""
-    try:
-        print("Recording...")
-        recording = sd.rec(int(duration * fs), samplerate=fs, channels=1)
-        sd.wait()  # Wait until recording is finished
-        write(filename, fs, recording)  # Save as WAV file
-        return filename
-    except Exception as e:
-        print(f"Error recording audio: {e}")
-        raise
-
 # -------- TRANSCRIBE AUDIO --------
-def transcribe_audio(filename):
-    """Convert speech to text using Whisper"""
+def transcribe_audio(audio, prompt=None):
+    """Convert speech (a file path or 16 kHz float32 samples) to text using Whisper (loaded on first use)"""
     try:
-        result = whisper_model.transcribe(filename)
-        return result["text"].strip()
+        return stt_backends.transcribe(audio, prompt)
     except Exception as e:
         print(f"Error transcribing audio: {e}")
         raise
 
 # -------- LOAD MODELS AND DATA --------
+# DATA_FILE = "/usr/local/bin/Friendly_Conversation_Pie.xlsx"
+DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "Friendly_Conversation_Pie.xlsx")
+SBERT_MODEL = 'all-MiniLM-L12-v2'
+SBERT_MODEL_TAG = inference_backends.model_tag(SBERT_MODEL)  # embedding cache key for the selected backend
+
+def load_conversation_data(file_path=DATA_FILE):
+    """Load user queries and assistant responses from the conversation dataset"""
+    data = pd.read_excel(file_path)
+    data = data.dropna(subset=["Users", "Conversations"]).reset_index(drop=True)
+    return data['Users'].tolist(), data['Conversations'].tolist()
+
+startup = Startup("friendly")
+
+# Independent steps load in parallel; query_index waits for the encoder and the dataset
+if stt_backends.WHISPER_PRELOAD:  # otherwise Whisper loads on the first /listen
+    @startup.step("whisper", warmup=lambda: transcribe_audio(np.zeros(16000, dtype=np.float32)))
+    def load_whisper():
+        stt_backends.get_transcriber().load()
+
+@startup.step("sbert", warmup=lambda: model.encode(["warm up"]))
+def load_sbert():
+    global model, sbert_revision
+    model = batching.wrap_encoder(inference_backends.load_sentence_encoder(SBERT_MODEL), "friendly")
+    sbert_revision = inference_backends.model_revision(model)
+
+@startup.step("affect", warmup=lambda: affect_analyzer.analyze("warm up"))
+def load_affect():
+    global affect_analyzer
+    # Sentiment and emotion share one tokenization (or one encoder pass) per batch
+    affect_analyzer = affect.AffectAnalyzer()
+
+@startup.step("data")
+def load_data():
+    global user_queries, responses
+    user_queries, responses = load_conversation_data()
+
+@startup.step("query_index", after=("sbert", "data"), warmup=lambda: find_best_match("warm up"))
+def load_query_index():
+    global query_index
+    query_index = SimilarityIndex(EmbeddingStore("friendly_queries", SBERT_MODEL_TAG, sbert_revision).encode(
+        user_queries, model.encode
+    ))
+
 def init_models_and_data():
     """Initialize all models and load conversation data"""
-    global whisper_model, model, sentiment_pipeline, emotion_classifier, user_queries, responses, query_embeddings
-    
     print("📦 Loading models and data...")
-    
     try:
-        # Load Whisper model
-        whisper_model = whisper.load_model("base")
-        
-        # Load sentence transformer model
-        model = SentenceTransformer('all-MiniLM-L12-v2')
-        
-        # Load sentiment analysis model
-        sentiment_pipeline = pipeline(
-            "sentiment-analysis",
-            model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
-            revision="714eb0f"
-        )
-        
-        # Load emotion classification model
-        emotion_classifier = pipeline(
-            "text-classification",
-            model="bhadresh-savani/distilbert-base-uncased-emotion",
-            return_all_scores=True
-        )
-        
-        # Load conversation dataset
-        # file_path = "/usr/local/bin/Friendly_Conversation_Pie.xlsx"
-        file_path = os.path.join(os.path.dirname(__file__), "data", "Friendly_Conversation_Pie.xlsx")
-        data = pd.read_excel(file_path)
-        data = data.dropna(subset=["Users", "Conversations"]).reset_index(drop=True)
-        
-        # Prepare user queries and assistant responses
-        user_queries = data['Users'].tolist()
-        responses = data['Conversations'].tolist()
-        query_embeddings = model.encode(user_queries, convert_to_tensor=True)
-        
+        startup.run()
+        print(startup.summary())
         print("✅ Models and data loaded successfully.")
     except Exception as e:
         print(f"❌ Error loading models/data: {e}")
         raise
 
 # -------- FIND BEST MATCH --------
-def find_best_match(user_input):
+def find_best_match(user_input, input_embedding=None):
     """Find the most relevant response from the dataset"""
     try:
-        input_embedding = model.encode([user_input], convert_to_tensor=True)
-        similarity_scores = util.pytorch_cos_sim(input_embedding, query_embeddings).cpu().numpy().flatten()
-        best_idx = np.argmax(similarity_scores)
+        if input_embedding is None:
+            input_embedding = model.encode([user_input])[0]
+        best_idx, _ = query_index.best(input_embedding)
         return responses[best_idx]
     except Exception as e:
         print(f"Error finding best match: {e}")
-        return "I'm sorry, I couldn't process that request."
+        return MATCH_ERROR_MESSAGE
+
+def answer_query(query):
+    """Resolve a text query to (response, cached audio path or None, remember(audio_path))"""
+    if query.lower() in EXIT_COMMANDS:
+        return GOODBYE_MESSAGE, None, lambda audio_path: None
+    # Repeated or near-duplicate queries are answered from the response cache
+    return response_cache.answer(query, lambda: model.encode([query])[0], find_best_match,
+                                 never_cache=(MATCH_ERROR_MESSAGE,))
 
 # -------- SENTIMENT & EMOTION ANALYSIS --------
 def get_sentiment_emotion(text):
     """Analyze text sentiment and emotion"""
     try:
-        sentiment_result = sentiment_pipeline(text)[0]
+        result = affect_analyzer.analyze(text)
+        sentiment_result = result['sentiment']
         sentiment = "neutral" if sentiment_result['score'] < 0.6 else sentiment_result['label'].lower()
         
-        emotion_scores = emotion_classifier(text)[0]
+        emotion_scores = result['emotions']
         top_emotion = max(emotion_scores, key=lambda x: x['score'])['label']
         
         emotion_map = {"sadness": "sad", "joy": "happy", "anger": "angry"}
@@ -187,51 +164,56 @@ def ask():
         query = data.get("query", "").strip()
 
         if not query:
-            return jsonify({"error": "Invalid input", "audio_url": ""}), 400
+            return jsonify({"error": INVALID_QUERY_MESSAGE, "audio_url": ""}), 400
 
-        # Check for exit conditions
-        if query.lower() in ["exit", "goodbye", "bye", "thank you", "babye", "thankyou", "good bye"]:
-            response = "Goodbye! Hope My Spy was able to help you. Give Pie a genuine feedback about our conversations. Thank you!"
-        else:
-            response = find_best_match(query)
+        # Exit conditions, cached answers and dataset matches
+        response, audio_path, remember = answer_query(query)
 
         # Generate audio file (don't play it here - let frontend handle playback)
-        audio_path = asyncio.run(speak(response, play_audio=False))
+        if audio_path is None:
+            audio_url, audio_path = service_routes.answer_audio(response, VOICE, speak)
+            remember(audio_path)
+        else:
+            audio_url = f"/static/{audio_cache.static_relpath(audio_path)}"
 
         return jsonify({
             "response": response,
-            "audio_url": f"/static/{os.path.basename(audio_path)}"
+            "audio_url": audio_url
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/listen", methods=["POST"])
 def listen():
-    """Handle voice input requests"""
+    """Handle voice input: uploaded or streamed audio, transcribed while it arrives"""
     try:
-        # Record audio
-        audio_file = record_audio()
-        
-        # Transcribe audio
-        user_input = transcribe_audio(audio_file)
+        # Either a multipart upload ("audio" field) or the raw body, possibly sent chunked while the user speaks
+        upload = request.files.get("audio") if request.mimetype == "multipart/form-data" else None
+        if upload is not None:
+            chunks, content_type = speech_input.iter_body(upload.stream), upload.content_type
+        else:
+            chunks, content_type = speech_input.iter_body(request.stream), request.content_type
+        user_input = speech_input.transcribe_stream(chunks, content_type, transcribe_audio)
         
         if not user_input:
             return jsonify({"error": "No speech detected"}), 400
         
         # Get response
-        if user_input.lower() in ["exit", "goodbye", "bye", "thank you", "babye", "thankyou", "good bye"]:
-            response = "Goodbye! Hope My Spy was able to help you. Give Pie a genuine feedback about our conversations. Thank you!"
+        if user_input.lower() in EXIT_COMMANDS:
+            response = GOODBYE_MESSAGE
         else:
             response = find_best_match(user_input)
         
         # Generate audio file (don't play it here)
-        audio_path = asyncio.run(speak(response, play_audio=False))
+        audio_path = asyncio.run(speak(response))
         
         return jsonify({
             "user_input": user_input,
             "response": response,
-            "audio_url": f"/static/{os.path.basename(audio_path)}"
+            "audio_url": f"/static/{audio_cache.static_relpath(audio_path)}"
         })
+    except ValueError as e:  # audio that can't be decoded
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -239,15 +221,21 @@ def listen():
 def welcome():
     """Provide welcome message"""
     try:
-        welcome_message = "Welcome to My Spy! Hi, I am Pie. I am your friend. How can I help you today?"
-        audio_path = asyncio.run(speak(welcome_message, play_audio=False))
+        welcome_message = WELCOME_MESSAGE
+        audio_path = asyncio.run(speak(welcome_message))
         return jsonify({
             "response": welcome_message,
-            "audio_url": f"/static/{os.path.basename(audio_path)}"
+            "audio_url": f"/static/{audio_cache.static_relpath(audio_path)}"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+app.register_blueprint(service_routes.create_blueprint(startup, metrics=lambda: {
+    "response_cache": response_cache.stats(),
+    "listen": speech_input.stats(),
+    "whisper": stt_backends.stats(),
+}))
+
 # -------- STARTUP --------
 if __name__ == "__main__":
     try:
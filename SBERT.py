@@ -1,26 +1,52 @@
 from flask import Flask, request, jsonify
 import pandas as pd
-import numpy as np
 import asyncio
-import edge_tts
-from sentence_transformers import SentenceTransformer, util
-from pydub import AudioSegment
-from pydub.playback import play
 from flask_cors import CORS
-import os
+import audio_cache
+import batching
+import inference_backends
+import service_routes
+import tts_backends
+from embedding_store import EmbeddingStore
+from similarity import SimilarityIndex
+from startup import Startup
 
 app = Flask(__name__)
 CORS(app)
 
-# Load the model
-model = SentenceTransformer('all-MiniLM-L12-v2')
+SBERT_MODEL = 'all-MiniLM-L12-v2'
+SBERT_MODEL_TAG = inference_backends.model_tag(SBERT_MODEL)  # embedding cache key for the selected backend
+model = None
+sbert_revision = None  # version of the loaded weights; keys the embedding stores
+data = None
+provider_index = None
 
-# Load your data from Excel
-data = pd.read_excel("/usr/local/bin/excel.xlsx")
-data['Combined_Text'] = data.apply(lambda row: f"{row['Backstory']} {row['User Location']}", axis=1)
+# Model and spreadsheet load in parallel; the provider embeddings need both
+startup = Startup("sbert")
 
-# Generate embeddings for the combined text data
-provider_embeddings = model.encode(data['Combined_Text'].tolist(), convert_to_tensor=True)
+@startup.step("sbert", warmup=lambda: model.encode(["warm up"]))
+def load_model():
+    global model, sbert_revision
+    model = batching.wrap_encoder(inference_backends.load_sentence_encoder(SBERT_MODEL), "sbert")
+    sbert_revision = inference_backends.model_revision(model)
+
+@startup.step("data")
+def load_data():
+    global data
+    data = pd.read_excel("/usr/local/bin/excel.xlsx")
+    data['Combined_Text'] = data.apply(lambda row: f"{row['Backstory']} {row['User Location']}", axis=1)
+
+@startup.step("provider_index", after=("sbert", "data"), warmup=lambda: find_best_match("warm up", "warm up"))
+def load_provider_index():
+    global provider_index
+    provider_index = SimilarityIndex(EmbeddingStore("sbert_providers", SBERT_MODEL_TAG, sbert_revision).encode(
+        data['Combined_Text'].tolist(), model.encode
+    ))
+
+def init_models_and_data():
+    """Load and warm up the model, dataset and provider embeddings"""
+    startup.run()
+    print(startup.summary())
 
 # Clean text function
 def clean_text(text):
@@ -28,28 +54,14 @@ def clean_text(text):
 
 # Text-to-Speech function
 async def speak(text):
-    tts = edge_tts.Communicate(text, "en-US-AvaNeural")
-    
-    # Ensure the static directory exists
-    if not os.path.exists('static'):
-        os.makedirs('static')
-    
-    filename = "response.mp3"
-    path = os.path.join('static', filename)
-    
-    await tts.save(path)
-    
-    # Play the generated audio
-    play(AudioSegment.from_file(path, format="mp3"))
-    
-    return filename  # Return only the filename for the URL
+    """Generate (or reuse) the audio file for text and return its path (never played server-side)"""
+    return await tts_backends.synthesize(text, "en-US-AvaNeural")
 
 # Function to find the best match from the data
 def find_best_match(user_backstory, user_location):
     user_input = f"{user_backstory} {user_location}"
-    user_embedding = model.encode([user_input], convert_to_tensor=True)
-    similarity_scores = util.pytorch_cos_sim(user_embedding, provider_embeddings).cpu().numpy().flatten()
-    best_match_idx = np.argmax(similarity_scores)
+    user_embedding = model.encode([user_input])[0]
+    best_match_idx, _ = provider_index.best(user_embedding)
     best_provider = data.iloc[best_match_idx]
     
     # Format the response text
@@ -72,13 +84,16 @@ def recommend():
         return jsonify({"error": "Missing input fields"}), 400
 
     result_text = find_best_match(backstory, location)
-    audio_filename = asyncio.run(speak(result_text))
+    audio_filename = audio_cache.static_relpath(asyncio.run(speak(result_text)))
 
     return jsonify({
         "response": result_text,
         "audio_url": f"/static/{audio_filename}"
     })
 
+app.register_blueprint(service_routes.create_blueprint(startup, audio=False))
+
 # Run the Flask app
 if __name__ == "__main__":
+ init_models_and_data()
  app.run(host="0.0.0.0", port=8003, debug=False)
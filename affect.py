@@ -0,0 +1,233 @@
+"""Sentiment and emotion analysis in one component.
+
+Usage:
+    analyzer = AffectAnalyzer()
+    analyzer.analyze("I can't find my dog")
+    # {"sentiment": {"label": "NEGATIVE", "score": 0.99}, "emotions": [{"label": "sadness", "score": 0.93}, ...]}
+
+    python affect.py --fit                                # distil the shared-backbone emotion head
+    python affect.py --fit data/Friendly_Conversation_Pie.xlsx more_texts.txt
+"""
+import os
+import logging
+import argparse
+
+import numpy as np
+
+import batching
+import inference_backends
+
+logger = logging.getLogger(__name__)
+
+# The sentiment (SST-2) and emotion models are both DistilBERT fine-tunes of
+# distilbert-base-uncased, so they share a vocabulary: each batch is tokenized once and
+# fed to both classifiers. Concurrent requests are micro-batched like encode() calls
+# (ENCODE_BATCHING). AFFECT_SHARED_BACKBONE=1 goes further and runs a single encoder pass:
+# sentiment uses its own head and emotion a linear head distilled onto the sentiment
+# model's features (python affect.py --fit writes it to AFFECT_HEAD_FILE). Shared mode
+# needs the torch backend and falls back to two passes if the head is missing.
+SENTIMENT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+SENTIMENT_REVISION = "714eb0f"
+EMOTION_MODEL = "bhadresh-savani/distilbert-base-uncased-emotion"
+AFFECT_SHARED_BACKBONE = os.environ.get("AFFECT_SHARED_BACKBONE", "0") == "1"
+AFFECT_HEAD_FILE = os.environ.get("AFFECT_HEAD_FILE", os.path.join("affect_heads", "emotion_on_sst2.npz"))
+MAX_LENGTH = 512
+FIT_DATA = os.path.join(os.path.dirname(__file__), "data", "Friendly_Conversation_Pie.xlsx")
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class _TorchClassifier:
+    """A DistilBERT sequence classifier returning raw logits"""
+
+    def __init__(self, name, revision=None):
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(name, revision=revision)
+        self.model = AutoModelForSequenceClassification.from_pretrained(name, revision=revision).eval()
+        config = self.model.config
+        self.labels = [config.id2label[i] for i in range(config.num_labels)]
+
+    def tokenize(self, texts):
+        return self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+
+    def logits(self, encoded):
+        import torch
+        with torch.inference_mode():
+            return self.model(**encoded).logits.float().numpy()
+
+    def features_and_logits(self, encoded):
+        """The head's input (pre_classifier + ReLU over the [CLS] state) and its logits, from one pass"""
+        import torch
+        model = self.model
+        with torch.inference_mode():
+            hidden = model.distilbert(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"])[0]
+            features = torch.relu(model.pre_classifier(hidden[:, 0]))
+            return features.float().numpy(), model.classifier(features).float().numpy()
+
+
+class _OnnxClassifier:
+    """The same interface on the exported ONNX (or int8) graph"""
+
+    def __init__(self, name, revision=None, quantized=True):
+        self.onnx = inference_backends.OnnxModel(*inference_backends.prepare("classifier", name, revision),
+                                                 quantized=quantized)
+        self.tokenizer = self.onnx.tokenizer
+        self.labels = self.onnx.meta["labels"]
+
+    def tokenize(self, texts):
+        return self.onnx.tokenize(texts)
+
+    def logits(self, encoded):
+        return self.onnx.forward(encoded)
+
+
+def _load_classifier(name, revision, backend):
+    if backend == "torch":
+        return _TorchClassifier(name, revision)
+    return _OnnxClassifier(name, revision, quantized=backend == "onnx-int8")
+
+
+def _load_head(head_file, backend):
+    """The distilled emotion head, or None (logged) when shared mode can't be used"""
+    if backend != "torch":
+        logger.warning(f"AFFECT_SHARED_BACKBONE needs the torch backend, not {backend}; using two passes")
+        return None
+    if not os.path.exists(head_file):
+        logger.warning(f"No emotion head at {head_file} (python affect.py --fit); using two passes")
+        return None
+    with np.load(head_file, allow_pickle=False) as f:
+        head = {k: f[k] for k in f.files}
+    if str(head["sentiment_model"]) != SENTIMENT_MODEL or str(head["sentiment_revision"]) != SENTIMENT_REVISION:
+        logger.warning(f"Emotion head at {head_file} was fitted on another sentiment model; using two passes")
+        return None
+    return head
+
+
+class AffectAnalyzer:
+    """Sentiment and, optionally, emotion scores with one tokenization (or one encoder pass) per batch"""
+
+    def __init__(self, emotion=True, shared=AFFECT_SHARED_BACKBONE, backend=inference_backends.INFERENCE_BACKEND,
+                 head_file=AFFECT_HEAD_FILE):
+        self.sentiment = _load_classifier(SENTIMENT_MODEL, SENTIMENT_REVISION, backend)
+        self.emotion = None
+        self.emotion_head = _load_head(head_file, backend) if emotion and shared else None
+        if self.emotion_head is not None:
+            self.emotion_labels = [str(label) for label in self.emotion_head["labels"]]
+        elif emotion:
+            self.emotion = _load_classifier(EMOTION_MODEL, None, backend)
+            self.emotion_labels = self.emotion.labels
+            self.shared_tokens = self.emotion.tokenizer.get_vocab() == self.sentiment.tokenizer.get_vocab()
+        self.mode = "shared-backbone" if self.emotion_head is not None else "two-pass" if emotion else "sentiment"
+        self._batcher = batching.MicroBatcher(self._analyze_batch, f"affect-{self.mode}") \
+            if batching.ENCODE_BATCHING else None
+
+    def _probabilities(self, texts):
+        """(sentiment probabilities, emotion probabilities or None)"""
+        encoded = self.sentiment.tokenize(texts)
+        if self.emotion_head is not None:
+            features, sentiment_logits = self.sentiment.features_and_logits(encoded)
+            return _softmax(sentiment_logits), _softmax(features @ self.emotion_head["weight"]
+                                                        + self.emotion_head["bias"])
+        sentiment = _softmax(self.sentiment.logits(encoded))
+        if self.emotion is None:
+            return sentiment, None
+        return sentiment, _softmax(self.emotion.logits(encoded if self.shared_tokens else self.emotion.tokenize(texts)))
+
+    def _analyze_batch(self, texts):
+        sentiment, emotion = self._probabilities(list(texts))
+        results = []
+        for i, row in enumerate(sentiment):
+            best = int(np.argmax(row))
+            result = {"sentiment": {"label": self.sentiment.labels[best], "score": float(row[best])}}
+            if emotion is not None:
+                result["emotions"] = [{"label": label, "score": float(p)}
+                                      for label, p in zip(self.emotion_labels, emotion[i])]
+            results.append(result)
+        return results
+
+    def analyze(self, texts):
+        """{"sentiment": {label, score}, "emotions": [{label, score}, ...]} per text (one dict for a str)"""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        size = batching.BATCH_MAX_SIZE
+        if self._batcher is not None and len(texts) <= size:
+            results = self._batcher.submit(texts)
+        else:
+            results = [r for start in range(0, len(texts), size) for r in self._analyze_batch(texts[start:start + size])]
+        return results[0] if single else results
+
+
+# -------- SHARED-BACKBONE HEAD --------
+def fit_emotion_head(texts, head_file=AFFECT_HEAD_FILE, ridge=1.0, holdout=0.2, batch_size=32):
+    """Distil the emotion model into a linear head on the sentiment model's features.
+
+    Ridge regression from the sentiment head's input features to the emotion model's
+    logits. Returns the top-label agreement with the emotion model on a held-out split
+    (None if there are too few texts to hold any out); the saved head is fitted on all texts.
+    """
+    sentiment = _TorchClassifier(SENTIMENT_MODEL, SENTIMENT_REVISION)
+    emotion = _TorchClassifier(EMOTION_MODEL)
+    features, targets = [], []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        features.append(sentiment.features_and_logits(sentiment.tokenize(batch))[0])
+        targets.append(emotion.logits(emotion.tokenize(batch)))
+    x = np.hstack([np.vstack(features), np.ones((len(texts), 1), dtype=np.float32)])
+    y = np.vstack(targets)
+
+    def solve(rows):
+        penalty = ridge * np.eye(x.shape[1])
+        penalty[-1, -1] = 0.0  # don't shrink the bias
+        return np.linalg.solve(x[rows].T @ x[rows] + penalty, x[rows].T @ y[rows])
+
+    order = np.random.default_rng(0).permutation(len(texts))
+    n_test = int(len(texts) * holdout)
+    agreement = None
+    if n_test:
+        test, train = order[:n_test], order[n_test:]
+        agreement = float(np.mean(np.argmax(x[test] @ solve(train), axis=1) == np.argmax(y[test], axis=1)))
+    solution = solve(order)
+
+    os.makedirs(os.path.dirname(head_file) or ".", exist_ok=True)
+    tmp_path = f"{head_file}.tmp.npz"
+    np.savez(tmp_path, weight=solution[:-1].astype(np.float32), bias=solution[-1].astype(np.float32),
+             labels=np.array(emotion.labels), sentiment_model=SENTIMENT_MODEL,
+             sentiment_revision=SENTIMENT_REVISION, emotion_model=EMOTION_MODEL)
+    os.replace(tmp_path, head_file)
+    return agreement
+
+
+def read_texts(paths):
+    """Non-empty strings from .xlsx cells or text-file lines"""
+    texts = []
+    for path in paths:
+        if path.endswith((".xlsx", ".xls")):
+            import pandas as pd
+            cells = pd.read_excel(path).select_dtypes(include="object").to_numpy().ravel()
+            texts.extend(v for v in cells if isinstance(v, str))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                texts.extend(f.read().splitlines())
+    return list(dict.fromkeys(t.strip() for t in texts if t.strip()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the shared-backbone emotion head")
+    parser.add_argument("--fit", nargs="*", metavar="FILE", help=f"texts to distil on (default {FIT_DATA})")
+    parser.add_argument("--head-file", default=AFFECT_HEAD_FILE)
+    parser.add_argument("--ridge", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.fit is None:
+        parser.error("nothing to do (use --fit)")
+    texts = read_texts(args.fit or [FIT_DATA])
+    agreement = fit_emotion_head(texts, args.head_file, ridge=args.ridge)
+    print(f"Fitted on {len(texts)} texts -> {args.head_file}")
+    if agreement is not None:
+        print(f"Held-out top-emotion agreement with {EMOTION_MODEL}: {agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
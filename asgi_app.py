@@ -0,0 +1,359 @@
+"""ASGI serving mode: one long-lived event loop per worker, model inference on a bounded thread pool.
+
+Usage:
+    SERVICE=friendly uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+    SERVICE=rag gunicorn -k uvicorn.workers.UvicornWorker -w 2 -b 0.0.0.0:8002 asgi_app:app
+
+SERVICE picks the app to serve: friendly (Friendly_Final), rag (rag_flask_api),
+guardrails or sbert (SBERT). Routes and JSON payloads match the Flask apps.
+edge-tts synthesis is awaited on the loop, so one worker overlaps many in-flight
+TTS calls, while encoders, rerankers and pipelines run in at most
+INFERENCE_THREADS threads at a time.
+"""
+import os
+import asyncio
+import logging
+import importlib
+import functools
+import contextlib
+import anyio
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import audio_cache
+import audio_jobs
+import audio_store
+import audio_stream
+import batching
+import speech_input
+import stt_backends
+import tts_backends
+from messages import (
+    GOODBYE_MESSAGE, EXIT_COMMANDS, WELCOME_MESSAGE, GUARDRAIL_WELCOME_MESSAGE,
+    GUARDRAIL_REFUSAL_MESSAGE, SERVER_ERROR_MESSAGE, INVALID_QUERY_MESSAGE, sentiment_message
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE = os.environ.get("SERVICE", "friendly")
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 4))
+
+SERVICE_MODULES = {
+    "friendly": "Friendly_Final",
+    "rag": "rag_flask_api",
+    "guardrails": "guardrails",
+    "sbert": "SBERT",
+}
+
+
+def audio_url(path):
+    return f"/static/{audio_cache.static_relpath(path)}"
+
+
+class Service:
+    """The loaded service module plus the thread limiter its blocking calls share"""
+
+    def __init__(self, name):
+        if name not in SERVICE_MODULES:
+            raise ValueError(f"Unknown SERVICE {name!r}; expected one of {sorted(SERVICE_MODULES)}")
+        self.name = name
+        self.module = None
+        self.limiter = None
+        self.ready = False
+        self.error = None
+
+    def load(self):
+        """Import the module and run its parallel startup (models, data, warm-up)"""
+        try:
+            self.module = importlib.import_module(SERVICE_MODULES[self.name])
+            if self.name == "rag":
+                self.module.init_models_and_index()
+            else:
+                self.module.init_models_and_data()
+            self.ready = True
+        except Exception as e:
+            self.error = e
+            logger.error(f"ASGI {self.name} service failed to start: {e}")
+            raise
+
+    def status(self):
+        startup = getattr(self.module, "startup", None)
+        if startup is None:  # still importing
+            return {"service": self.name, "ready": False, "error": repr(self.error) if self.error else None, "steps": {}}
+        return startup.status()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking (model) call on the bounded inference pool"""
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=self.limiter)
+
+
+class RequireReady:
+    """ASGI middleware answering 503 for everything but /ready and /static while the service loads"""
+
+    def __init__(self, app, service):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not self.service.ready \
+                and scope["path"] != "/ready" and not scope["path"].startswith("/static/"):
+            response = JSONResponse({"error": "Service is starting up"}, status_code=503, headers={"Retry-After": "5"})
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+# -------- FRIENDLY / RAG --------
+async def ask(request):
+    service = request.app.state.service
+    m = service.module
+    try:
+        data = await request.json()
+        query = data.get("query", "").strip()
+        if not query:
+            return JSONResponse({"error": INVALID_QUERY_MESSAGE, "audio_url": ""}, status_code=400)
+
+        response, audio_path, remember = await service.run(m.answer_query, query)
+        if audio_path is None:
+            url, audio_path = await answer_audio(service, response)
+            remember(audio_path)
+        else:
+            url = audio_url(audio_path)
+        return JSONResponse({"response": response, "audio_url": url})
+    except Exception as e:
+        logger.error(f"Error in /ask: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def listen(request):
+    service = request.app.state.service
+    m = service.module
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            upload = (await request.form())["audio"]
+            chunks, content_type = iter_upload(upload), upload.content_type
+        else:
+            chunks, content_type = request.stream(), request.headers.get("content-type")
+        # Segments are transcribed on the inference pool while the rest of the body streams in
+        user_input = await speech_input.transcribe_stream_async(
+            chunks, content_type, lambda samples, prompt: service.run(m.transcribe_audio, samples, prompt)
+        )
+        if not user_input:
+            return JSONResponse({"error": "No speech detected"}, status_code=400)
+
+        if user_input.lower() in EXIT_COMMANDS:
+            response = GOODBYE_MESSAGE
+        else:
+            response = await service.run(m.find_best_match, user_input)
+        audio_path = await synthesize(service, response)
+        return JSONResponse({
+            "user_input": user_input,
+            "response": response,
+            "audio_url": audio_url(audio_path)
+        })
+    except ValueError as e:  # audio that can't be decoded
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def iter_upload(upload):
+    while True:
+        chunk = await upload.read(speech_input.LISTEN_READ_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def synthesize(service, text):
+    """Await the service's TTS natively and return the audio path"""
+    if service.name == "guardrails":
+        return os.path.join("static", await service.module.speak(text))
+    return await service.module.speak(text)
+
+
+async def answer_audio(service, text):
+    """(audio_url, audio path): deferred to a background job in AUDIO_BACKGROUND mode, else synthesized now"""
+    deferred = audio_jobs.submit(text, service.module.VOICE)
+    if deferred is not None:
+        return deferred
+    path = await synthesize(service, text)
+    return audio_url(path), path
+
+
+async def audio(request):
+    """Serve background-synthesized audio, waiting for it if the job is still running"""
+    key = request.path_params["key"]
+    jobs = audio_jobs.get_jobs()
+    if jobs is None or not audio_cache.valid_key(key):
+        return JSONResponse({"error": "Unknown audio"}, status_code=404)
+    try:
+        wait = min(float(request.query_params.get("wait", audio_jobs.AUDIO_WAIT_TIMEOUT)), audio_jobs.AUDIO_WAIT_TIMEOUT)
+        path = await jobs.wait_async(key, wait)
+    except Exception as e:
+        logger.error(f"Error in /audio: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    if path is None:
+        if jobs.is_pending(key):
+            return JSONResponse({"status": "pending"}, status_code=202, headers={"Retry-After": "1"})
+        return JSONResponse({"error": "Unknown audio"}, status_code=404)
+    return FileResponse(path, media_type="audio/mpeg")
+
+
+async def stream(request):
+    """Stream reply audio as it is synthesized (cached replies are sent from disk)"""
+    chunks = audio_stream.open_stream(request.path_params["key"])
+    if chunks is None:
+        return JSONResponse({"error": "Unknown audio"}, status_code=404)
+    return StreamingResponse(chunks, media_type="audio/mpeg")
+
+
+async def welcome(request):
+    service = request.app.state.service
+    message = GUARDRAIL_WELCOME_MESSAGE if service.name == "guardrails" else WELCOME_MESSAGE
+    try:
+        audio_path = await synthesize(service, message)
+        return JSONResponse({"response": message, "audio_url": audio_url(audio_path)})
+    except Exception as e:
+        logger.error(f"Error in /welcome: {e}")
+        if service.name != "guardrails":
+            return JSONResponse({"error": str(e)}, status_code=500)
+        return await guardrail_error(service, SERVER_ERROR_MESSAGE, 500)
+
+
+# -------- GUARDRAILS / SBERT --------
+async def guardrail_error(service, message, status_code):
+    url, _ = await answer_audio(service, message)
+    return JSONResponse({"error": message, "audio_url": url}, status_code=status_code)
+
+
+async def recommend(request):
+    service = request.app.state.service
+    if service.name == "sbert":
+        return await recommend_sbert(request, service)
+    m = service.module
+    try:
+        content = await request.json()
+        if not content:
+            return JSONResponse({"error": "Invalid JSON payload"}, status_code=400)
+
+        backstory = content.get("backstory", "").strip()
+        location = content.get("location", "").strip()
+        if not backstory or not location:
+            return JSONResponse({"error": "Missing backstory or location fields"}, status_code=400)
+
+        analysis = await service.run(m.analyze_request, backstory, location)
+        if not m.is_pi_related_semantic(backstory, analysis["pi_scores"]):
+            return await guardrail_error(service, GUARDRAIL_REFUSAL_MESSAGE, 400)
+
+        sentiment, _ = await service.run(m.get_sentiment, backstory)
+        sentiment_msg = sentiment_message(sentiment)
+        match_result = m.find_best_match(backstory, location, analysis)
+
+        # Both clips are synthesized concurrently on the loop (or queued in background mode)
+        (sentiment_url, _), (match_url, _) = await asyncio.gather(
+            answer_audio(service, sentiment_msg), answer_audio(service, match_result["response"])
+        )
+        return JSONResponse({
+            "sentiment": sentiment_msg,
+            "sentiment_audio_url": sentiment_url,
+            "response": match_result["response"],
+            "specialties": match_result["specialties"],
+            "provider_location": match_result["provider_location"],
+            "context": match_result["context"],
+            "audio_url": match_url
+        })
+    except Exception as e:
+        logger.error(f"Error in /recommend: {e}")
+        return await guardrail_error(service, SERVER_ERROR_MESSAGE, 500)
+
+
+async def recommend_sbert(request, service):
+    content = await request.json()
+    backstory = content.get("backstory", "")
+    location = content.get("location", "")
+    if not backstory or not location:
+        return JSONResponse({"error": "Missing input fields"}, status_code=400)
+
+    result_text = await service.run(service.module.find_best_match, backstory, location)
+    audio_path = await synthesize(service, result_text)
+    return JSONResponse({"response": result_text, "audio_url": audio_url(audio_path)})
+
+
+async def ready(request):
+    """Readiness probe: 200 once every model and dataset is loaded and warm, else 503 with progress"""
+    status = request.app.state.service.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+async def metrics(request):
+    """Report encode batching, cache and inference pool statistics"""
+    service = request.app.state.service
+    m = service.module
+    cache = audio_cache.get_cache()
+    stats = {
+        "batching": batching.all_stats(),
+        "tts_cache": cache.stats() if cache is not None else None,
+        "audio_jobs": audio_jobs.stats(),
+        "tts": tts_backends.stats(),
+        "audio_store": audio_store.get_store().stats(),
+        "inference_pool": {
+            "threads": service.limiter.total_tokens,
+            "busy": service.limiter.borrowed_tokens,
+        },
+    }
+    if service.name == "friendly":
+        stats["listen"] = speech_input.stats()
+        stats["whisper"] = stt_backends.stats()
+    if hasattr(m, "response_cache"):
+        stats["response_cache"] = m.response_cache.stats()
+    if hasattr(m, "rerank_cache"):
+        stats["rerank_cache"] = m.rerank_cache.stats()
+    return JSONResponse(stats)
+
+
+SERVICE_ROUTES = {
+    "friendly": [Route("/ask", ask, methods=["POST"]), Route("/listen", listen, methods=["POST"]),
+                 Route("/welcome", welcome, methods=["GET"])],
+    "rag": [Route("/ask", ask, methods=["POST"])],
+    "guardrails": [Route("/recommend", recommend, methods=["POST"]), Route("/welcome", welcome, methods=["GET"])],
+    "sbert": [Route("/recommend", recommend, methods=["POST"])],
+}
+
+
+def create_app(name=SERVICE):
+    service = Service(name)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        service.limiter = anyio.CapacityLimiter(INFERENCE_THREADS)
+        # Model loading blocks for a while: run it off the loop and start serving /ready at once
+        def loaded(task):
+            if not task.cancelled() and task.exception() is None:
+                logger.info(f"ASGI {name} service ready with {INFERENCE_THREADS} inference threads")
+
+        if not service.ready:  # already loaded when gunicorn preloaded it before forking (see preload.py)
+            app.state.loading = asyncio.ensure_future(anyio.to_thread.run_sync(service.load))
+            app.state.loading.add_done_callback(loaded)
+        yield
+
+    os.makedirs("static", exist_ok=True)
+    routes = SERVICE_ROUTES[name] + [
+        Route("/ready", ready, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/audio/{key}", audio, methods=["GET"]),
+        Route("/stream/{key}", stream, methods=["GET"]),
+        Mount("/static", app=StaticFiles(directory="static"), name="static"),
+    ]
+    app = Starlette(routes=routes, lifespan=lifespan, middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"]), Middleware(RequireReady, service=service)
+    ])
+    app.state.service = service
+    return app
+
+
+app = create_app()
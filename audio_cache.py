@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cached files live under static/ so Flask serves them like any other response audio.
+# Set TTS_CACHE_MAX_BYTES=0 to disable the cache entirely.
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "static")
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+TTS_CACHE_PREFIX = "tts_"
+
+# Output of prerender_audio.py: one versioned directory per voice with a manifest.json
+PRERENDER_DIR = os.environ.get("PRERENDER_DIR", os.path.join("static", "prerendered"))
+PRERENDER_VERSION = "v1"
+
+_key_pattern = re.compile(r"^[0-9a-f]{64}$")
+_cache = None
+_cache_lock = threading.Lock()
+_manifests = {}  # voice -> (manifest mtime, {key: filename})
+
+
+class AudioCache:
+    """Content-addressed on-disk cache of synthesized speech with size-bounded LRU eviction"""
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, prefix=TTS_CACHE_PREFIX):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # filename -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU index from the files already on disk, oldest access first"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith(self.prefix) and name.endswith(".mp3"):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def key(voice, text):
+        return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+
+    def filename(self, voice, text):
+        return f"{self.prefix}{self.key(voice, text)}.mp3"
+
+    def path_for(self, voice, text):
+        return os.path.join(self.directory, self.filename(voice, text))
+
+    def get(self, voice, text):
+        """Return the cached audio path for (voice, text), or None on a miss"""
+        name = self.filename(voice, text)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            try:
+                # Bump mtime so LRU order survives restarts and is visible to other workers
+                os.utime(path)
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                if name in self._entries:
+                    self._total_bytes -= self._entries.pop(name)
+                self.misses += 1
+                return None
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                # Written by another worker sharing the directory
+                self._entries[name] = size
+                self._total_bytes += size
+            self.hits += 1
+            return path
+
+    def put(self, voice, text, tmp_path):
+        """Atomically move a freshly synthesized file into the cache and return its path"""
+        name = self.filename(voice, text)
+        path = os.path.join(self.directory, name)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._total_bytes += size
+            self._evict(keep=name)
+        return path
+
+    def _evict(self, keep=None):
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            del self._entries[name]
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    async def fetch(self, text, voice, synthesize):
+        """Return cached audio for text, calling `await synthesize(path)` only on a miss"""
+        path = self.get(voice, text)
+        if path is not None:
+            return path
+        # Unique per call: concurrent fetches can share a process and thread under one event loop
+        tmp_path = f"{self.path_for(voice, text)}.{uuid.uuid4().hex}.tmp"
+        try:
+            await synthesize(tmp_path)
+            return self.put(voice, text, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def valid_key(key):
+    """True for strings shaped like AudioCache.key() output (safe to put in a path)"""
+    return bool(_key_pattern.match(key))
+
+
+def get_cache():
+    """Return the process-wide audio cache, or None when caching is disabled"""
+    global _cache
+    if TTS_CACHE_MAX_BYTES <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AudioCache()
+                logger.info(f"TTS audio cache ready at {_cache.directory}: {_cache.stats()}")
+    return _cache
+
+
+# -------- PRE-RENDERED AUDIO --------
+def prerender_dir(voice):
+    return os.path.join(PRERENDER_DIR, f"{PRERENDER_VERSION}-{voice}")
+
+
+def load_manifest(voice):
+    """Return {key: filename} from the voice's manifest, reloading it when the file changes"""
+    manifest_path = os.path.join(prerender_dir(voice), "manifest.json")
+    try:
+        mtime = os.path.getmtime(manifest_path)
+    except FileNotFoundError:
+        return {}
+    cached = _manifests.get(voice)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            entries = {key: entry["file"] for key, entry in json.load(f)["entries"].items()}
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Error reading audio manifest {manifest_path}: {e}")
+        entries = {}
+    _manifests[voice] = (mtime, entries)
+    return entries
+
+
+def find_prerendered(voice, text):
+    """Return the path of pre-rendered audio for (voice, text), or None if it was never rendered"""
+    filename = load_manifest(voice).get(AudioCache.key(voice, text))
+    if filename is None:
+        return None
+    path = os.path.join(prerender_dir(voice), filename)
+    return path if os.path.exists(path) else None
+
+
+def static_relpath(path):
+    """Path of an audio file relative to static/, for building /static/... URLs"""
+    return os.path.relpath(path, "static").replace(os.sep, "/")
@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+import audio_cache
+import audio_stream
+import tts_backends
+from lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# AUDIO_BACKGROUND=1 returns answers before their audio exists: audio_url points at
+# /audio/<key>, which serves the file once the background job has written it.
+# At most AUDIO_WORKERS syntheses run at once; past AUDIO_QUEUE_SIZE pending jobs
+# requests fall back to synthesizing inline. Needs the TTS cache (the job output).
+AUDIO_BACKGROUND = os.environ.get("AUDIO_BACKGROUND", "0") == "1"
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", 8))
+AUDIO_QUEUE_SIZE = int(os.environ.get("AUDIO_QUEUE_SIZE", 256))
+AUDIO_WAIT_TIMEOUT = float(os.environ.get("AUDIO_WAIT_TIMEOUT", 30))
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+class AudioJobs:
+    """Background TTS jobs run on a private event loop thread, deduplicated by cache key"""
+
+    def __init__(self, cache, workers=AUDIO_WORKERS, queue_size=AUDIO_QUEUE_SIZE):
+        self.cache = cache
+        self.workers = workers
+        self.queue_size = queue_size
+        self._jobs = {}  # key -> concurrent.futures.Future resolving to the cached path
+        self._failed = LRUCache(1024, ttl=60)  # key -> exception, so pollers see the error
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._semaphore = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_loop(self):
+        if self._loop is not None and self._pid == os.getpid():
+            return
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="audio-jobs", daemon=True).start()
+        self._loop = loop
+        self._pid = os.getpid()
+        self._jobs = {}
+        self._semaphore = asyncio.Semaphore(self.workers)
+
+    def path_for_key(self, key):
+        return os.path.join(self.cache.directory, f"{self.cache.prefix}{key}.mp3")
+
+    async def _run(self, text, voice):
+        async with self._semaphore:
+            return await tts_backends.get_backend().fetch(self.cache, text, voice)
+
+    def _done(self, key, future):
+        with self._lock:
+            self._jobs.pop(key, None)
+            if future.exception() is not None:
+                self.failed += 1
+                self._failed.put(key, future.exception())
+                logger.error(f"Background synthesis {key[:12]} failed: {future.exception()}")
+            else:
+                self.completed += 1
+                self._failed.pop(key)  # a retry succeeded; pollers must not see the old error
+
+    def submit(self, text, voice):
+        """Queue synthesis of (voice, text); return its key, or None when the queue is full"""
+        key = self.cache.key(tts_backends.get_backend().cache_voice(voice), text)
+        with self._lock:
+            self._ensure_loop()
+            if key in self._jobs:
+                return key
+            if len(self._jobs) >= self.workers + self.queue_size:
+                self.rejected += 1
+                return None
+            future = asyncio.run_coroutine_threadsafe(self._run(text, voice), self._loop)
+            self._jobs[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._done(key, f))
+        return key
+
+    def _finished(self, key):
+        """(path, None) when the audio is on disk, (None, error) for a failed job, else (None, None)"""
+        path = self.path_for_key(key)
+        if os.path.exists(path):  # written by a later attempt, possibly in another worker
+            return path, None
+        return None, self._failed.get(key)
+
+    def wait(self, key, timeout=AUDIO_WAIT_TIMEOUT):
+        """Block until the audio for key is ready and return its path, or None on timeout.
+
+        Keys unknown to this process (submitted by another worker) are polled on disk.
+        """
+        future = self._jobs.get(key)
+        if future is not None:
+            try:
+                return future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                return None
+        deadline = time.monotonic() + timeout
+        while True:
+            path, error = self._finished(key)
+            if error is not None:
+                raise error
+            if path is not None or time.monotonic() >= deadline:
+                return path
+            time.sleep(0.05)
+
+    async def wait_async(self, key, timeout=AUDIO_WAIT_TIMEOUT):
+        """wait() for callers already running on an event loop"""
+        future = self._jobs.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                return None
+        deadline = time.monotonic() + timeout
+        while True:
+            path, error = self._finished(key)
+            if error is not None:
+                raise error
+            if path is not None or time.monotonic() >= deadline:
+                return path
+            await asyncio.sleep(0.05)
+
+    def is_pending(self, key):
+        return key in self._jobs
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._jobs),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+            }
+
+
+def get_jobs():
+    """Return the process-wide job runner, or None when background audio is off or uncached"""
+    global _jobs
+    if not AUDIO_BACKGROUND:
+        return None
+    cache = audio_cache.get_cache()
+    if cache is None:
+        return None
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = AudioJobs(cache)
+    return _jobs
+
+
+def submit(text, voice):
+    """Return (audio_url, final audio path) without waiting for synthesis, or None to synthesize inline.
+
+    Pre-rendered and cached audio get their /static URL straight away. Anything else
+    gets a /stream/<key> URL in AUDIO_STREAMING mode, or is queued and gets /audio/<key>.
+    """
+    if not (AUDIO_BACKGROUND or audio_stream.AUDIO_STREAMING):
+        return None
+    cache = audio_cache.get_cache()
+    if cache is None:
+        return None
+    cache_voice = tts_backends.get_backend().cache_voice(voice)
+    path = audio_cache.find_prerendered(voice, text) or cache.get(cache_voice, text)
+    if path is not None:
+        return f"/static/{audio_cache.static_relpath(path)}", path
+    if audio_stream.AUDIO_STREAMING:
+        return audio_stream.register(text, voice)
+    jobs = get_jobs()
+    key = jobs.submit(text, voice)
+    if key is None:
+        return None
+    return f"/audio/{key}", jobs.path_for_key(key)
+
+
+def stats():
+    jobs = get_jobs()
+    return jobs.stats() if jobs is not None else None
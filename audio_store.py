@@ -0,0 +1,167 @@
+import os
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Per-request audio that doesn't go through the TTS cache (the cache is disabled, or the
+# clip is one-off). Files get uuid names, are renamed into place atomically, and a
+# background sweep evicts them by age and total size. Workers sharing the directory
+# coordinate the sweep with a lock file and adopt each other's files on rescan.
+AUDIO_STORE_DIR = os.environ.get("AUDIO_STORE_DIR", "static")
+AUDIO_STORE_PREFIX = "response_"
+AUDIO_STORE_MAX_BYTES = int(os.environ.get("AUDIO_STORE_MAX_BYTES", 64 * 1024 * 1024))
+AUDIO_STORE_MAX_AGE = float(os.environ.get("AUDIO_STORE_MAX_AGE", 3600))
+AUDIO_STORE_MIN_AGE = float(os.environ.get("AUDIO_STORE_MIN_AGE", 60))  # never evict before clients can fetch
+AUDIO_STORE_SWEEP_INTERVAL = float(os.environ.get("AUDIO_STORE_SWEEP_INTERVAL", 60))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class AudioStore:
+    """Directory of uniquely named response clips with an in-memory size index and timed eviction"""
+
+    def __init__(self, directory=AUDIO_STORE_DIR, prefix=AUDIO_STORE_PREFIX, max_bytes=AUDIO_STORE_MAX_BYTES,
+                 max_age=AUDIO_STORE_MAX_AGE, min_age=AUDIO_STORE_MIN_AGE, sweep_interval=AUDIO_STORE_SWEEP_INTERVAL):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_age = min_age
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # filename -> (created, size), oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.saved = 0
+        self.evicted = 0
+        self.sweeps = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._rescan()
+
+    def new_path(self):
+        """Collision-free path for a new clip (uuid4, unique across threads, workers and hosts)"""
+        return os.path.join(self.directory, f"{self.prefix}{uuid.uuid4().hex}.mp3")
+
+    def _add(self, name, created, size):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, (0, 0))[1]
+            self._entries[name] = (created, size)
+            self._total_bytes += size
+
+    async def save(self, synthesize):
+        """Run `await synthesize(tmp_path)`, rename the result into place and return its path"""
+        self._ensure_sweeper()
+        path = self.new_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            await synthesize(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._add(os.path.basename(path), time.time(), os.path.getsize(path))
+        self.saved += 1
+        return path
+
+    def _rescan(self):
+        """Rebuild the index from disk, picking up clips written by other workers"""
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(self.prefix) and entry.name.endswith(".mp3"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, entry.name, st.st_size))
+        entries = OrderedDict((name, (mtime, size)) for mtime, name, size in sorted(files))
+        with self._lock:
+            self._entries = entries
+            self._total_bytes = sum(size for _, size in entries.values())
+
+    def _evict(self):
+        now = time.time()
+        victims = []
+        with self._lock:
+            total = self._total_bytes
+            for name, (created, size) in self._entries.items():
+                age = now - created
+                if age < self.min_age:
+                    break
+                if age <= self.max_age and total <= self.max_bytes:
+                    break
+                victims.append(name)
+                total -= size
+            for name in victims:
+                self._total_bytes -= self._entries.pop(name)[1]
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self.evicted += 1
+            except FileNotFoundError:
+                pass  # another worker's sweep got there first
+        return len(victims)
+
+    def sweep(self):
+        """Rescan and evict; skipped when another worker is already sweeping the directory"""
+        with open(os.path.join(self.directory, ".audio_store.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                self._rescan()
+                removed = self._evict()
+                self.sweeps += 1
+                return removed
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ensure_sweeper(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run_sweeper, name="audio-store-sweep", daemon=True)
+                self._thread.start()
+
+    def _run_sweeper(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Audio store evicted {removed} files from {self.directory}")
+            except Exception as e:
+                logger.error(f"Error sweeping audio store {self.directory}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "saved": self.saved,
+                "evicted": self.evicted,
+                "sweeps": self.sweeps,
+            }
+
+
+def get_store():
+    """Return the process-wide audio store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AudioStore()
+    _store._ensure_sweeper()
+    return _store
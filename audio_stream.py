@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+
+import audio_cache
+import tts_backends
+
+logger = logging.getLogger(__name__)
+
+# AUDIO_STREAMING=1 points audio_url at /stream/<key>, which sends MP3 chunks to the
+# client as the TTS backend produces them and tees them into the TTS cache. The text behind
+# a key is parked in STREAM_PENDING_DIR so any gunicorn worker can serve the stream.
+AUDIO_STREAMING = os.environ.get("AUDIO_STREAMING", "0") == "1"
+STREAM_PENDING_DIR = os.environ.get("STREAM_PENDING_DIR", "tts_pending")
+STREAM_PENDING_TTL = float(os.environ.get("STREAM_PENDING_TTL", 3600))
+STREAM_READ_BYTES = 16 * 1024
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def _pending_path(key):
+    return os.path.join(STREAM_PENDING_DIR, f"{key}.json")
+
+
+def _sweep_pending():
+    """Drop parked texts nobody streamed within STREAM_PENDING_TTL (at most every few minutes)"""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now - _last_sweep < 300:
+            return
+        _last_sweep = now
+    for name in os.listdir(STREAM_PENDING_DIR):
+        path = os.path.join(STREAM_PENDING_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STREAM_PENDING_TTL:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def register(text, voice):
+    """Park (voice, text) for streaming and return (audio_url, final cache path)"""
+    cache = audio_cache.get_cache()
+    cache_voice = tts_backends.get_backend().cache_voice(voice)
+    key = cache.key(cache_voice, text)
+    os.makedirs(STREAM_PENDING_DIR, exist_ok=True)
+    path = _pending_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"voice": voice, "text": text}, f)
+    os.replace(tmp_path, path)
+    _sweep_pending()
+    return f"/stream/{key}", cache.path_for(cache_voice, text)
+
+
+async def _read_file(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(STREAM_READ_BYTES)
+            if not block:
+                return
+            yield block
+
+
+async def _tee(cache, key, voice, text, backend):
+    # A failover backend may answer with its fallback engine, cached under that engine's key
+    cache_voice, chunks = await backend.open_stream(text, voice)
+    tmp_path = f"{cache.path_for(cache_voice, text)}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        cache.put(cache_voice, text, tmp_path)
+        if cache.key(cache_voice, text) == key:
+            try:
+                os.remove(_pending_path(key))
+            except FileNotFoundError:
+                pass
+    finally:
+        # Client went away or synthesis failed: never publish a truncated file
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def open_stream(key, backend=None):
+    """Async iterator of MP3 bytes for key, or None if the key is unknown.
+
+    Cached audio is read from disk; otherwise the TTS backend's stream is passed
+    through to the caller and into the cache.
+    """
+    cache = audio_cache.get_cache()
+    if cache is None or not audio_cache.valid_key(key):
+        return None
+    path = os.path.join(cache.directory, f"{cache.prefix}{key}.mp3")
+    if os.path.exists(path):
+        return _read_file(path)
+    try:
+        with open(_pending_path(key), "r", encoding="utf-8") as f:
+            pending = json.load(f)
+    except (OSError, ValueError):
+        # Another stream may have finished it between the two checks
+        return _read_file(path) if os.path.exists(path) else None
+    return _tee(cache, key, pending["voice"], pending["text"], backend or tts_backends.get_backend())
+
+
+def iter_sync(chunks):
+    """Drive an async chunk iterator from a synchronous (Flask) response generator"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(chunks.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(chunks.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
@@ -0,0 +1,194 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Concurrent encode calls arriving within BATCH_MAX_WAIT_MS of the first one (up to
+# BATCH_MAX_SIZE texts) are run as one model call; a call arriving alone at an idle
+# worker runs immediately. ENCODE_BATCHING=0 disables it.
+ENCODE_BATCHING = os.environ.get("ENCODE_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+
+_batchers = []
+_batchers_lock = threading.Lock()
+
+
+class _Pending:
+    __slots__ = ("items", "future", "enqueued")
+
+    def __init__(self, items):
+        self.items = items
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """Collects concurrent calls into one batched call made on a background worker thread.
+
+    `process_batch(items) -> results` receives the concatenated items of every request
+    in the batch and must return one result per item, in order.
+    """
+
+    def __init__(self, process_batch, name, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.process_batch = process_batch
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._idle_since = 0.0  # when the worker last finished a batch
+        self._last_calls = 1  # calls in the previous batch
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+        self._waits = deque(maxlen=10000)
+        with _batchers_lock:
+            _batchers.append(self)
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so (re)start lazily in whichever process submits
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, items):
+        """Queue items and block until their results are ready"""
+        self._ensure_worker()
+        pending = _Pending(list(items))
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        size = len(first.items)
+        # Wait for company only under load: when this call queued up behind a running batch
+        # or the previous batch had several calls, and only until as many calls as last time
+        # have arrived. A call arriving alone at an idle worker runs at once.
+        if first.enqueued < self._idle_since or self._last_calls > 1:
+            target = max(self._last_calls, 2)
+        else:
+            target = 1
+        deadline = max(first.enqueued, self._idle_since) + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.perf_counter()
+                if len(batch) >= target or timeout <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            batch.append(pending)
+            size += len(pending.items)
+        self._last_calls = len(batch)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self.items += size
+                self.batch_sizes[size] += 1
+                self._waits.extend(started - p.enqueued for p in batch)
+            try:
+                results = self.process_batch([item for p in batch for item in p.items])
+            except Exception as e:
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+            finally:
+                self._idle_since = time.perf_counter()
+            offset = 0
+            for p in batch:
+                p.future.set_result(results[offset:offset + len(p.items)])
+                offset += len(p.items)
+
+    def stats(self):
+        with self._stats_lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "queue_wait_ms_p50": float(np.percentile(waits, 50)),
+                "queue_wait_ms_p99": float(np.percentile(waits, 99)),
+                "queue_wait_ms_max": float(waits.max()),
+            }
+
+
+class BatchingEncoder:
+    """Drop-in wrapper for a SentenceTransformer whose small encode() calls are micro-batched.
+
+    Large corpus encodes and tensor outputs go straight to the model; everything else
+    is grouped by its encode keyword arguments and batched across request threads.
+    """
+
+    def __init__(self, model, name, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        return getattr(self.model, attr)
+
+    def _batcher(self, kwargs):
+        key = tuple(sorted(kwargs.items()))
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            with self._lock:
+                batcher = self._batchers.get(key)
+                if batcher is None:
+                    def encode_batch(texts):
+                        return list(self.model.encode(texts, **kwargs))
+                    batcher = MicroBatcher(encode_batch, f"{self.name}{dict(kwargs) or ''}",
+                                           self.max_batch_size, self.max_wait_ms)
+                    self._batchers[key] = batcher
+        return batcher
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if kwargs.get("convert_to_tensor") or not texts or len(texts) > self.max_batch_size:
+            return self.model.encode(sentences, **kwargs)
+        kwargs.pop("show_progress_bar", None)
+        try:
+            batcher = self._batcher(kwargs)
+        except TypeError:  # unhashable kwargs can't key a batcher
+            return self.model.encode(sentences, **kwargs)
+        rows = batcher.submit(texts)
+        return rows[0] if single else np.stack(rows)
+
+
+def wrap_encoder(model, name):
+    """Return model wrapped in a BatchingEncoder, or unchanged when ENCODE_BATCHING is off"""
+    return BatchingEncoder(model, name) if ENCODE_BATCHING else model
+
+
+def all_stats():
+    with _batchers_lock:
+        return {b.name: b.stats() for b in _batchers}
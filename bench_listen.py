@@ -0,0 +1,113 @@
+"""Time to transcript for /listen: incremental VAD transcription vs a fixed 7 s recording.
+
+Usage:
+    python bench_listen.py                          # synthetic speech-like bursts, simulated Whisper
+    python bench_listen.py --wav question.wav       # a real recording (16-bit PCM WAV)
+    python bench_listen.py --wav question.wav --model base   # real Whisper transcription
+
+The audio is fed to speech_input in real time, as a client streaming from its
+microphone would, and the script reports how long after the end of speech the
+transcript was ready. The old endpoint recorded 7 s and only then transcribed.
+"""
+import io
+import time
+import wave
+import argparse
+
+import numpy as np
+
+import speech_input
+
+SAMPLE_RATE = speech_input.SAMPLE_RATE
+CHUNK_MS = 100
+FIXED_RECORDING_SECONDS = 7
+
+
+def synthetic_speech(pattern=(0.4, 1.2, 0.5, 0.9, 0.5, 1.4)):
+    """Alternating silence/voiced bursts (seconds), voiced parts as modulated harmonics"""
+    rng = np.random.default_rng(0)
+    parts = []
+    for i, seconds in enumerate(pattern):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        if i % 2:
+            voiced = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6))
+            parts.append(0.2 * voiced * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)))
+        else:
+            parts.append(0.002 * rng.standard_normal(len(t)))
+    return np.concatenate(parts).astype(np.float32)
+
+
+def speech_end_seconds(samples):
+    """Last instant the VAD would call voiced, as a reference for the end of speech"""
+    frame = SAMPLE_RATE * speech_input.LISTEN_FRAME_MS // 1000
+    energy = [np.mean(samples[i:i + frame] ** 2) for i in range(0, len(samples) - frame, frame)]
+    voiced = [i for i, e in enumerate(energy) if 10 * np.log10(e + 1e-10) > speech_input.LISTEN_VAD_DB]
+    return (voiced[-1] + 1) * frame / SAMPLE_RATE if voiced else 0.0
+
+
+def to_wav(samples):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def realtime_chunks(data, start):
+    """Yield the WAV in CHUNK_MS pieces no faster than real time (header first)"""
+    chunk_bytes = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    yield data[:44]
+    for n, offset in enumerate(range(44, len(data), chunk_bytes)):
+        delay = start + n * CHUNK_MS / 1000 - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield data[offset:offset + chunk_bytes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", help="16 kHz mono 16-bit WAV to replay (default: synthetic bursts)")
+    parser.add_argument("--model", help="Whisper model name; default simulates transcription")
+    parser.add_argument("--rtf", type=float, default=0.15, help="simulated transcription time per audio second")
+    args = parser.parse_args()
+
+    if args.wav:
+        with open(args.wav, "rb") as f:
+            data = f.read()
+        with wave.open(args.wav) as w:
+            samples = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768
+    else:
+        samples = synthetic_speech()
+        data = to_wav(np.concatenate([samples, np.zeros(5 * SAMPLE_RATE, dtype=np.float32)]))
+
+    if args.model:
+        import whisper
+        model = whisper.load_model(args.model)
+
+        def transcribe(segment, prompt):
+            return model.transcribe(segment, initial_prompt=prompt, fp16=False)["text"]
+        full_seconds = None
+    else:
+        def transcribe(segment, prompt):
+            time.sleep(len(segment) / SAMPLE_RATE * args.rtf)
+            return f"[{len(segment) / SAMPLE_RATE:.2f}s]"
+        full_seconds = FIXED_RECORDING_SECONDS * args.rtf
+
+    speech_end = speech_end_seconds(samples)
+    start = time.perf_counter()
+    text = speech_input.transcribe_stream(realtime_chunks(data, start), "audio/wav", transcribe)
+    elapsed = time.perf_counter() - start
+
+    print(f"transcript: {text!r}")
+    print(f"speech ended at {speech_end:.2f}s; transcript ready at {elapsed:.2f}s "
+          f"({elapsed - speech_end:.2f}s after the speaker stopped)")
+    if full_seconds is not None:
+        print(f"fixed {FIXED_RECORDING_SECONDS}s recording: transcript ready at "
+              f"{FIXED_RECORDING_SECONDS + full_seconds:.2f}s")
+    print(f"stats: {speech_input.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Memory per gunicorn worker with and without preload: PSS for 1, 4 and 16 workers.
+
+Usage:
+    python bench_preload.py --app guardrails:app
+    python bench_preload.py --app rag_flask_api:app --workers 1 4 16 --path /ask --payload '{"query": "hi"}'
+    python bench_preload.py --app guardrails:app --modes preload     # skip the per-worker-copy baseline
+
+For each worker count and mode, starts gunicorn with gunicorn.conf.py, waits until
+/ready answers 200, optionally sends --requests requests (so copy-on-write effects of
+real traffic show up), then reads /proc/<pid>/smaps_rollup of the master and every
+worker. PSS splits shared pages evenly between the processes mapping them, so the
+total is the real memory footprint; USS is what a process holds alone.
+"""
+import os
+import json
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+
+
+def memory_kb(pid):
+    """{"pss": kB, "uss": kB, "rss": kB} from smaps_rollup"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "rss": fields.get("Rss", 0),
+    }
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def get(url, timeout=5):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def post(url, payload, timeout=60):
+    request = urllib.request.Request(url, data=payload.encode("utf-8"), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as resp:
+        resp.read()
+
+
+def wait_ready(base, proc, workers, timeout):
+    """Every worker forked and /ready answering 200 several times in a row (requests land on different workers)"""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < 3 * workers or len(children(proc.pid)) < workers:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"not ready after {timeout}s")
+        streak = streak + 1 if get(f"{base}/ready") == 200 else 0
+        if not streak:
+            time.sleep(1)
+    return len(children(proc.pid))
+
+
+def run(args, workers, mode):
+    port = args.port
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, GUNICORN_PRELOAD="1" if mode == "preload" else "0")
+    command = ["gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers), "-b", f"127.0.0.1:{port}", args.app]
+    start = time.monotonic()
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        spawned = wait_ready(base, proc, workers, args.timeout)
+        ready_s = time.monotonic() - start
+        for _ in range(args.requests):
+            post(base + args.path, args.payload)
+        time.sleep(1)
+        master = memory_kb(proc.pid)
+        worker_mem = [memory_kb(pid) for pid in children(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+    total_pss = master["pss"] + sum(m["pss"] for m in worker_mem)
+    n = max(1, len(worker_mem))
+    return {
+        "workers": spawned,
+        "mode": mode,
+        "ready_s": ready_s,
+        "total_pss_mb": total_pss / 1024,
+        "worker_pss_mb": sum(m["pss"] for m in worker_mem) / n / 1024,
+        "worker_uss_mb": sum(m["uss"] for m in worker_mem) / n / 1024,
+        "worker_rss_mb": sum(m["rss"] for m in worker_mem) / n / 1024,
+        "master_pss_mb": master["pss"] / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="guardrails:app")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--modes", nargs="+", default=["preload", "per-worker"], choices=["preload", "per-worker"])
+    parser.add_argument("--path", default="/recommend")
+    parser.add_argument("--payload", default=json.dumps({"backstory": "Someone keeps stealing my mail.",
+                                                         "location": "Dallas, Texas"}))
+    parser.add_argument("--requests", type=int, default=0, help="requests to send before measuring")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--timeout", type=float, default=900, help="seconds to wait for /ready")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'mode':<11} {'ready s':>8} {'total PSS':>10} {'PSS/worker':>11} "
+          f"{'USS/worker':>11} {'RSS/worker':>11} {'master PSS':>11}  (MB)")
+    for workers in args.workers:
+        for mode in args.modes:
+            try:
+                r = run(args, workers, mode)
+            except Exception as e:
+                print(f"{workers:>7} {mode:<11} failed: {e}")
+                continue
+            print(f"{r['workers']:>7} {r['mode']:<11} {r['ready_s']:8.1f} {r['total_pss_mb']:10.0f} "
+                  f"{r['worker_pss_mb']:11.0f} {r['worker_uss_mb']:11.0f} {r['worker_rss_mb']:11.0f} "
+                  f"{r['master_pss_mb']:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
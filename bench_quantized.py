@@ -0,0 +1,157 @@
+"""ONNX / int8 inference backends vs fp32 PyTorch: output parity, latency and throughput.
+
+Usage:
+    python bench_quantized.py                              # every serving model, onnx and onnx-int8
+    python bench_quantized.py --models minilm cross --backends onnx-int8 --check
+
+Parity is measured against the torch backend on the same texts:
+    encoders      cosine(torch, candidate) per text: mean and minimum
+    cross-encoder max |score delta|, and how often the top-ranked passage per query agrees
+    classifiers   top-label agreement and max |probability delta|
+Latency is one text per call (p50/p95); throughput encodes all texts in batches of 32.
+With --check the script exits 1 when a backend falls below --min-cosine / --min-agreement.
+"""
+import time
+import argparse
+
+import numpy as np
+
+import inference_backends
+from messages import WELCOME_MESSAGE, GUARDRAIL_REFUSAL_MESSAGE
+
+TEXTS = [
+    "hi pie, how are you today?",
+    "What can you help me with?",
+    "Can you find out who scratched my car last night?",
+    "My sister has been missing for two days and no one knows her whereabouts.",
+    "Someone keeps stealing my mail. I want to catch them.",
+    "I think someone is using my identity. Can you find out who?",
+    "I suspect my spouse of cheating after seeing strange messages on their phone.",
+    "I need to serve legal papers but the person has moved and left no forwarding address.",
+    "Our warehouse was set ablaze under suspicious circumstances and the insurer is stalling.",
+    "I feel so sad and lonely since my dog ran away, I can't stop crying.",
+    "This is outrageous, the contractor took my money and disappeared!",
+    "Thank you so much, that was really helpful and I feel much better now.",
+    "Can you recommend a good pizza place in Denver?",
+    "I want to verify someone's criminal record before hiring them as a nanny.",
+    WELCOME_MESSAGE,
+    GUARDRAIL_REFUSAL_MESSAGE,
+]
+
+PASSAGES = [
+    "User: someone scratched my car\nAI: A private investigator can review nearby cameras and canvass witnesses.",
+    "User: my sister is missing\nAI: Missing person cases start with last known location, phone and bank activity.",
+    "User: who is stealing my mail\nAI: Surveillance of the mailbox and a marked decoy package usually identify the thief.",
+    "User: identity theft\nAI: We trace new accounts and credit inquiries back to where they were opened.",
+    "User: hello\nAI: Hi! I'm Pie, how can I help you today?",
+    "User: cheating spouse\nAI: Discreet surveillance and phone record analysis can confirm or rule out infidelity.",
+]
+
+MODELS = {
+    "minilm": ("sentence", "all-MiniLM-L12-v2", {}),
+    "e5": ("sentence", "intfloat/e5-large-v2", {}),
+    "cross": ("cross", "cross-encoder/ms-marco-MiniLM-L-6-v2", {}),
+    "sentiment": ("classifier", "distilbert/distilbert-base-uncased-finetuned-sst-2-english",
+                  {"task": "sentiment-analysis", "revision": "714eb0f"}),
+    "emotion": ("classifier", "bhadresh-savani/distilbert-base-uncased-emotion",
+                {"task": "text-classification", "return_all_scores": True}),
+}
+
+
+def load(kind, name, options, backend):
+    if kind == "sentence":
+        return inference_backends.load_sentence_encoder(name, backend)
+    if kind == "cross":
+        return inference_backends.load_cross_encoder(name, backend)
+    kwargs = {k: v for k, v in options.items() if k != "task"}
+    kwargs["return_all_scores"] = True  # parity compares every label's probability
+    return inference_backends.load_text_classifier(options["task"], name, backend, **kwargs)
+
+
+def pairs():
+    return [[q, p] for q in TEXTS[:6] for p in PASSAGES]
+
+
+def outputs(kind, model):
+    """Model outputs on the benchmark inputs, as arrays"""
+    if kind == "sentence":
+        return np.asarray(model.encode(TEXTS, normalize_embeddings=True), dtype=np.float32)
+    if kind == "cross":
+        return np.asarray(model.predict(pairs()), dtype=np.float32).reshape(-1)
+    results = model(TEXTS)
+    return np.array([[s["score"] for s in sorted(r, key=lambda s: s["label"])] for r in results], dtype=np.float32)
+
+
+def parity(kind, reference, candidate):
+    """(metric label, value used by --check, description)"""
+    if kind == "sentence":
+        cosines = np.sum(reference * candidate, axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+        return "cosine", float(cosines.min()), f"cos mean {cosines.mean():.5f} min {cosines.min():.5f}"
+    if kind == "cross":
+        groups = len(PASSAGES)
+        agree = np.mean(reference.reshape(-1, groups).argmax(1) == candidate.reshape(-1, groups).argmax(1))
+        delta = np.abs(reference - candidate).max()
+        return "agreement", float(agree), f"top-1 agree {agree:.0%}, max |d| {delta:.4f}"
+    agree = np.mean(reference.argmax(1) == candidate.argmax(1))
+    delta = np.abs(reference - candidate).max()
+    return "agreement", float(agree), f"label agree {agree:.0%}, max |dp| {delta:.4f}"
+
+
+def timing(kind, model, runs):
+    """(p50 ms, p95 ms) for single inputs, texts/s for the batched run"""
+    if kind == "sentence":
+        single, batch = (lambda i: model.encode([TEXTS[i % len(TEXTS)]])), (lambda: model.encode(TEXTS * 4))
+        n = len(TEXTS) * 4
+    elif kind == "cross":
+        single, batch = (lambda i: model.predict([pairs()[i % len(pairs())]])), (lambda: model.predict(pairs()))
+        n = len(pairs())
+    else:
+        single, batch = (lambda i: model(TEXTS[i % len(TEXTS)])), (lambda: model(TEXTS * 4))
+        n = len(TEXTS) * 4
+    single(0)
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        single(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    batch()
+    throughput = n / (time.perf_counter() - start)
+    return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95)), throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=["onnx", "onnx-int8"])
+    parser.add_argument("--runs", type=int, default=50, help="single-input calls for the latency percentiles")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any backend misses the parity thresholds")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    failed = []
+    print(f"{'model':<10} {'backend':<10} {'p50 ms':>7} {'p95 ms':>7} {'texts/s':>8}  parity vs torch")
+    for key in args.models:
+        kind, name, options = MODELS[key]
+        reference_model = load(kind, name, options, "torch")
+        reference = outputs(kind, reference_model)
+        p50, p95, tput = timing(kind, reference_model, args.runs)
+        print(f"{key:<10} {'torch':<10} {p50:7.2f} {p95:7.2f} {tput:8.1f}  (reference)")
+        del reference_model
+        for backend in args.backends:
+            model = load(kind, name, options, backend)
+            metric, value, description = parity(kind, reference, outputs(kind, model))
+            p50, p95, tput = timing(kind, model, args.runs)
+            print(f"{key:<10} {backend:<10} {p50:7.2f} {p95:7.2f} {tput:8.1f}  {description}")
+            threshold = args.min_cosine if metric == "cosine" else args.min_agreement
+            if value < threshold:
+                failed.append(f"{key}/{backend}: {metric} {value:.4f} < {threshold}")
+    if failed:
+        print("parity below threshold:\n  " + "\n  ".join(failed))
+    raise SystemExit(1 if args.check and failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Microbenchmark: util.pytorch_cos_sim per request vs the NumPy SimilarityIndex.
+
+Usage:
+    python bench_similarity.py [--sizes 130 1200 10000] [--dim 384] [--repeats 2000]
+
+Both paths start from a query vector as returned by model.encode and end with the
+best index plus the top-5 indices, like find_best_match and is_pi_related_semantic.
+The script checks that both paths pick the same rows before timing them.
+"""
+import time
+import argparse
+import numpy as np
+import torch
+from sentence_transformers import util
+
+from similarity import SimilarityIndex
+
+
+def torch_path(query, corpus_tensor):
+    query_tensor = torch.from_numpy(query).unsqueeze(0)
+    scores = util.pytorch_cos_sim(query_tensor, corpus_tensor).cpu().numpy().flatten()
+    return int(np.argmax(scores)), np.argsort(scores)[-5:][::-1]
+
+
+def numpy_path(query, index):
+    top_indices, _ = index.top_k(query, 5)
+    return int(top_indices[0]), top_indices
+
+
+def bench(fn, queries, *args):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q, *args)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[130, 1200, 10000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+
+    print(f"{'corpus':>8} {'torch us':>10} {'numpy us':>10} {'speedup':>8}")
+    for size in args.sizes:
+        corpus = rng.standard_normal((size, args.dim)).astype(np.float32)
+        queries = rng.standard_normal((args.repeats, args.dim)).astype(np.float32)
+        corpus_tensor = torch.from_numpy(corpus)
+        index = SimilarityIndex(corpus)
+
+        for q in queries[:50]:
+            best_t, top_t = torch_path(q, corpus_tensor)
+            best_n, top_n = numpy_path(q, index)
+            assert best_t == best_n and list(top_t) == list(top_n), "paths disagree"
+
+        torch_us = bench(torch_path, queries, corpus_tensor)
+        numpy_us = bench(numpy_path, queries, index)
+        print(f"{size:>8} {torch_us:>10.1f} {numpy_us:>10.1f} {torch_us / numpy_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
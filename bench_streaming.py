@@ -0,0 +1,71 @@
+"""Time to first audio byte: streamed /stream/<key> path vs waiting for the whole file.
+
+Usage:
+    python bench_streaming.py --stub --chunk-ms 40        # offline: stub TTS backend, a chunk every 40 ms
+    python bench_streaming.py                             # TTS_BACKEND (edge-tts by default)
+
+Runs audio_stream.open_stream() for a long guardrails-style reply against a scratch
+cache directory, reports time to first chunk and to completion, then checks that the
+bytes teed into the cache match what was streamed and that a second request is
+served from disk.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import audio_cache
+import audio_stream
+import tts_backends
+
+TEXT = (
+    "Based on your request, I can connect you with a private investigator located in Dallas Texas "
+    "who specializes in surveillance background checks and missing persons. "
+    "This private investigator can help you with issues related to a missing family member."
+)
+VOICE = "en-US-JennyNeural"
+
+
+async def consume(chunks):
+    start = time.perf_counter()
+    first = None
+    data = bytearray()
+    async for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+        data.extend(chunk)
+    return first, time.perf_counter() - start, bytes(data)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use the stub TTS backend instead of TTS_BACKEND")
+    parser.add_argument("--latency-ms", type=float, default=150, help="stub delay before the first chunk")
+    parser.add_argument("--chunk-ms", type=float, default=40, help="stub delay between chunks")
+    args = parser.parse_args()
+
+    if args.stub:
+        tts_backends._backend = tts_backends.StubTTSBackend(latency_ms=args.latency_ms, chunk_ms=args.chunk_ms)
+    backend = tts_backends.get_backend()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        audio_cache._cache = audio_cache.AudioCache(directory=os.path.join(scratch, "static"))
+        audio_stream.STREAM_PENDING_DIR = os.path.join(scratch, "pending")
+
+        url, path = audio_stream.register(TEXT, VOICE)
+        key = url.rsplit("/", 1)[1]
+        first, total, streamed = await consume(audio_stream.open_stream(key, backend))
+        print(f"streamed: first chunk {first * 1000:8.1f} ms, complete {total * 1000:8.1f} ms, {len(streamed)} bytes")
+
+        with open(path, "rb") as f:
+            teed = f.read()
+        print(f"cache file matches stream: {teed == streamed}")
+
+        first, total, cached = await consume(audio_stream.open_stream(key, backend))
+        print(f"cached:   first chunk {first * 1000:8.1f} ms, complete {total * 1000:8.1f} ms, "
+              f"identical: {cached == streamed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
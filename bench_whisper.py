@@ -0,0 +1,103 @@
+"""Whisper CPU configurations: load time, real-time factor and memory.
+
+Usage:
+    python bench_whisper.py --wav question.wav
+    python bench_whisper.py --wav question.wav --config openai:base --config faster:base:int8 --config faster:tiny:int8
+
+Each --config is backend:model[:compute_type] (see stt_backends) and runs in its own
+subprocess, so the reported RSS is that configuration alone: before loading, after
+loading, and the peak during transcription. Real-time factor is transcription time
+divided by audio duration (lower is better), over --runs runs after one warm-up.
+Without --wav the audio is synthetic (timing and memory only, the text is meaningless).
+"""
+import os
+import sys
+import json
+import time
+import wave
+import resource
+import argparse
+import subprocess
+
+DEFAULT_CONFIGS = ["openai:tiny", "openai:base", "faster:tiny:int8", "faster:base:int8"]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def load_audio(path):
+    import numpy as np
+    if path is None:
+        from bench_listen import synthetic_speech
+        return np.tile(synthetic_speech(), 2)
+    with wave.open(path) as w:
+        if w.getframerate() != 16000 or w.getnchannels() != 1 or w.getsampwidth() != 2:
+            raise SystemExit(f"{path}: expected 16 kHz mono 16-bit WAV")
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768
+
+
+def run_config(spec, wav, runs, threads):
+    """Measure one configuration in this process and return the results as a dict"""
+    audio = load_audio(wav)
+    import stt_backends
+    backend, model, *rest = spec.split(":")
+    kwargs = {"threads": threads}
+    if rest:
+        kwargs["compute_type"] = rest[0]
+    transcriber = stt_backends.create_transcriber(backend, model, **kwargs)
+
+    base_rss = rss_mb()
+    transcriber.load()
+    loaded_rss = rss_mb()
+    text = transcriber.transcribe(audio)  # warm-up
+    start = time.perf_counter()
+    for _ in range(runs):
+        transcriber.transcribe(audio)
+    elapsed = (time.perf_counter() - start) / runs
+    return {
+        "config": spec,
+        "load_s": transcriber.load_seconds,
+        "rtf": elapsed / (len(audio) / stt_backends.SAMPLE_RATE),
+        "base_mb": base_rss,
+        "model_mb": loaded_rss - base_rss,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "text": text,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", help="16 kHz mono 16-bit WAV with speech")
+    parser.add_argument("--config", action="append", help="backend:model[:compute_type], repeatable")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per model (0 = library default)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_config(args.worker, args.wav, args.runs, args.threads)))
+        return
+
+    audio_seconds = len(load_audio(args.wav)) / 16000
+    print(f"audio: {args.wav or 'synthetic'} ({audio_seconds:.1f}s), {args.runs} runs, threads={args.threads or 'default'}")
+    print(f"{'config':<20} {'load s':>7} {'RTF':>7} {'model MB':>9} {'peak MB':>8}  text")
+    for spec in args.config or DEFAULT_CONFIGS:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", spec, "--runs", str(args.runs),
+                   "--threads", str(args.threads)] + (["--wav", args.wav] if args.wav else [])
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+            print(f"{spec:<20} {error}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{r['config']:<20} {r['load_s']:7.2f} {r['rtf']:7.3f} {r['model_mb']:9.0f} {r['peak_mb']:8.0f}  "
+              f"{r['text'][:50]!r}")
+
+
+if __name__ == "__main__":
+    main()
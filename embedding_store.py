@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Encoded corpora are kept here, one directory per model name + revision
+EMBEDDING_STORE_DIR = os.environ.get("EMBEDDING_STORE_DIR", "embeddings")
+
+
+class EmbeddingStore:
+    """On-disk embedding matrix for one corpus, keyed by model name + revision + text hash.
+
+    Vectors are stored as a plain .npy file in corpus order and loaded memory-mapped,
+    so a restart with an unchanged corpus reads no vectors into private memory and
+    encodes nothing. Only texts that are new or changed are sent to the model.
+    """
+
+    def __init__(self, name, model_name, revision, directory=EMBEDDING_STORE_DIR):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{model_name}@{revision}")
+        self.name = name
+        self.directory = os.path.join(directory, slug)
+        # The manifest names the current version; a version's vectors and keys are never rewritten
+        self.manifest_path = os.path.join(self.directory, f"{name}.json")
+        self._version_file = re.compile(rf"^{re.escape(name)}\.([0-9a-f]{{16}})\.(npy|keys\.json)$")
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+    def _paths(self, version):
+        base = os.path.join(self.directory, f"{self.name}.{version}")
+        return f"{base}.npy", f"{base}.keys.json"
+
+    def load(self):
+        """Return (keys, memory-mapped vectors) for the stored corpus, or ([], None)"""
+        for retry in (True, False):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    vectors_path, keys_path = self._paths(json.load(f)["version"])
+                with open(keys_path, "r", encoding="utf-8") as f:
+                    keys = json.load(f)
+                # Copy-on-write mapping: pages stay shared with the page cache and other
+                # processes, but the array is writable so torch.from_numpy doesn't complain.
+                vectors = np.load(vectors_path, mmap_mode="c")
+                break
+            except FileNotFoundError:
+                # No store yet, or a concurrent save replaced the version just read from the manifest
+                if not (retry and os.path.exists(self.manifest_path)):
+                    return [], None
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable embedding store {self.manifest_path}: {e}")
+                return [], None
+        if vectors.ndim != 2 or len(keys) != vectors.shape[0]:
+            logger.warning(f"Embedding store {self.manifest_path} is inconsistent, re-encoding")
+            return [], None
+        return keys, vectors
+
+    def save(self, keys, vectors):
+        """Write the corpus as a new version, then switch the manifest to it with one rename"""
+        os.makedirs(self.directory, exist_ok=True)
+        version = hashlib.sha256("\n".join(keys).encode("ascii")).hexdigest()[:16]
+        vectors_path, keys_path = self._paths(version)
+        suffix = f".{os.getpid()}.tmp"
+        with open(vectors_path + suffix, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(keys_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        with open(self.manifest_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"version": version}, f)
+        os.replace(vectors_path + suffix, vectors_path)
+        os.replace(keys_path + suffix, keys_path)
+        os.replace(self.manifest_path + suffix, self.manifest_path)
+        # Older versions are unreachable now; processes that mapped one keep their mapping
+        for entry in os.listdir(self.directory):
+            match = self._version_file.match(entry)
+            if match and match.group(1) != version:
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+
+    def encode(self, texts, encode_fn, convert_to_tensor=False, device=None):
+        """Return embeddings for texts in order, calling encode_fn only for unseen texts"""
+        keys = [self.text_key(t) for t in texts]
+        stored_keys, stored = self.load()
+
+        if stored is not None and stored_keys == keys:
+            vectors = stored
+        else:
+            position = {k: i for i, k in enumerate(stored_keys)}
+            missing = [i for i, k in enumerate(keys) if k not in position]
+            logger.info(f"Embedding store '{self.name}': {len(keys) - len(missing)} cached, {len(missing)} to encode")
+
+            encoded = None
+            if missing:
+                encoded = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            dim = encoded.shape[1] if encoded is not None else stored.shape[1] if stored is not None else 0
+
+            merged = np.empty((len(keys), dim), dtype=np.float32)
+            for i, k in enumerate(keys):
+                if k in position:
+                    merged[i] = stored[position[k]]
+            if missing:
+                merged[missing] = encoded
+
+            # Write in corpus order so the next start is a straight memory map
+            self.save(keys, merged)
+            _, vectors = self.load()
+            if vectors is None:
+                vectors = merged
+
+        if convert_to_tensor:
+            import torch
+            tensor = torch.from_numpy(vectors)
+            return tensor.to(device) if device is not None else tensor
+        return vectors
@@ -0,0 +1,101 @@
+"""Retrieval quality/latency harness for rag_flask_api's embedding modes and candidate counts.
+
+Usage:
+    python eval_retrieval.py [--qa eval.jsonl] [--modes legacy e5] [--ks 1 3 5 10] [--limit 500]
+
+Without --qa, every chunk's own user line is used as the query and the chunk as the
+expected answer. With --qa, each JSON line is {"query": ..., "answer": ...} and a
+retrieved chunk counts as correct when it contains the answer text.
+
+For each mode the script prints first-stage recall@k and mean search latency. It then
+prints cross-encoder top-1 accuracy and rerank latency for each candidate count, so
+RAG_TOP_K can be picked from measurements.
+"""
+import json
+import time
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+import rag_index
+import inference_backends
+import rag_flask_api
+from embedding_store import EmbeddingStore
+
+
+def load_eval_set(chunks, qa_path, limit):
+    if qa_path is None:
+        pairs = [(c.split("\n")[0].replace("User:", "").strip(), {i}) for i, c in enumerate(chunks)]
+    else:
+        pairs = []
+        with open(qa_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    relevant = {i for i, c in enumerate(chunks) if item["answer"] in c}
+                    pairs.append((item["query"], relevant))
+    pairs = [(q, rel) for q, rel in pairs if q and rel]
+    return pairs[:limit] if limit else pairs
+
+
+def evaluate_mode(mode, chunks, pairs, ks, cross_encoder):
+    embeddings = EmbeddingStore(f"rag_chunks_{mode}", rag_flask_api.BI_ENCODER_MODEL,
+                                rag_flask_api.bi_encoder_revision).encode(
+        chunks, lambda texts: rag_flask_api.encode_passages(texts, mode=mode, show_progress_bar=True)
+    )
+    index = rag_index.build_index(embeddings, mode="flat", metric=rag_flask_api.index_metric(mode))
+
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    search_times = []
+    candidates = []
+    for query, relevant in pairs:
+        start = time.perf_counter()
+        query_embedding = rag_flask_api.encode_queries([query], mode=mode)
+        _, ids = index.search(query_embedding, max_k)
+        search_times.append(time.perf_counter() - start)
+        ids = [int(i) for i in ids[0] if i >= 0]
+        candidates.append(ids)
+        for k in ks:
+            hits[k] += bool(relevant.intersection(ids[:k]))
+
+    print(f"\n[{mode}] first stage over {len(pairs)} queries, encode+search {np.mean(search_times) * 1000:.1f} ms/query")
+    for k in ks:
+        print(f"  recall@{k:<3} {hits[k] / len(pairs):.3f}")
+
+    print(f"  {'rerank k':>8} {'top-1 acc':>10} {'rerank ms':>10}")
+    for k in ks:
+        correct = 0
+        rerank_times = []
+        for (query, relevant), ids in zip(pairs, candidates):
+            start = time.perf_counter()
+            scores = cross_encoder.predict([[query, chunks[i]] for i in ids[:k]])
+            best = ids[int(np.argmax(scores))]
+            rerank_times.append(time.perf_counter() - start)
+            correct += best in relevant
+        print(f"  {k:>8} {correct / len(pairs):>10.3f} {np.mean(rerank_times) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=rag_flask_api.CORPUS_FILE)
+    parser.add_argument("--qa", default=None, help="JSONL of {query, answer} pairs")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "e5"])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--limit", type=int, default=500, help="max queries to evaluate (0 = all)")
+    args = parser.parse_args()
+
+    rag_flask_api.bi_encoder = SentenceTransformer(rag_flask_api.BI_ENCODER_MODEL)
+    rag_flask_api.bi_encoder_revision = inference_backends.model_revision(rag_flask_api.bi_encoder)
+    cross_encoder = CrossEncoder(rag_flask_api.CROSS_ENCODER_MODEL)
+
+    chunks = rag_flask_api.load_chunks(args.corpus)
+    pairs = load_eval_set(chunks, args.qa, args.limit)
+    print(f"{len(chunks)} chunks, {len(pairs)} evaluation queries")
+
+    for mode in args.modes:
+        evaluate_mode(mode, chunks, pairs, sorted(args.ks), cross_encoder)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,23 @@ from flask import Flask, request, jsonify
 import pandas as pd
 import numpy as np
 import asyncio
-import edge_tts
-from sentence_transformers import SentenceTransformer, util
 import os
-from transformers import pipeline
 from flask_cors import CORS
 import logging
-import time
+import audio_cache
+import audio_jobs
+import tts_backends
+import tts_segments
+import affect
+import batching
+import inference_backends
+import service_routes
+from embedding_store import EmbeddingStore
+from similarity import SimilarityIndex, StackedSimilarity, top_k
+from startup import Startup
+from messages import (
+    GUARDRAIL_WELCOME_MESSAGE, GUARDRAIL_REFUSAL_MESSAGE, SERVER_ERROR_MESSAGE, sentiment_message
+)
  
 # Disable tokenizers parallelism for consistent model behavior
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -20,29 +30,48 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
  
+# Models, dataset and sample embeddings load as parallel startup steps (see startup.py)
+SBERT_MODEL = 'all-MiniLM-L12-v2'
+SBERT_MODEL_TAG = inference_backends.model_tag(SBERT_MODEL)  # embedding cache key for the selected backend
+model = None
+sbert_revision = None  # version of the loaded weights; keys the embedding stores
+sentiment_analyzer = None
+data = None
+provider_index = None
+pi_sample_index = None
+context_index = None
+request_scorer = None
+startup = Startup("guardrails")
+
 # Load models
-try:
-    model = SentenceTransformer('all-MiniLM-L12-v2')
-    sentiment_pipeline = pipeline(
-        "sentiment-analysis",
-        model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
-        revision="714eb0f"
-    )
-except Exception as e:
-    logger.error(f"Error loading models: {e}")
-    raise RuntimeError("Failed to load models")
+@startup.step("sbert", warmup=lambda: model.encode(["warm up"]))
+def load_model():
+    global model, sbert_revision
+    model = batching.wrap_encoder(inference_backends.load_sentence_encoder(SBERT_MODEL), "guardrails")
+    sbert_revision = inference_backends.model_revision(model)
+
+@startup.step("sentiment", warmup=lambda: sentiment_analyzer.analyze("warm up"))
+def load_sentiment():
+    global sentiment_analyzer
+    sentiment_analyzer = affect.AffectAnalyzer(emotion=False)  # batched across request threads
  
 # Load dataset
 file_path = "/usr/local/bin/excel2.xlsx"
-try:
+
+@startup.step("data")
+def load_data():
+    global data
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Excel file not found at {file_path}")
     data = pd.read_excel(file_path)
     data['Combined_Text'] = data.apply(lambda row: f"{row['Backstory']} {row['User Location']}", axis=1)
-    provider_embeddings = model.encode(data['Combined_Text'].tolist(), convert_to_tensor=True)
-except Exception as e:
-    logger.error(f"Error loading dataset: {e}")
-    raise RuntimeError("Failed to load dataset")
+
+@startup.step("provider_index", after=("sbert", "data"))
+def load_provider_index():
+    global provider_index
+    provider_index = SimilarityIndex(EmbeddingStore("guardrails_providers", SBERT_MODEL_TAG, sbert_revision).encode(
+        data['Combined_Text'].tolist(), model.encode
+    ))
  
 # PI-related sample prompts (full list from original script)
 pi_samples = [
@@ -174,7 +203,12 @@ pi_samples = [
     "I want to reconnect with a childhood friend who vanished after high school.",
     "I need to serve legal papers but the person has moved and left no forwarding address.",
 ]
-pi_sample_embeddings = model.encode(pi_samples, convert_to_tensor=True)
+@startup.step("pi_sample_index", after=("sbert",))
+def load_pi_sample_index():
+    global pi_sample_index
+    pi_sample_index = SimilarityIndex(EmbeddingStore("guardrails_pi_samples", SBERT_MODEL_TAG, sbert_revision).encode(
+        pi_samples, model.encode
+    ))
  
 # PI context samples (including relevant missing person entry)
 pi_context_samples = [
@@ -196,22 +230,38 @@ pi_context_samples = [
 ]
 context_texts = [t for t, lbl in pi_context_samples]
 context_labels = [lbl for t, lbl in pi_context_samples]
-context_embeddings = model.encode(context_texts, convert_to_tensor=True)
+@startup.step("context_index", after=("sbert",))
+def load_context_index():
+    global context_index
+    context_index = SimilarityIndex(EmbeddingStore("guardrails_context", SBERT_MODEL_TAG, sbert_revision).encode(
+        context_texts, model.encode
+    ))
+
+# All three corpora in one matrix, so a request is scored with a single product
+@startup.step("request_scorer", after=("provider_index", "pi_sample_index", "context_index"),
+              warmup=lambda: analyze_request("warm up", "warm up"))
+def load_request_scorer():
+    global request_scorer
+    request_scorer = StackedSimilarity(pi_samples=pi_sample_index, context=context_index, providers=provider_index)
+
+def init_models_and_data():
+    """Load and warm up every model, dataset and index; logs the timing breakdown"""
+    try:
+        startup.run()
+    except Exception as e:
+        logger.error(f"Error loading models/dataset: {e}")
+        raise
  
 # Clean text helper
 def clean_text(text):
     return ''.join(e for e in str(text) if e.isalnum() or e.isspace())
  
 # Speak response using edge TTS
+VOICE = "en-US-JennyNeural"
+ 
 async def speak(text):
     try:
-        if not os.path.exists('static'):
-            os.makedirs('static')
-        filename = f"response_{int(time.time() * 1000)}.mp3"
-        path = os.path.join('static', filename)
-        tts = edge_tts.Communicate(text, "en-US-JennyNeural")
-        await tts.save(path)
-        return filename
+        return audio_cache.static_relpath(await tts_backends.synthesize(text, VOICE))
     except Exception as e:
         logger.error(f"Error generating audio: {e}")
         raise
@@ -225,27 +275,45 @@ def run_async(coro):
     finally:
         loop.close()
  
+# Audio URL for a reply: deferred to a background job in AUDIO_BACKGROUND mode
+def audio_url_for(text):
+    deferred = audio_jobs.submit(text, VOICE)
+    if deferred is not None:
+        return deferred[0]
+    return f"/static/{run_async(speak(text))}"
+ 
+# Encode a request once and score it against every corpus
+def analyze_request(backstory, location):
+    """Embed backstory and backstory+location in one batch, then score both with one stacked product"""
+    embeddings = model.encode([backstory, f"{backstory} {location}"])
+    scores = request_scorer.score(embeddings)
+    return {
+        "pi_scores": scores["pi_samples"][0],
+        "context_scores": scores["context"][0],
+        "provider_scores": scores["providers"][1],
+    }
+ 
 # Enhanced semantic guardrail check with debug logging
-def is_pi_related_semantic(text):
+def is_pi_related_semantic(text, pi_scores=None):
     try:
-        user_embedding = model.encode([text], convert_to_tensor=True)
-        similarity_scores = util.pytorch_cos_sim(user_embedding, pi_sample_embeddings).cpu().numpy().flatten()
-        max_score = np.max(similarity_scores)
-        top_indices = np.argsort(similarity_scores)[-5:][::-1]
+        if pi_scores is None:
+            pi_scores = pi_sample_index.scores(model.encode([text])[0])
+        top_indices, top_scores = top_k(pi_scores, 5)
+        max_score = top_scores[0]
         logger.info(f"Input: {text[:50]}...")
         logger.info(f"Max similarity score: {max_score}")
-        for idx in top_indices:
-            logger.info(f"Score: {similarity_scores[idx]}, Prompt: {pi_samples[idx]}")
+        for idx, score in zip(top_indices, top_scores):
+            logger.info(f"Score: {score}, Prompt: {pi_samples[idx]}")
         return max_score > 0.3  # Lowered threshold to ensure missing person cases pass
     except Exception as e:
         logger.error(f"Error in semantic check: {e}")
         return False
  
-def extract_context_label(backstory: str) -> str:
+def extract_context_label(backstory: str, context_scores=None) -> str:
     try:
-        user_emb = model.encode([backstory], convert_to_tensor=True)
-        sims = util.pytorch_cos_sim(user_emb, context_embeddings).squeeze().cpu().numpy()
-        best_idx = int(np.argmax(sims))
+        if context_scores is None:
+            context_scores = context_index.scores(model.encode([backstory])[0])
+        best_idx = int(np.argmax(context_scores))
         return context_labels[best_idx]
     except Exception as e:
         logger.error(f"Error extracting context label: {e}")
@@ -254,27 +322,30 @@ def extract_context_label(backstory: str) -> str:
 # Sentiment detection
 def get_sentiment(text):
     try:
-        result = sentiment_pipeline(text)[0]
+        result = sentiment_analyzer.analyze(text)["sentiment"]
         return result['label'], result['score']
     except Exception as e:
         logger.error(f"Error in sentiment analysis: {e}")
         return "UNKNOWN", 0.0
  
+# Opening of every provider-match reply; synthesized and cached as its own TTS segment
+PROVIDER_MATCH_PREFIX = "Based on your request, I can connect you with a private investigator"
+tts_segments.register_phrase(PROVIDER_MATCH_PREFIX)
+ 
 # Find best provider match
-def find_best_match(user_backstory, user_location):
+def find_best_match(user_backstory, user_location, analysis=None):
     try:
-        user_input = f"{user_backstory} {user_location}"
-        user_embedding = model.encode([user_input], convert_to_tensor=True)
-        similarity_scores = util.pytorch_cos_sim(user_embedding, provider_embeddings).cpu().numpy().flatten()
-        best_match_idx = np.argmax(similarity_scores)
+        if analysis is None:
+            analysis = analyze_request(user_backstory, user_location)
+        best_match_idx = int(np.argmax(analysis["provider_scores"]))
         best_provider = data.iloc[best_match_idx]
  
         specialties = clean_text(best_provider['Specialties'])
         location = clean_text(best_provider['Provider Location'])
-        context = extract_context_label(user_backstory)
+        context = extract_context_label(user_backstory, analysis["context_scores"])
  
         response_text = (
-            f"Based on your request, I can connect you with a private investigator "
+            f"{PROVIDER_MATCH_PREFIX} "
             f"located in {location} who specializes in {specialties}. "
             f"This private investigator can help you with issues related to {context}."
         )
@@ -302,46 +373,46 @@ def recommend():
         if not backstory or not location:
             return jsonify({"error": "Missing backstory or location fields"}), 400
  
+        analysis = analyze_request(backstory, location)
+ 
         # Guardrail check
-        if not is_pi_related_semantic(backstory):
-            error_msg = "Sorry, I can only assist with private investigation services."
-            audio_filename = run_async(speak(error_msg))
+        if not is_pi_related_semantic(backstory, analysis["pi_scores"]):
+            error_msg = GUARDRAIL_REFUSAL_MESSAGE
             return jsonify({
                 "error": error_msg,
-                "audio_url": f"/static/{audio_filename}"
+                "audio_url": audio_url_for(error_msg)
             }), 400
  
         # Sentiment analysis
         sentiment, _ = get_sentiment(backstory)
-        sentiment_msg = f"I understand you're feeling {sentiment.lower()}."
-        sentiment_audio = run_async(speak(sentiment_msg))
+        sentiment_msg = sentiment_message(sentiment)
+        sentiment_audio_url = audio_url_for(sentiment_msg)
  
         # Find best match
-        match_result = find_best_match(backstory, location)
-        audio_filename = run_async(speak(match_result["response"]))
+        match_result = find_best_match(backstory, location, analysis)
+        audio_url = audio_url_for(match_result["response"])
  
         return jsonify({
             "sentiment": sentiment_msg,
-            "sentiment_audio_url": f"/static/{sentiment_audio}",
+            "sentiment_audio_url": sentiment_audio_url,
             "response": match_result["response"],
             "specialties": match_result["specialties"],
             "provider_location": match_result["provider_location"],
             "context": match_result["context"],
-            "audio_url": f"/static/{audio_filename}"
+            "audio_url": audio_url
         }), 200
     except Exception as e:
         logger.error(f"Error in /recommend: {e}")
-        error_msg = "Internal server error"
-        audio_filename = run_async(speak(error_msg))
+        error_msg = SERVER_ERROR_MESSAGE
         return jsonify({
             "error": error_msg,
-            "audio_url": f"/static/{audio_filename}"
+            "audio_url": audio_url_for(error_msg)
         }), 500
  
 @app.route("/welcome", methods=["GET"])
 def welcome():
     try:
-        welcome_msg = "Welcome to My Spy! Hi, I am Pie. How can I help you today?"
+        welcome_msg = GUARDRAIL_WELCOME_MESSAGE
         audio_filename = run_async(speak(welcome_msg))
         return jsonify({
             "response": welcome_msg,
@@ -349,14 +420,17 @@ def welcome():
         }), 200
     except Exception as e:
         logger.error(f"Error in /welcome: {e}")
-        error_msg = "Internal server error"
+        error_msg = SERVER_ERROR_MESSAGE
         audio_filename = run_async(speak(error_msg))
         return jsonify({
             "error": error_msg,
             "audio_url": f"/static/{audio_filename}"
         }), 500
  
+app.register_blueprint(service_routes.create_blueprint(startup))
+ 
 if __name__ == "__main__":
+    init_models_and_data()
     if not os.path.exists('static'):
         os.makedirs('static')
     app.run(host="0.0.0.0", port=8003, debug=False)
\ No newline at end of file
@@ -1,45 +1,72 @@
+import os
 import sys
+import tempfile
 import pandas as pd
 import numpy as np
 import asyncio
-import edge_tts
-from sentence_transformers import SentenceTransformer, util
-from pydub import AudioSegment
-from pydub.playback import play
-from transformers import pipeline
 from flask import Flask, request, jsonify
 from flask_cors import CORS  # ✅ Import CORS
+from embedding_store import EmbeddingStore
+from similarity import SimilarityIndex, StackedSimilarity
+from startup import Startup
+import inference_backends
+import tts_backends
+from playback import BackgroundPlayer
 
 # ✅ Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # ✅ Enable CORS for all routes
+# Models, dataset and embeddings are loaded in parallel by init_models_and_data()
+startup = Startup("guardrails_test")
+
 # Load models
-model = SentenceTransformer('all-MiniLM-L12-v2')
+SBERT_MODEL = 'all-MiniLM-L12-v2'
+SBERT_MODEL_TAG = inference_backends.model_tag(SBERT_MODEL)  # embedding cache key for the selected backend
+
+@startup.step("sbert", warmup=lambda: model.encode(["warm up"]))
+def load_model():
+    global model, sbert_revision
+    model = inference_backends.load_sentence_encoder(SBERT_MODEL)
+    sbert_revision = inference_backends.model_revision(model)
 #sentiment_pipeline = pipeline("sentiment-analysis")
 
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
-    revision="714eb0f"
-)
+@startup.step("sentiment", warmup=lambda: sentiment_pipeline("warm up"))
+def load_sentiment():
+    global sentiment_pipeline
+    sentiment_pipeline = inference_backends.load_text_classifier(
+        "sentiment-analysis",
+        model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
+        revision="714eb0f"
+    )
 
 # Load dataset
 file_path = "/usr/local/bin/excel2.xlsx"
-data = pd.read_excel(file_path)
-data['Combined_Text'] = data.apply(lambda row: f"{row['Backstory']} {row['User Location']}", axis=1)
-provider_embeddings = model.encode(data['Combined_Text'].tolist(), convert_to_tensor=True)
+
+@startup.step("data")
+def load_data():
+    global data
+    data = pd.read_excel(file_path)
+    data['Combined_Text'] = data.apply(lambda row: f"{row['Backstory']} {row['User Location']}", axis=1)
+
+@startup.step("provider_index", after=("sbert", "data"))
+def load_provider_index():
+    global provider_index
+    provider_index = SimilarityIndex(EmbeddingStore("guardrails_test_providers", SBERT_MODEL_TAG, sbert_revision).encode(
+        data['Combined_Text'].tolist(), model.encode
+    ))
 
 # Clean text helper
 def clean_text(text):
     return ''.join(e for e in str(text) if e.isalnum() or e.isspace())
 
-# Speak response using edge TTS
+# Speak response using edge TTS; playback runs on a background thread so the next prompt isn't held up
+player = BackgroundPlayer()
+
 async def speak(text):
-    tts = edge_tts.Communicate(text, "en-US-JennyNeural")
-    filename = "response.mp3"
-    await tts.save(filename)
-    audio = AudioSegment.from_file(filename, format="mp3")
-    play(audio)
+    fd, filename = tempfile.mkstemp(prefix="response_", suffix=".mp3")
+    os.close(fd)
+    await tts_backends.get_backend().save(text, "en-US-JennyNeural", filename)
+    player.play(filename, delete=True)
 
 # PI-related sample prompts
 pi_samples= [
@@ -412,13 +439,18 @@ pi_samples= [
     "Our horse was sold under false pretenses—can you track down the seller?"
 ]
 
-pi_sample_embeddings = model.encode(pi_samples, convert_to_tensor=True)
+@startup.step("pi_sample_index", after=("sbert",))
+def load_pi_sample_index():
+    global pi_sample_index
+    pi_sample_index = SimilarityIndex(EmbeddingStore("guardrails_test_pi_samples", SBERT_MODEL_TAG, sbert_revision).encode(
+        pi_samples, model.encode
+    ))
 
 # Enhanced semantic guardrail check
-def is_pi_related_semantic(text):
-    user_embedding = model.encode([text], convert_to_tensor=True)
-    similarity_scores = util.pytorch_cos_sim(user_embedding, pi_sample_embeddings).cpu().numpy().flatten()
-    return np.max(similarity_scores) > 0.4  # threshold can be adjusted
+def is_pi_related_semantic(text, pi_scores=None):
+    if pi_scores is None:
+        pi_scores = pi_sample_index.scores(model.encode([text])[0])
+    return np.max(pi_scores) > 0.4  # threshold can be adjusted
 
 
 
@@ -1216,12 +1248,32 @@ pi_context_samples = [
 
 context_texts  = [t for t, lbl in pi_context_samples]
 context_labels = [lbl for t, lbl in pi_context_samples]
-context_embeddings = model.encode(context_texts, convert_to_tensor=True)
-
-def extract_context_label(backstory: str) -> str:
-    user_emb = model.encode([backstory], convert_to_tensor=True)
-    sims = util.pytorch_cos_sim(user_emb, context_embeddings).squeeze().cpu().numpy()
-    best_idx = int(np.argmax(sims))
+@startup.step("context_index", after=("sbert",))
+def load_context_index():
+    global context_index
+    context_index = SimilarityIndex(EmbeddingStore("guardrails_test_context", SBERT_MODEL_TAG, sbert_revision).encode(
+        context_texts, model.encode
+    ))
+
+# Backstory is encoded once and scored against PI samples and context labels together
+@startup.step("backstory_scorer", after=("pi_sample_index", "context_index"),
+              warmup=lambda: analyze_backstory("warm up"))
+def load_backstory_scorer():
+    global backstory_scorer
+    backstory_scorer = StackedSimilarity(pi_samples=pi_sample_index, context=context_index)
+
+def init_models_and_data():
+    startup.run()
+    print(startup.summary())
+
+def analyze_backstory(backstory):
+    scores = backstory_scorer.score(model.encode([backstory]))
+    return {"pi_scores": scores["pi_samples"][0], "context_scores": scores["context"][0]}
+
+def extract_context_label(backstory: str, context_scores=None) -> str:
+    if context_scores is None:
+        context_scores = context_index.scores(model.encode([backstory])[0])
+    best_idx = int(np.argmax(context_scores))
     return context_labels[best_idx]
 
 
@@ -1232,16 +1284,18 @@ def get_sentiment(text):
     return result['label'], result['score']
 
 # Find best provider match
-def find_best_match(user_backstory, user_location):
+def find_best_match(user_backstory, user_location, analysis=None):
+    # Only the location-dependent text needs a fresh encode
     user_input = f"{user_backstory} {user_location}"
-    user_embedding = model.encode([user_input], convert_to_tensor=True)
-    similarity_scores = util.pytorch_cos_sim(user_embedding, provider_embeddings).cpu().numpy().flatten()
-    best_match_idx = np.argmax(similarity_scores)
+    user_embedding = model.encode([user_input])[0]
+    best_match_idx, _ = provider_index.best(user_embedding)
     best_provider = data.iloc[best_match_idx]
 
     specialties = clean_text(best_provider['Specialties'])
     location    = clean_text(best_provider['Provider Location'])
-    context     = extract_context_label(backstory)
+    context     = extract_context_label(
+        user_backstory, analysis["context_scores"] if analysis is not None else None
+    )
 
     # 🔄 Updated courteous response (name removed)
     response_text = (
@@ -1260,19 +1314,22 @@ def find_best_match(user_backstory, user_location):
 
 # Guardrail logic with semantic detection
 def guardrail_ai(user_input):
-    if not is_pi_related_semantic(user_input):
+    analysis = analyze_backstory(user_input)
+    if not is_pi_related_semantic(user_input, analysis["pi_scores"]):
         warning = "Sorry, I can only assist with private investigation services. Good Bye."
         asyncio.run(speak(warning))
+        player.drain()
         sys.exit()
         return False
 
     sentiment, _ = get_sentiment(user_input)
     sentiment_msg = f"I understand you're feeling {sentiment.lower()}."
     asyncio.run(speak(sentiment_msg))
-    return True
+    return analysis
 
 # Main loop
 if __name__ == "__main__":
+    init_models_and_data()
     welcome = "Welcome to My Spy! Hi, I am Pie. How can I help you today?"
     asyncio.run(speak(welcome))
 
@@ -1281,18 +1338,21 @@ if __name__ == "__main__":
         if backstory.lower() in ["exit", "goodbye", "bye", "thank you"]:
             bye = "Good Bye! Hope My Spy was able to help you."
             asyncio.run(speak(bye))
+            player.drain()
             break
 
-        if not guardrail_ai(backstory):
+        analysis = guardrail_ai(backstory)
+        if not analysis:
             continue
 
         location = input("Enter your location: ").strip()
         if location.lower() in ["exit", "goodbye", "thank you"]:
             bye = "Good Bye! Hope My Spy was able to help you."
             asyncio.run(speak(bye))
+            player.drain()
             break
 
-        result = find_best_match(backstory, location)
+        result = find_best_match(backstory, location, analysis)
         print("\nBest Match Found:")
         for key, value in result.items():
             print(f"{key}: {value}")
@@ -0,0 +1,38 @@
+"""Multi-worker deployment: models load once in the master and are shared with the workers.
+
+    gunicorn guardrails:app                          # -b :8003, workers = cores
+    WEB_CONCURRENCY=16 gunicorn rag_flask_api:app -b :8002
+    SERVICE=rag gunicorn -k uvicorn.workers.UvicornWorker asgi_app:app
+    GUNICORN_PRELOAD=0 gunicorn SBERT:app            # every worker loads its own copy
+
+gunicorn picks this file up from the working directory; see preload.py for how the
+shared memory is kept shared.
+"""
+import os
+
+import preload
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))  # request threads per sync worker (they share encode batches)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = preload.GUNICORN_PRELOAD
+
+if preload_app:
+    preload.before_load()
+
+
+def when_ready(server):
+    # Master: the app module is imported; load and warm it before any worker is forked
+    if preload_app:
+        preload.preload(server.app.app_uri)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        preload.after_fork(server.cfg.workers)
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        preload.after_worker_init(worker.app.app_uri)
@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# INFERENCE_BACKEND selects how the encoders, the cross-encoder and the classification
+# pipelines run on CPU: torch (fp32 PyTorch, the default), onnx (the same weights
+# exported to ONNX Runtime) or onnx-int8 (dynamically quantized int8 weights and
+# matmuls). Exports are made once per model into ONNX_MODEL_DIR and reused, and
+# embedding caches are keyed by model_tag() so vectors from different backends never mix.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_models")
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", 0))  # 0 = one per core
+ONNX_OPSET = 14
+ONNX_BATCH_SIZE = 32
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+META_FILE = "meta.json"
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND {backend!r}; expected one of {list(BACKENDS)}")
+
+
+def model_tag(name, backend=INFERENCE_BACKEND):
+    """Model label for embedding stores and index fingerprints"""
+    return name if backend == "torch" else f"{name}+{backend}"
+
+
+# -------- EXPORT --------
+def export_dir(kind, name, revision=None, directory=ONNX_MODEL_DIR):
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{kind}-{name}@{revision or 'main'}"))
+
+
+@contextmanager
+def _export_lock(directory):
+    """Like rag_index.build_lock: one process exports while the others wait, then load its files"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _export_graph(model, tokenizer, path, sample, output_axes):
+    """Trace model(**inputs)[0] to ONNX with dynamic batch and sequence axes; returns the input names"""
+    import torch
+    encoded = tokenizer(*sample, padding=True, truncation=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in encoded]
+
+    class FirstOutput(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs)))[0]
+
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            FirstOutput(), tuple(encoded[n] for n in names), path, input_names=names, output_names=["output"],
+            dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in names}, "output": output_axes},
+            opset_version=ONNX_OPSET, do_constant_folding=True,
+        )
+    return names
+
+
+def _export_sentence(name, revision, directory):
+    from sentence_transformers import SentenceTransformer, models
+    st = SentenceTransformer(name, device="cpu")
+    transformer = st[0]
+    pooling = next(m for m in st if isinstance(m, models.Pooling))
+    transformer.tokenizer.save_pretrained(directory)
+    inputs = _export_graph(transformer.auto_model, transformer.tokenizer, os.path.join(directory, "model.onnx"),
+                           (["warm up", "an export sample"],), {0: "batch", 1: "sequence"})
+    return {
+        "inputs": inputs,
+        "max_length": st.max_seq_length,
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "max" if pooling.pooling_mode_max_tokens else "mean",
+        "normalize": any(isinstance(m, models.Normalize) for m in st),
+        "model_revision": model_revision(st),  # the exported weights' version, for embedding caches
+    }
+
+
+def _export_cross(name, revision, directory):
+    from sentence_transformers import CrossEncoder
+    ce = CrossEncoder(name, device="cpu")
+    ce.tokenizer.save_pretrained(directory)
+    inputs = _export_graph(ce.model, ce.tokenizer, os.path.join(directory, "model.onnx"),
+                           (["a query", "another query"], ["a passage", "another passage"]), {0: "batch"})
+    return {
+        "inputs": inputs,
+        "max_length": ce.max_length or ce.tokenizer.model_max_length,
+        "activation": "sigmoid" if type(ce.default_activation_function).__name__ == "Sigmoid" else "identity",
+    }
+
+
+def _export_classifier(name, revision, directory):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(name, revision=revision)
+    model = AutoModelForSequenceClassification.from_pretrained(name, revision=revision)
+    tokenizer.save_pretrained(directory)
+    inputs = _export_graph(model, tokenizer, os.path.join(directory, "model.onnx"),
+                           (["warm up", "an export sample"],), {0: "batch"})
+    config = model.config
+    return {
+        "inputs": inputs,
+        "max_length": min(tokenizer.model_max_length, 512),
+        "labels": [config.id2label[i] for i in range(config.num_labels)],
+        # What the text-classification pipeline applies to these logits
+        "activation": "sigmoid" if config.num_labels == 1 or config.problem_type == "multi_label_classification"
+        else "softmax",
+    }
+
+
+EXPORTERS = {
+    "sentence": _export_sentence,
+    "cross": _export_cross,
+    "classifier": _export_classifier,
+}
+
+
+def prepare(kind, name, revision=None):
+    """Export `name` (fp32 and int8) on first use; returns (directory, meta)"""
+    directory = export_dir(kind, name, revision)
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        with _export_lock(directory):
+            if not os.path.exists(meta_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                logger.info(f"Exporting {name} to ONNX in {directory}")
+                meta = EXPORTERS[kind](name, revision, directory)
+                quantize_dynamic(os.path.join(directory, "model.onnx"), os.path.join(directory, "model.int8.onnx"),
+                                 weight_type=QuantType.QInt8)
+                meta.update({"kind": kind, "name": name, "revision": revision})
+                with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(f"{meta_path}.tmp", meta_path)  # written last: marks the export complete
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return directory, json.load(f)
+
+
+# -------- RUNTIME --------
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class OnnxModel:
+    """Tokenizer + ONNX Runtime session for one exported model"""
+
+    def __init__(self, directory, meta, quantized=True):
+        from transformers import AutoTokenizer
+        self.meta = meta
+        self.path = os.path.join(directory, "model.int8.onnx" if quantized else "model.onnx")
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def session(self):
+        # ORT thread pools don't survive fork, so each process (e.g. preloaded gunicorn worker) opens its own
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    import onnxruntime as ort
+                    options = ort.SessionOptions()
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    if ONNX_THREADS:
+                        options.intra_op_num_threads = ONNX_THREADS
+                    self._session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+                    self._pid = os.getpid()
+        return self._session
+
+    def tokenize(self, *texts):
+        return self.tokenizer(*texts, padding=True, truncation=True, max_length=self.meta["max_length"],
+                              return_tensors="np")
+
+    def forward(self, encoded):
+        """First output for already tokenized inputs (models sharing a vocabulary can share one tokenization)"""
+        return self.session().run(None, {n: encoded[n].astype(np.int64) for n in self.meta["inputs"]})[0]
+
+    def run(self, *texts):
+        """(first output, attention mask) for a batch of texts or text pairs"""
+        encoded = self.tokenize(*texts)
+        return self.forward(encoded), encoded["attention_mask"]
+
+
+def _batches(texts, batch_size):
+    """Index batches over texts sorted longest first, so each batch pads little"""
+    order = np.argsort([-len(str(t)) for t in texts], kind="stable")
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+class OnnxSentenceEncoder:
+    """SentenceTransformer.encode() on ONNX Runtime: same tokenizer, pooling and normalization"""
+
+    def __init__(self, name, quantized=True):
+        self.onnx = OnnxModel(*prepare("sentence", name), quantized=quantized)
+        self.meta = self.onnx.meta
+
+    def _pool(self, hidden, mask):
+        if self.meta["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = mask[..., None].astype(hidden.dtype)
+        if self.meta["pooling"] == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=ONNX_BATCH_SIZE, convert_to_tensor=False, normalize_embeddings=False,
+               **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), 0), dtype=np.float32)
+        for idx in _batches(texts, batch_size):
+            hidden, mask = self.onnx.run([texts[i] for i in idx])
+            pooled = self._pool(hidden, mask).astype(np.float32)
+            if out.shape[1] == 0:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[idx] = pooled
+        if self.meta["normalize"] or normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        if convert_to_tensor:
+            import torch
+            out = torch.from_numpy(out)
+        return out[0] if single else out
+
+
+class OnnxCrossEncoder:
+    """CrossEncoder.predict() on ONNX Runtime"""
+
+    def __init__(self, name, quantized=True):
+        self.onnx = OnnxModel(*prepare("cross", name), quantized=quantized)
+
+    def predict(self, sentences, batch_size=ONNX_BATCH_SIZE, **kwargs):
+        single = isinstance(sentences[0], str)
+        pairs = [sentences] if single else list(sentences)
+        scores = None
+        for idx in _batches([a + b for a, b in pairs], batch_size):
+            logits, _ = self.onnx.run([pairs[i][0] for i in idx], [pairs[i][1] for i in idx])
+            if scores is None:
+                scores = np.empty((len(pairs),) + logits.shape[1:], dtype=np.float32)
+            scores[idx] = logits
+        if self.onnx.meta["activation"] == "sigmoid":
+            scores = _sigmoid(scores)
+        if scores.ndim == 2 and scores.shape[1] == 1:
+            scores = scores[:, 0]
+        return scores[0] if single else scores
+
+
+class OnnxTextClassifier:
+    """The text-classification pipeline call on ONNX Runtime: [{label, score}] or, with all scores, [[...]]"""
+
+    def __init__(self, name, revision=None, return_all_scores=False, quantized=True):
+        self.onnx = OnnxModel(*prepare("classifier", name, revision), quantized=quantized)
+        self.labels = self.onnx.meta["labels"]
+        self.return_all_scores = return_all_scores
+
+    def __call__(self, inputs, return_all_scores=None, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        all_scores = self.return_all_scores if return_all_scores is None else return_all_scores
+        probs = np.empty((len(texts), len(self.labels)), dtype=np.float32)
+        for idx in _batches(texts, ONNX_BATCH_SIZE):
+            logits, _ = self.onnx.run([texts[i] for i in idx])
+            probs[idx] = _sigmoid(logits) if self.onnx.meta["activation"] == "sigmoid" else _softmax(logits)
+        results = []
+        for row in probs:
+            if all_scores:
+                results.append([{"label": label, "score": float(p)} for label, p in zip(self.labels, row)])
+            else:
+                best = int(np.argmax(row))
+                results.append({"label": self.labels[best], "score": float(row[best])})
+        return results
+
+
+# -------- MODEL VERSION --------
+def _files_signature(directory):
+    """Digest of the names, sizes and mtimes of the files under directory (no file contents are read)"""
+    digest = hashlib.blake2b(digest_size=8)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            digest.update(f"{os.path.relpath(path, directory)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def model_revision(model):
+    """The version of a loaded sentence encoder's weights, for keying cached embeddings.
+
+    The hub commit when the config records one. sentence-transformers 2.2 loads hub
+    models from its own snapshot folder, whose config carries no commit hash, so those
+    are identified by a signature of the folder's files (re-downloading changes it).
+    """
+    model = getattr(model, "model", model)  # unwrap batching.BatchingEncoder
+    if isinstance(model, OnnxSentenceEncoder):
+        return model.meta.get("model_revision") or f"onnx-{_files_signature(os.path.dirname(model.onnx.path))}"
+    config = model[0].auto_model.config
+    commit = getattr(config, "_commit_hash", None)
+    if commit:
+        return commit
+    source = getattr(config, "_name_or_path", "")
+    if os.path.isdir(source):
+        return f"files-{_files_signature(source)}"
+    return "main"  # neither a hub commit nor local files to identify it by
+
+
+# -------- LOADERS --------
+def load_sentence_encoder(name, backend=INFERENCE_BACKEND):
+    _check_backend(backend)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return OnnxSentenceEncoder(name, quantized=backend == "onnx-int8")
+
+
+def load_cross_encoder(name, backend=INFERENCE_BACKEND):
+    _check_backend(backend)
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(name)
+    return OnnxCrossEncoder(name, quantized=backend == "onnx-int8")
+
+
+def load_text_classifier(task, model, backend=INFERENCE_BACKEND, **kwargs):
+    """transformers.pipeline(task, model=model, **kwargs), or its ONNX equivalent"""
+    _check_backend(backend)
+    if backend == "torch":
+        from transformers import pipeline
+        return pipeline(task, model=model, **kwargs)
+    return OnnxTextClassifier(model, revision=kwargs.get("revision"),
+                              return_all_scores=kwargs.get("return_all_scores", False),
+                              quantized=backend == "onnx-int8")
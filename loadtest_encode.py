@@ -0,0 +1,101 @@
+"""Encode throughput vs concurrency, with and without micro-batching.
+
+Usage:
+    python loadtest_encode.py [--model all-MiniLM-L12-v2] [--concurrency 1 2 4 8 16 32] [--requests 400]
+    python loadtest_encode.py --stub-ms 8     # no model: fake encoder costing 8 ms + 0.3 ms/text
+
+Each level starts N threads that together issue --requests single-sentence encodes,
+the way concurrent Flask request threads do. The script prints requests/s and
+latency percentiles for direct model.encode and for BatchingEncoder, plus the
+batcher's mean batch size and queue wait.
+"""
+import time
+import argparse
+import threading
+import numpy as np
+
+from batching import BatchingEncoder
+
+SENTENCES = [
+    "Can you find out who scratched my car last night?",
+    "I think someone is following me. Can you look into it?",
+    "My coworker is spreading rumors about me. I want to know why.",
+    "Someone keeps stealing my mail. I want to catch them.",
+    "hi pie, how are you today?",
+    "My sister has been missing for two days and no one knows her whereabouts.",
+]
+
+
+class StubEncoder:
+    """Fixed per-call overhead plus a small per-text cost, like a CPU transformer forward pass"""
+
+    def __init__(self, call_ms, per_text_ms=0.3, dim=384):
+        self.call_ms = call_ms
+        self.per_text_ms = per_text_ms
+        self.dim = dim
+        self._lock = threading.Lock()  # one forward pass at a time, like a saturated CPU
+
+    def encode(self, sentences, **kwargs):
+        texts = [sentences] if isinstance(sentences, str) else sentences
+        with self._lock:
+            time.sleep((self.call_ms + self.per_text_ms * len(texts)) / 1000)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        return out[0] if isinstance(sentences, str) else out
+
+
+def run_level(encoder, concurrency, total):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = max(1, total // concurrency)
+
+    def worker(offset):
+        local = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            encoder.encode([SENTENCES[(offset + i) % len(SENTENCES)]])
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="all-MiniLM-L12-v2")
+    parser.add_argument("--stub-ms", type=float, default=None, help="use a fake encoder instead of a model")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    if args.stub_ms is not None:
+        model = StubEncoder(args.stub_ms)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+    model.encode(SENTENCES)  # warm-up
+
+    print(f"{'conc':>5} {'mode':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6} {'wait p50':>9}")
+    for concurrency in args.concurrency:
+        rps, p50, p99 = run_level(model, concurrency, args.requests)
+        print(f"{concurrency:>5} {'direct':>8} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {'-':>6} {'-':>9}")
+
+        batched = BatchingEncoder(model, f"loadtest-{concurrency}", args.max_batch, args.max_wait_ms)
+        rps, p50, p99 = run_level(batched, concurrency, args.requests)
+        stats = next(iter(b.stats() for b in batched._batchers.values()))
+        print(f"{concurrency:>5} {'batched':>8} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} "
+              f"{stats['mean_batch_size']:>6.1f} {stats['queue_wait_ms_p50']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
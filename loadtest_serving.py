@@ -0,0 +1,93 @@
+"""Throughput and latency of the Flask (gunicorn) and ASGI serving modes under concurrent load.
+
+Usage:
+    # terminal 1: today's setup          terminal 2: the ASGI mode
+    gunicorn -w 2 --threads 8 -b :8000 Friendly_Final:app
+    SERVICE=friendly uvicorn asgi_app:app --port 9000 --workers 2
+
+    python loadtest_serving.py --target flask=http://localhost:8000 --target asgi=http://localhost:9000 \\
+        --path /ask --concurrency 1 8 32 64 --requests 400 --unique
+
+--unique appends a request counter to every query so it misses the exact
+response cache. Start both servers with RESPONSE_CACHE_SIZE=0 TTS_CACHE_MAX_BYTES=0
+to make every request pay a full edge-tts round-trip, which is the case the
+ASGI mode is meant for. TTS_BACKEND=stub TTS_STUB_LATENCY_MS=... replaces edge-tts
+with a fixed, offline delay, and TTS_STUB_LATENCY_MS=0 measures the retrieval path
+alone. For /recommend, use --payload with a backstory/location JSON body.
+"""
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import aiohttp
+
+DEFAULT_QUERIES = [
+    "hi pie, how are you today?",
+    "What can you help me with?",
+    "Can you find out who scratched my car last night?",
+    "Tell me something nice",
+]
+
+
+def build_payload(args, n):
+    if args.payload:
+        payload = json.loads(args.payload)
+    else:
+        payload = {"query": DEFAULT_QUERIES[n % len(DEFAULT_QUERIES)]}
+    if args.unique:
+        key = "query" if "query" in payload else "backstory"
+        payload[key] = f"{payload[key]} ({n})"
+    return payload
+
+
+async def run_level(session, url, args, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json=build_payload(args, n)) as resp:
+                    await resp.read()
+                    if resp.status >= 500:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(lat, 50), np.percentile(lat, 99), errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", action="append", required=True, help="label=base_url, repeatable")
+    parser.add_argument("--path", default="/ask")
+    parser.add_argument("--payload", default=None, help="JSON request body (default: rotating /ask queries)")
+    parser.add_argument("--unique", action="store_true", help="make every request text distinct")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    targets = [t.split("=", 1) for t in args.target]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        print(f"{'conc':>5} {'target':>10} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for concurrency in args.concurrency:
+            for label, base in targets:
+                url = base.rstrip("/") + args.path
+                rps, p50, p99, errors = await run_level(session, url, args, concurrency)
+                print(f"{concurrency:>5} {label:>10} {rps:>8.1f} {p50:>9.1f} {p99:>9.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
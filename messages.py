@@ -0,0 +1,20 @@
+# Fixed strings spoken by the services. Kept in one place so prerender_audio.py
+# renders exactly what the request handlers say.
+
+# -------- Friendly_Final / rag_flask_api --------
+WELCOME_MESSAGE = "Welcome to My Spy! Hi, I am Pie. I am your friend. How can I help you today?"
+GOODBYE_MESSAGE = "Goodbye! Hope My Spy was able to help you. Give Pie a genuine feedback about our conversations. Thank you!"
+EXIT_COMMANDS = ["exit", "goodbye", "bye", "thank you", "babye", "thankyou", "good bye"]
+MATCH_ERROR_MESSAGE = "I'm sorry, I couldn't process that request."
+RAG_FALLBACK_MESSAGE = "Let me help you."
+
+# -------- guardrails --------
+GUARDRAIL_WELCOME_MESSAGE = "Welcome to My Spy! Hi, I am Pie. How can I help you today?"
+GUARDRAIL_REFUSAL_MESSAGE = "Sorry, I can only assist with private investigation services."
+SERVER_ERROR_MESSAGE = "Internal server error"
+INVALID_QUERY_MESSAGE = "Invalid input"
+SENTIMENT_LABELS = ["POSITIVE", "NEGATIVE", "UNKNOWN"]
+
+
+def sentiment_message(label):
+    return f"I understand you're feeling {label.lower()}."
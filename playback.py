@@ -0,0 +1,50 @@
+import os
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Local speaker output for the CLI tools. The Flask/ASGI services are headless: they
+# only write audio for clients to fetch and never import this module or pydub.playback.
+# HEADLESS=1 makes the CLI headless too: clips are still synthesized but never decoded or played.
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
+
+
+class BackgroundPlayer:
+    """Plays MP3 files in order on a daemon thread, so the caller can go straight on"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def play(self, path, delete=False):
+        """Queue a file for playback; delete=True removes it once it has been played"""
+        if HEADLESS:
+            if delete and os.path.exists(path):
+                os.remove(path)
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audio-player", daemon=True)
+                self._thread.start()
+        self._queue.put((path, delete))
+
+    def drain(self):
+        """Block until everything queued so far has finished playing"""
+        self._queue.join()
+
+    def _run(self):
+        from pydub import AudioSegment
+        from pydub.playback import play
+        while True:
+            path, delete = self._queue.get()
+            try:
+                play(AudioSegment.from_file(path, format="mp3"))
+            except Exception as e:
+                logger.error(f"Error playing {path}: {e}")
+            finally:
+                if delete and os.path.exists(path):
+                    os.remove(path)
+                self._queue.task_done()
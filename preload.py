@@ -0,0 +1,83 @@
+"""Load a service once in the gunicorn master and share it copy-on-write with every worker.
+
+Used by gunicorn.conf.py. With GUNICORN_PRELOAD=1 (the default) the master imports the
+app, runs its startup (models, corpus matrices, warm-up) and then forks the workers,
+so each worker maps the same physical pages instead of loading its own copy:
+
+- torch weights and the embedding matrices are large, separate allocations that
+  inference only reads, so their pages are never copied;
+- the cyclic GC is off in the master and everything loaded is moved to the permanent
+  generation with gc.freeze(), so collections in the workers don't write GC headers
+  into millions of shared objects (the pattern the gc module documents for fork);
+- the master runs torch with one intra-op thread, so no OpenMP thread pool exists at
+  fork time (libgomp pools don't survive fork); each worker then gets its share of
+  the cores via torch.set_num_threads.
+
+Per-process machinery (encode batchers, audio job loops, store sweepers) already
+restarts lazily after fork.
+"""
+import gc
+import os
+import sys
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+GUNICORN_PRELOAD = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+WORKER_TORCH_THREADS = int(os.environ.get("WORKER_TORCH_THREADS", 0))  # 0 = cores / workers
+
+
+def app_module(app_uri):
+    """The service module behind a gunicorn app URI such as "guardrails:app" """
+    return importlib.import_module(app_uri.split(":", 1)[0])
+
+
+def set_torch_threads(n):
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(max(1, n))
+
+
+def load_service(module, block=True):
+    """Run the service's startup; block=False starts it in the background (readiness gates requests)"""
+    service = getattr(getattr(getattr(module, "app", None), "state", None), "service", None)
+    if service is not None:  # asgi_app (Flask apps have no .state)
+        if block:
+            service.load()
+        return  # otherwise the lifespan loads it in each worker
+    if not block:
+        module.startup.start()
+    elif hasattr(module, "init_models_and_index"):
+        module.init_models_and_index()
+    else:
+        module.init_models_and_data()
+
+
+def before_load():
+    """Master, before the app (and torch) is imported"""
+    gc.disable()
+    # Single-threaded torch in the master; set_num_threads in the workers overrides this
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+
+
+def preload(app_uri):
+    """Master, after the app is imported and before the first fork"""
+    set_torch_threads(1)
+    load_service(app_module(app_uri), block=True)
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded {app_uri}; {gc.get_freeze_count()} objects frozen for copy-on-write sharing")
+
+
+def after_fork(workers):
+    """Worker, right after fork"""
+    gc.enable()
+    set_torch_threads(WORKER_TORCH_THREADS or (os.cpu_count() or 1) // max(1, workers))
+
+
+def after_worker_init(app_uri):
+    """Worker without preload: start this worker's own (non-blocking) startup"""
+    gc.enable()
+    load_service(app_module(app_uri), block=False)
@@ -0,0 +1,141 @@
+"""Pre-render every response the services can speak into a versioned audio directory.
+
+Usage:
+    python prerender_audio.py [--jobs 8] [--skip-friendly] [--skip-rag]
+
+Each voice gets static/prerendered/<version>-<voice>/ with one MP3 per distinct
+text and a manifest.json mapping the content key to its file. speak() looks texts
+up in the manifest before touching the cache or edge-tts. Reruns only synthesize
+texts whose key is not already on disk, and drop files for texts that went away.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+
+import edge_tts
+
+import audio_cache
+from audio_cache import AudioCache
+from messages import (
+    WELCOME_MESSAGE, GOODBYE_MESSAGE, MATCH_ERROR_MESSAGE, RAG_FALLBACK_MESSAGE,
+    GUARDRAIL_WELCOME_MESSAGE, GUARDRAIL_REFUSAL_MESSAGE, SERVER_ERROR_MESSAGE,
+    SENTIMENT_LABELS, sentiment_message,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FRIENDLY_VOICE = "en-US-AvaNeural"
+GUARDRAIL_VOICE = "en-US-JennyNeural"
+
+
+# -------- COLLECT TEXTS --------
+def collect_texts(include_friendly=True, include_rag=True):
+    """Return {voice: set of texts} for everything the services can say"""
+    texts = {FRIENDLY_VOICE: set(), GUARDRAIL_VOICE: set()}
+
+    if include_friendly:
+        from Friendly_Final import load_conversation_data
+        _, responses = load_conversation_data()
+        texts[FRIENDLY_VOICE].update(responses)
+        texts[FRIENDLY_VOICE].update([WELCOME_MESSAGE, GOODBYE_MESSAGE, MATCH_ERROR_MESSAGE])
+
+    if include_rag:
+        from rag_flask_api import load_chunks, extract_ai_line
+        texts[FRIENDLY_VOICE].update(extract_ai_line(chunk) for chunk in load_chunks())
+        texts[FRIENDLY_VOICE].add(RAG_FALLBACK_MESSAGE)
+
+    # Provider-match replies in guardrails.py combine a provider row with a context
+    # label at request time; those are left to the runtime audio cache.
+    texts[GUARDRAIL_VOICE].update([GUARDRAIL_WELCOME_MESSAGE, GUARDRAIL_REFUSAL_MESSAGE, SERVER_ERROR_MESSAGE])
+    texts[GUARDRAIL_VOICE].update(sentiment_message(label) for label in SENTIMENT_LABELS)
+
+    return {voice: sorted(t for t in voice_texts if t and str(t).strip()) for voice, voice_texts in texts.items()}
+
+
+# -------- RENDER --------
+async def render_voice(voice, texts, jobs):
+    """Synthesize missing texts for one voice with at most `jobs` TTS calls in flight"""
+    out_dir = audio_cache.prerender_dir(voice)
+    os.makedirs(out_dir, exist_ok=True)
+
+    entries = {}
+    pending = []
+    for text in texts:
+        key = AudioCache.key(voice, text)
+        filename = f"{key}.mp3"
+        entries[key] = {"file": filename, "text": text}
+        if not os.path.exists(os.path.join(out_dir, filename)):
+            pending.append((text, filename))
+
+    semaphore = asyncio.Semaphore(jobs)
+    failures = []
+
+    async def render(text, filename):
+        path = os.path.join(out_dir, filename)
+        tmp_path = f"{path}.tmp"
+        async with semaphore:
+            try:
+                await edge_tts.Communicate(text, voice).save(tmp_path)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.error(f"Error rendering {text[:50]!r}: {e}")
+                failures.append(filename)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    logger.info(f"{voice}: {len(texts)} texts, {len(pending)} to render")
+    await asyncio.gather(*(render(text, filename) for text, filename in pending))
+
+    for filename in failures:
+        entries.pop(filename[:-len(".mp3")], None)
+
+    # Drop audio for texts that are no longer in the corpus
+    keep = {entry["file"] for entry in entries.values()}
+    for name in os.listdir(out_dir):
+        if name.endswith(".mp3") and name not in keep:
+            os.remove(os.path.join(out_dir, name))
+
+    manifest = {
+        "version": audio_cache.PRERENDER_VERSION,
+        "voice": voice,
+        "generated_at": int(time.time()),
+        "entries": entries,
+    }
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    return len(pending) - len(failures), len(failures)
+
+
+async def render_all(texts_by_voice, jobs):
+    totals = [0, 0]
+    for voice, texts in texts_by_voice.items():
+        rendered, failed = await render_voice(voice, texts, jobs)
+        totals[0] += rendered
+        totals[1] += failed
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=8, help="maximum concurrent TTS requests")
+    parser.add_argument("--skip-friendly", action="store_true", help="skip the Friendly_Final dataset")
+    parser.add_argument("--skip-rag", action="store_true", help="skip the rag_flask_api transcript corpus")
+    args = parser.parse_args()
+
+    texts_by_voice = collect_texts(include_friendly=not args.skip_friendly, include_rag=not args.skip_rag)
+    start = time.perf_counter()
+    rendered, failed = asyncio.run(render_all(texts_by_voice, args.jobs))
+    logger.info(f"Rendered {rendered} files ({failed} failed) in {time.perf_counter() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,62 @@
 import os
-import asyncio
 import numpy as np
 import faiss
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from pydub import AudioSegment
-from pydub.playback import play
-import edge_tts
+import audio_cache
+import tts_backends
+import batching
+import inference_backends
+import rag_index
+import service_routes
+from embedding_store import EmbeddingStore
+from startup import Startup
+from lru import LRUCache
+from response_cache import ResponseCache
+from messages import RAG_FALLBACK_MESSAGE, INVALID_QUERY_MESSAGE
 
 app = Flask(__name__, static_url_path='/static')
 CORS(app)
 
 # Globals
 bi_encoder = None
+bi_encoder_revision = None  # version of the loaded weights; keys the chunk embeddings and the index
 cross_encoder = None
-chunk_map = {}
+chunk_map = None  # rag_index.ChunkStore: chunk id -> chunk text
 index = None
+reranker = None  # batching.MicroBatcher over cross_encoder.predict
+
+VOICE = "en-US-AvaNeural"
 
 # -------- SPEAK FUNCTION --------
 async def speak(text):
-    tts = edge_tts.Communicate(text, "en-US-AvaNeural")
-    
-    # Ensure the static directory exists
-    if not os.path.exists('static'):
-        os.makedirs('static')
-    
-    filename = "response.mp3"
-    path = os.path.join('static', filename)
-    
-    await tts.save(path)
-    
-    audio = AudioSegment.from_file(path, format="mp3")
-    play(audio)  # Play audio immediately if needed
-    
-    return path  # Return the path to the audio file
-
-# -------- LOAD MODELS AND FAISS INDEX --------
-def init_models_and_index():
-    global bi_encoder, cross_encoder, chunk_map, index
-
-    print("📦 Loading models and creating index...")
-    bi_encoder = SentenceTransformer("intfloat/e5-large-v2")
-    cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-
-    with open("/usr/local/bin/Newdata_cleaned.txt", "r", encoding="utf-8") as f:
+    """Generate (or reuse) the audio file for text and return its path (never played server-side)"""
+    return await tts_backends.synthesize(text, VOICE)
+
+# -------- LOAD CORPUS --------
+CORPUS_FILE = "/usr/local/bin/Newdata_cleaned.txt"
+BI_ENCODER_MODEL = "intfloat/e5-large-v2"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+BI_ENCODER_TAG = inference_backends.model_tag(BI_ENCODER_MODEL)  # embedding cache / index key for the selected backend
+
+# "e5": query:/passage: prefixes, L2-normalized vectors, inner-product (cosine) search.
+# "legacy": the original unprefixed, unnormalized L2 search.
+RAG_EMBEDDING_MODE = os.environ.get("RAG_EMBEDDING_MODE", "e5")
+# Number of first-stage candidates handed to the cross-encoder (see eval_retrieval.py)
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", 10))
+# Cross-encoder pairs per batched predict call, and cached (query, chunk id) scores
+RERANK_BATCH_MAX_SIZE = int(os.environ.get("RERANK_BATCH_MAX_SIZE", 128))
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", 50000))
+
+rerank_cache = LRUCache(RERANK_CACHE_SIZE)
+
+# e5 cosine scores sit in a narrow band, so near-duplicates need a tighter distance than MiniLM
+RAG_RESPONSE_CACHE_MAX_DISTANCE = float(os.environ.get("RAG_RESPONSE_CACHE_MAX_DISTANCE", 0.02))
+response_cache = ResponseCache(max_distance=RAG_RESPONSE_CACHE_MAX_DISTANCE)
+
+def load_chunks(path=CORPUS_FILE):
+    """Split the transcript file into "User: ...\nAI: ..." chunks"""
+    with open(path, "r", encoding="utf-8") as f:
         lines = [line.strip() for line in f.readlines() if line.strip()]
 
     chunks = []
@@ -58,50 +70,156 @@ def init_models_and_index():
                 j += 1
             full_chunk = f"User: {user_query}\nAI: {' '.join(ai_response)}"
             chunks.append(full_chunk)
+    return chunks
+
+def extract_ai_line(chunk):
+    lines = chunk.split("\n")
+    return next((line.replace("AI:", "").strip() for line in lines if line.startswith("AI:")), RAG_FALLBACK_MESSAGE)
 
-    chunk_embeddings = bi_encoder.encode(chunks, convert_to_tensor=False, show_progress_bar=True)
-    chunk_embeddings = np.array(chunk_embeddings).astype("float32")
-    dimension = chunk_embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(chunk_embeddings)
-    chunk_map.update({i: chunks[i] for i in range(len(chunks))})
+# -------- EMBEDDINGS --------
+def encode_passages(texts, mode=RAG_EMBEDDING_MODE, show_progress_bar=False):
+    if mode == "e5":
+        texts = [f"passage: {t}" for t in texts]
+        return bi_encoder.encode(texts, normalize_embeddings=True, show_progress_bar=show_progress_bar)
+    return bi_encoder.encode(texts, convert_to_tensor=False, show_progress_bar=show_progress_bar)
+
+def encode_queries(queries, mode=RAG_EMBEDDING_MODE):
+    if mode == "e5":
+        queries = [f"query: {q}" for q in queries]
+        return bi_encoder.encode(queries, normalize_embeddings=True).astype("float32")
+    return bi_encoder.encode(queries, convert_to_tensor=False).astype("float32")
+
+def index_metric(mode=RAG_EMBEDDING_MODE):
+    return faiss.METRIC_INNER_PRODUCT if mode == "e5" else faiss.METRIC_L2
+
+# -------- LOAD MODELS AND FAISS INDEX --------
+startup = Startup("rag")
+
+# The saved index is keyed by the bi-encoder's weights, so it is looked up once they are loaded
+@startup.step("bi_encoder", warmup=lambda: encode_queries(["warm up"]))
+def load_bi_encoder():
+    global bi_encoder, bi_encoder_revision
+    bi_encoder = batching.wrap_encoder(inference_backends.load_sentence_encoder(BI_ENCODER_MODEL), "rag_bi_encoder")
+    bi_encoder_revision = inference_backends.model_revision(bi_encoder)
+
+@startup.step("cross_encoder", warmup=lambda: cross_encoder.predict([["warm up", "warm up"]]))
+def load_cross_encoder():
+    global cross_encoder, reranker
+    cross_encoder = inference_backends.load_cross_encoder(CROSS_ENCODER_MODEL)
+    if batching.ENCODE_BATCHING:
+        reranker = batching.MicroBatcher(
+            lambda pairs: list(cross_encoder.predict(pairs)), "rag_cross_encoder", max_batch_size=RERANK_BATCH_MAX_SIZE
+        )
+
+def index_fingerprint():
+    return rag_index.corpus_fingerprint(CORPUS_FILE, f"{BI_ENCODER_TAG}@{bi_encoder_revision}", RAG_EMBEDDING_MODE,
+                                        rag_index.index_signature())
+
+@startup.step("index", after=("bi_encoder",))
+def load_saved_index():
+    global index, chunk_map
+    loaded = rag_index.load_index(index_fingerprint())
+    if loaded is not None:
+        index, chunk_map = loaded
+
+@startup.step("index_build", after=("bi_encoder", "index"),
+              warmup=lambda: index.search(encode_queries(["warm up"]), RAG_TOP_K))
+def build_missing_index():
+    """Embed the corpus and build the index if no saved one matched (or another worker built it meanwhile)"""
+    global index, chunk_map
+    if index is not None:
+        return
+    fingerprint = index_fingerprint()
+    with rag_index.build_lock():
+        loaded = rag_index.load_index(fingerprint)
+        if loaded is None:
+            chunks = load_chunks()
+            chunk_embeddings = EmbeddingStore(f"rag_chunks_{RAG_EMBEDDING_MODE}", BI_ENCODER_TAG, bi_encoder_revision).encode(
+                chunks, lambda texts: encode_passages(texts, show_progress_bar=True)
+            )
+            built = rag_index.build_index(chunk_embeddings, metric=index_metric())
+            rag_index.save_index(fingerprint, built, chunks)
+            loaded = rag_index.load_index(fingerprint)
+    index, chunk_map = loaded
+
+def init_models_and_index():
+    print("📦 Loading models and creating index...")
+    startup.run()
+    print(startup.summary())
     print("✅ Model and index loaded.")
 
 # -------- RETRIEVE RESPONSE --------
-def retrieve_top_chunk(query):
-    query_embedding = bi_encoder.encode(query, convert_to_tensor=False).astype("float32")
-    D, I = index.search(np.array([query_embedding]), 10)
-    candidate_chunks = [chunk_map[i] for i in I[0]]
-    scores = cross_encoder.predict([[query, c] for c in candidate_chunks])
-    sorted_chunks = sorted(zip(candidate_chunks, scores), key=lambda x: x[1], reverse=True)
-    return sorted_chunks[0][0]
-
-def get_ai_response(user_input):
-    top_chunk = retrieve_top_chunk(user_input)
-    lines = top_chunk.split("\n")
-    ai_line = next((line.replace("AI:", "").strip() for line in lines if line.startswith("AI:")), "Let me help you.")
-    return ai_line
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def rerank_scores(query, chunk_ids, candidate_chunks):
+    """Cross-encoder scores for (query, chunk) pairs, from the score cache where possible"""
+    key = normalize_query(query)
+    scores = np.empty(len(chunk_ids), dtype=np.float32)
+    missing = []
+    for n, chunk_id in enumerate(chunk_ids):
+        cached = rerank_cache.get((key, chunk_id))
+        if cached is None:
+            missing.append(n)
+        else:
+            scores[n] = cached
+
+    if missing:
+        pairs = [[query, candidate_chunks[n]] for n in missing]
+        # Joins other request threads' pairs in one predict call when batching is on
+        predicted = reranker.submit(pairs) if reranker is not None else cross_encoder.predict(pairs)
+        for n, score in zip(missing, predicted):
+            scores[n] = score
+            rerank_cache.put((key, chunk_ids[n]), float(score))
+    return scores
+
+def retrieve_top_chunk(query, k=RAG_TOP_K, query_embedding=None):
+    if query_embedding is None:
+        query_embedding = encode_queries([query])
+    D, I = index.search(query_embedding, k)
+    chunk_ids = [int(i) for i in I[0] if i >= 0]
+    candidate_chunks = [chunk_map[i] for i in chunk_ids]
+    scores = rerank_scores(query, chunk_ids, candidate_chunks)
+    return candidate_chunks[int(np.argmax(scores))]
+
+def get_ai_response(user_input, query_embedding=None):
+    top_chunk = retrieve_top_chunk(user_input, query_embedding=query_embedding)
+    return extract_ai_line(top_chunk)
+
+def answer_query(query):
+    """Resolve a query to (response, cached audio path or None, remember(audio_path))"""
+    # Repeated or near-duplicate queries are answered from the response cache
+    return response_cache.answer(query, lambda: encode_queries([query]), get_ai_response)
 
 # -------- API ROUTE --------
 @app.route("/ask", methods=["POST"])
 def ask():
     data = request.get_json()
-    query = data.get("query", "")
+    query = data.get("query", "").strip()
 
     if not query:
-        return jsonify({"response": "Invalid input", "audio_url": ""}), 400
+        return jsonify({"error": INVALID_QUERY_MESSAGE, "audio_url": ""}), 400
 
-    response = get_ai_response(query)
+    response, audio_path, remember = answer_query(query)
 
     # Generate audio file (asynchronously)
-    audio_path = asyncio.run(speak(response))
+    if audio_path is None:
+        audio_url, audio_path = service_routes.answer_audio(response, VOICE, speak)
+        remember(audio_path)
+    else:
+        audio_url = f"/static/{audio_cache.static_relpath(audio_path)}"
 
     # Return text response + path to the audio file
     return jsonify({
         "response": response,
-        "audio_url": f"/static/{os.path.basename(audio_path)}"
+        "audio_url": audio_url
     })
 
+app.register_blueprint(service_routes.create_blueprint(startup, metrics=lambda: {
+    "rerank_cache": rerank_cache.stats(),
+    "response_cache": response_cache.stats(),
+}))
+
 # -------- STARTUP --------
 if __name__ == "__main__":
     init_models_and_index()  # Load once on startup
@@ -0,0 +1,191 @@
+import os
+import json
+import mmap
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# Built index + chunk texts for rag_flask_api, shared by every worker on the host
+RAG_INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "rag_index")
+
+# Index type used by build_index: flat | ivf | hnsw | ivfpq (see bench_ann_index.py for numbers)
+RAG_INDEX_MODE = os.environ.get("RAG_INDEX_MODE", "flat")
+RAG_IVF_NLIST = int(os.environ.get("RAG_IVF_NLIST", 0))  # 0 = derive from corpus size
+RAG_IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", 16))
+RAG_PQ_M = int(os.environ.get("RAG_PQ_M", 64))
+RAG_HNSW_M = int(os.environ.get("RAG_HNSW_M", 32))
+RAG_HNSW_EF_CONSTRUCTION = int(os.environ.get("RAG_HNSW_EF_CONSTRUCTION", 200))
+RAG_HNSW_EF_SEARCH = int(os.environ.get("RAG_HNSW_EF_SEARCH", 64))
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+META_FILE = "meta.json"
+
+
+class ChunkStore:
+    """Read-only chunk texts stored as one memory-mapped UTF-8 blob plus an offsets array.
+
+    Indexing works like the old chunk_map dict (chunk_store[i] -> str), but the texts
+    live in the page cache and are shared by all processes that open the same files.
+    """
+
+    def __init__(self, directory):
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, CHUNKS_FILE), "rb") as f:
+            # mmap can't map an empty file
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < len(self):
+            raise KeyError(i)
+        return self._blob[int(self._offsets[i]):int(self._offsets[i + 1])].decode("utf-8")
+
+    @staticmethod
+    def write(directory, chunks):
+        chunks_path = os.path.join(directory, CHUNKS_FILE)
+        offsets_path = os.path.join(directory, OFFSETS_FILE)
+        offsets = np.zeros(len(chunks) + 1, dtype=np.uint64)
+        with open(f"{chunks_path}.tmp", "wb") as f:
+            for i, chunk in enumerate(chunks):
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        with open(f"{offsets_path}.tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(f"{chunks_path}.tmp", chunks_path)
+        os.replace(f"{offsets_path}.tmp", offsets_path)
+
+
+# -------- INDEX FACTORY --------
+def index_signature(mode=RAG_INDEX_MODE):
+    """Build parameters that change the stored index, for inclusion in the corpus fingerprint"""
+    if mode == "ivf":
+        return f"ivf:{RAG_IVF_NLIST}"
+    if mode == "ivfpq":
+        return f"ivfpq:{RAG_IVF_NLIST}:{RAG_PQ_M}"
+    if mode == "hnsw":
+        return f"hnsw:{RAG_HNSW_M}:{RAG_HNSW_EF_CONSTRUCTION}"
+    return mode
+
+
+def default_nlist(n):
+    """About 4*sqrt(n) lists, keeping at least 39 training points per centroid as faiss recommends"""
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def _pq_subquantizers(d, m):
+    # PQ needs m to divide the dimension; step down to the nearest divisor
+    while d % m:
+        m -= 1
+    return m
+
+
+def build_index(embeddings, mode=RAG_INDEX_MODE, metric=faiss.METRIC_L2):
+    """Build and fill a faiss index of the given mode, training IVF/PQ on the corpus itself"""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, d = embeddings.shape
+
+    if mode in ("ivf", "ivfpq"):
+        nlist = RAG_IVF_NLIST or default_nlist(n)
+        if nlist < 2 or n < nlist:
+            logger.warning(f"Corpus of {n} vectors is too small for {mode}, using flat")
+            mode = "flat"
+        elif mode == "ivfpq" and n < 256:
+            logger.warning(f"Corpus of {n} vectors is too small to train PQ codebooks, using ivf")
+            mode = "ivf"
+
+    if mode == "flat":
+        index = faiss.IndexFlatL2(d) if metric == faiss.METRIC_L2 else faiss.IndexFlatIP(d)
+    elif mode == "hnsw":
+        index = faiss.IndexHNSWFlat(d, RAG_HNSW_M, metric)
+        index.hnsw.efConstruction = RAG_HNSW_EF_CONSTRUCTION
+    elif mode == "ivf":
+        quantizer = faiss.IndexFlat(d, metric)
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+    elif mode == "ivfpq":
+        quantizer = faiss.IndexFlat(d, metric)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, _pq_subquantizers(d, RAG_PQ_M), 8, metric)
+    else:
+        raise ValueError(f"Unknown index mode: {mode}")
+
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    configure_search(index)
+    return index
+
+
+def configure_search(index):
+    """Apply the search-time knobs (nprobe, efSearch) to a built or freshly loaded index"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(RAG_IVF_NPROBE, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = RAG_HNSW_EF_SEARCH
+    return index
+
+
+# -------- PERSISTENCE --------
+def corpus_fingerprint(corpus_path, *parts):
+    """Hash of the corpus file plus anything else the built index depends on (model, mode...)"""
+    digest = hashlib.sha256()
+    with open(corpus_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    for part in parts:
+        digest.update(f"\0{part}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+@contextmanager
+def build_lock(directory=RAG_INDEX_DIR):
+    """Exclusive lock so only one worker builds the index while the others wait and then load it"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_index(fingerprint, directory=RAG_INDEX_DIR):
+    """Return (faiss index, ChunkStore) if a build for this fingerprint is on disk, else None"""
+    try:
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("fingerprint") != fingerprint:
+        return None
+    # IO_FLAG_MMAP_IFC (newer faiss) maps flat codes as well; IO_FLAG_MMAP covers IVF lists
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+    return configure_search(index), ChunkStore(directory)
+
+
+def save_index(fingerprint, index, chunks, directory=RAG_INDEX_DIR):
+    """Write the index and chunk texts; meta.json is written last and marks the build complete"""
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    # Replace rather than overwrite: other workers may still have the old files mapped
+    index_path = os.path.join(directory, INDEX_FILE)
+    faiss.write_index(index, f"{index_path}.tmp")
+    os.replace(f"{index_path}.tmp", index_path)
+    ChunkStore.write(directory, chunks)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "ntotal": int(index.ntotal), "chunks": len(chunks)}, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    logger.info(f"Saved index with {index.ntotal} vectors to {directory}")
@@ -0,0 +1,130 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from lru import LRUCache
+
+# Finished /ask answers. Tier 1 matches normalized text exactly; tier 2 returns the
+# answer of a cached query whose embedding is within max_distance (cosine) of the new one.
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 4096))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_DISTANCE = float(os.environ.get("RESPONSE_CACHE_MAX_DISTANCE", 0.05))
+
+_punctuation = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace: "Hi!" and " hi " share a key"""
+    return " ".join(_punctuation.sub(" ", str(text).lower()).split())
+
+
+class ResponseCache:
+    """Two-tier answer cache: exact normalized-text lookup, then nearest cached query embedding"""
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, max_distance=RESPONSE_CACHE_MAX_DISTANCE):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.exact = LRUCache(maxsize, ttl)
+
+        # Semantic tier: fixed slots in one normalized matrix, recycled least-recently-used first
+        self._matrix = None
+        self._entries = [None] * maxsize
+        self._stored_at = np.zeros(maxsize)
+        self._filled = np.zeros(maxsize, dtype=bool)
+        self._order = OrderedDict()  # slot -> None, least recently used first
+        self._lock = threading.Lock()
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        q = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    def get_semantic(self, embedding):
+        q = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None or not self._filled.any():
+                return None
+            scores = self._matrix @ q
+            now = time.monotonic()
+            valid = self._filled & (now - self._stored_at <= self.ttl)
+            scores[~valid] = -np.inf
+            slot = int(np.argmax(scores))
+            if 1.0 - scores[slot] > self.max_distance:
+                return None
+            self._order.move_to_end(slot)
+            self.semantic_hits += 1
+            return self._entries[slot]
+
+    def lookup(self, text, embed):
+        """Return (entry or None, query embedding or None); embed() is only called on an exact miss"""
+        entry = self.exact.get(normalize_text(text))
+        if entry is not None:
+            return entry, None
+        embedding = embed()
+        entry = self.get_semantic(embedding)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+        return entry, embedding
+
+    def answer(self, text, embed, respond, never_cache=()):
+        """Resolve text to (response, cached audio path or None, remember).
+
+        respond(text, embedding) answers a miss. Without a cached audio path the caller
+        synthesizes the reply and calls remember(audio_path): a fresh answer is stored in
+        both tiers (unless it is one of never_cache), while a cached answer whose audio
+        file was evicted just has its entry pointed at the new file.
+        """
+        entry, embedding = self.lookup(text, embed)
+        if entry is not None:
+            if os.path.exists(entry["audio_path"]):
+                return entry["response"], entry["audio_path"], None
+
+            def relink(audio_path):
+                entry["audio_path"] = audio_path
+            return entry["response"], None, relink
+
+        response = respond(text, embedding)
+
+        def remember(audio_path):
+            if response not in never_cache:
+                self.put(text, embedding, {"response": response, "audio_path": audio_path})
+        return response, None, remember
+
+    def put(self, text, embedding, entry):
+        if self.maxsize <= 0:
+            return
+        self.exact.put(normalize_text(text), entry)
+        q = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.maxsize, q.shape[0]), dtype=np.float32)
+            if len(self._order) < self.maxsize:
+                slot = len(self._order)
+            else:
+                slot, _ = self._order.popitem(last=False)
+            self._matrix[slot] = q
+            self._entries[slot] = entry
+            self._stored_at[slot] = time.monotonic()
+            self._filled[slot] = True
+            self._order[slot] = None
+
+    def stats(self):
+        exact = self.exact.stats()
+        with self._lock:
+            lookups = exact["hits"] + self.semantic_hits + self.misses
+            return {
+                "exact_hits": exact["hits"],
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (exact["hits"] + self.semantic_hits) / lookups if lookups else 0.0,
+                "entries": len(self._order),
+                "max_distance": self.max_distance,
+            }
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+from flask import Blueprint, Response, jsonify, request, send_file
+
+import audio_cache
+import audio_jobs
+import audio_store
+import audio_stream
+import batching
+import tts_backends
+
+logger = logging.getLogger(__name__)
+
+
+def answer_audio(text, voice, speak):
+    """(audio_url, audio path): deferred to a background job in AUDIO_BACKGROUND mode, else speak(text) now"""
+    deferred = audio_jobs.submit(text, voice)
+    if deferred is not None:
+        return deferred
+    path = asyncio.run(speak(text))
+    return f"/static/{audio_cache.static_relpath(path)}", path
+
+
+def create_blueprint(startup, metrics=None, audio=True):
+    """Routes every Flask service shares, registered with app.register_blueprint().
+
+    Until `startup` (the service's startup.Startup) is ready, requests get 503 except
+    /ready and already rendered files under /static. /metrics reports the shared
+    batching, TTS and audio-store statistics plus whatever the service's `metrics()`
+    callable returns. With `audio`, also serves reply audio by key: /audio/<key>
+    (background synthesis) and /stream/<key> (streamed synthesis).
+    """
+    blueprint = Blueprint("service", __name__)
+
+    @blueprint.before_app_request
+    def require_ready():
+        """Hold off model-backed requests until startup has loaded and warmed everything"""
+        if not startup.ready and request.endpoint not in ("service.ready", "static"):
+            return jsonify({"error": "Service is starting up"}), 503, {"Retry-After": "5"}
+
+    @blueprint.route("/ready", methods=["GET"])
+    def ready():
+        """Readiness probe: 200 once every startup step is loaded and warm, else 503 with progress"""
+        return jsonify(startup.status()), 200 if startup.ready else 503
+
+    @blueprint.route("/metrics", methods=["GET"])
+    def metrics_report():
+        """Report encode batching and TTS cache statistics"""
+        cache = audio_cache.get_cache()
+        report = {
+            "batching": batching.all_stats(),
+            "tts_cache": cache.stats() if cache is not None else None,
+            "audio_jobs": audio_jobs.stats(),
+            "tts": tts_backends.stats(),
+            "audio_store": audio_store.get_store().stats(),
+        }
+        if metrics is not None:
+            report.update(metrics())
+        return jsonify(report)
+
+    if not audio:
+        return blueprint
+
+    @blueprint.route("/audio/<key>", methods=["GET"])
+    def audio_file(key):
+        """Serve background-synthesized audio, waiting for it if the job is still running"""
+        jobs = audio_jobs.get_jobs()
+        if jobs is None or not audio_cache.valid_key(key):
+            return jsonify({"error": "Unknown audio"}), 404
+        try:
+            wait = min(request.args.get("wait", audio_jobs.AUDIO_WAIT_TIMEOUT, type=float),
+                       audio_jobs.AUDIO_WAIT_TIMEOUT)
+            path = jobs.wait(key, wait)
+        except Exception as e:
+            logger.error(f"Error in /audio: {e}")
+            return jsonify({"error": str(e)}), 500
+        if path is None:
+            if jobs.is_pending(key):
+                return jsonify({"status": "pending"}), 202, {"Retry-After": "1"}
+            return jsonify({"error": "Unknown audio"}), 404
+        return send_file(path, mimetype="audio/mpeg")
+
+    @blueprint.route("/stream/<key>", methods=["GET"])
+    def stream(key):
+        """Stream reply audio as it is synthesized (cached replies are sent from disk)"""
+        chunks = audio_stream.open_stream(key)
+        if chunks is None:
+            return jsonify({"error": "Unknown audio"}), 404
+        return Response(audio_stream.iter_sync(chunks), mimetype="audio/mpeg")
+
+    return blueprint
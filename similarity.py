@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def _as_float32_matrix(embeddings):
+    if hasattr(embeddings, "detach"):  # torch tensor
+        embeddings = embeddings.detach().cpu().numpy()
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def normalize_rows(matrix):
+    """L2-normalize rows in a new contiguous float32 array (zero rows stay zero)"""
+    matrix = np.array(matrix, dtype=np.float32, copy=True, order="C")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class SimilarityIndex:
+    """Cosine similarity over a corpus kept as one pre-normalized, contiguous float32 matrix.
+
+    Gives the same scores as util.pytorch_cos_sim(query, corpus), but a query costs a
+    single matrix-vector product with no tensor allocation or device round-trip.
+    """
+
+    def __init__(self, embeddings):
+        matrix = _as_float32_matrix(embeddings)
+        if matrix.ndim != 2:
+            raise ValueError(f"Expected a 2-D embedding matrix, got shape {matrix.shape}")
+        norms = np.linalg.norm(matrix, axis=1)
+        if matrix.flags.c_contiguous and np.allclose(norms, 1.0, atol=1e-4):
+            # Already normalized (e.g. MiniLM with its Normalize layer): keep the memory map
+            self.matrix = matrix
+        else:
+            self.matrix = normalize_rows(matrix)
+        # Read-only, so workers forked after a preload keep sharing its pages (see preload.py)
+        self.matrix.setflags(write=False)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @staticmethod
+    def _normalize_query(query):
+        q = _as_float32_matrix(query).reshape(-1)
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    def scores(self, query):
+        """Cosine similarity of one query vector against every corpus row"""
+        return self.matrix @ self._normalize_query(query)
+
+    def best(self, query):
+        """(index, score) of the most similar corpus row"""
+        scores = self.scores(query)
+        idx = int(np.argmax(scores))
+        return idx, float(scores[idx])
+
+    def top_k(self, query, k):
+        """(indices, scores) of the k most similar rows, best first, via argpartition"""
+        return top_k(self.scores(query), k)
+
+
+def top_k(scores, k):
+    """Indices and values of the k largest scores, best first, without a full sort"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return idx, scores[idx]
+
+
+class StackedSimilarity:
+    """Several SimilarityIndex corpora stacked into one matrix, so one product scores them all"""
+
+    def __init__(self, **indexes):
+        self.slices = {}
+        start = 0
+        for name, index in indexes.items():
+            self.slices[name] = slice(start, start + len(index))
+            start += len(index)
+        self.matrix = np.ascontiguousarray(np.vstack([index.matrix for index in indexes.values()]))
+        self.matrix.setflags(write=False)
+
+    def score(self, queries):
+        """Cosine scores of each query row against every corpus: {name: (n_queries, corpus_size)}"""
+        q = _as_float32_matrix(queries)
+        if q.ndim == 1:
+            q = q[None, :]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = (q / norms) @ self.matrix.T
+        return {name: scores[:, sl] for name, sl in self.slices.items()}
@@ -0,0 +1,420 @@
+import os
+import time
+import queue
+import struct
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# /listen takes the user's speech as the request body: a WAV or raw 16-bit PCM upload
+# (Content-Type audio/wav or audio/L16;rate=..;channels=..), or a compressed stream such
+# as Ogg/WebM Opus decoded through ffmpeg. The body may be sent chunked while the user
+# speaks. An energy VAD cuts it into utterance segments at LISTEN_PAUSE_MS pauses, each
+# segment is transcribed as soon as it closes, and LISTEN_END_SILENCE_MS of silence
+# after speech ends the request without waiting for the rest of the body.
+SAMPLE_RATE = 16000  # what Whisper expects
+LISTEN_FRAME_MS = 30
+LISTEN_VAD_DB = float(os.environ.get("LISTEN_VAD_DB", -45))  # absolute floor for speech energy (dBFS)
+LISTEN_VAD_MARGIN_DB = float(os.environ.get("LISTEN_VAD_MARGIN_DB", 12))  # above the tracked noise floor
+LISTEN_PAUSE_MS = int(os.environ.get("LISTEN_PAUSE_MS", 400))
+LISTEN_END_SILENCE_MS = int(os.environ.get("LISTEN_END_SILENCE_MS", 900))
+LISTEN_PREROLL_MS = 200  # kept before speech onset so the first phoneme isn't clipped
+LISTEN_MIN_SPEECH_MS = 150  # shorter voiced bursts (clicks, bumps) are dropped
+LISTEN_SEGMENT_MAX_SECONDS = float(os.environ.get("LISTEN_SEGMENT_MAX_SECONDS", 15))
+LISTEN_MAX_SECONDS = float(os.environ.get("LISTEN_MAX_SECONDS", 30))
+LISTEN_READ_BYTES = 4096
+
+# Containers ffmpeg can't sniff from a few bytes of a pipe
+_FFMPEG_FORMATS = {
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/webm": "matroska",
+    "video/webm": "matroska",
+    "audio/mpeg": "mp3",
+}
+_WAV_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+_PCM_TYPES = {"audio/l16", "audio/pcm", "audio/x-raw"}
+
+_stats = {"requests": 0, "endpointed": 0, "segments": 0, "audio_seconds": 0.0, "transcribe_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _count(**amounts):
+    with _stats_lock:
+        for name, amount in amounts.items():
+            _stats[name] += amount
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# -------- DECODING --------
+class _Resampler:
+    """Streaming linear resampler to SAMPLE_RATE (speech band only; Whisper's front end filters the rest)"""
+
+    def __init__(self, rate):
+        self.step = rate / SAMPLE_RATE
+        self.pos = 0.0
+        self.tail = np.zeros(0, dtype=np.float32)
+
+    def __call__(self, samples):
+        if self.step == 1:
+            return samples
+        samples = np.concatenate([self.tail, samples])
+        if len(samples) < 2:
+            self.tail = samples
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self.pos, len(samples) - 1, self.step)
+        out = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+        next_pos = positions[-1] + self.step if len(positions) else self.pos
+        keep = int(next_pos)
+        self.tail = samples[keep:]
+        self.pos = next_pos - keep
+        return out
+
+
+class PCMDecoder:
+    """Raw little-endian PCM (int16 or float32) to mono float32 at SAMPLE_RATE"""
+
+    def __init__(self, rate=SAMPLE_RATE, channels=1, dtype="<i2"):
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = self.dtype.itemsize * channels
+        self.resample = _Resampler(rate)
+        self._pending = b""
+
+    def _convert(self, data):
+        data = self._pending + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.dtype.kind == "i":
+            samples /= 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return self.resample(samples)
+
+    def feed(self, data):
+        return self._convert(data)
+
+    def close(self):
+        return np.zeros(0, dtype=np.float32)
+
+
+class WavDecoder(PCMDecoder):
+    """RIFF/WAVE with 16-bit PCM or 32-bit float samples; the header is parsed as it arrives"""
+
+    def __init__(self):
+        self._header = b""
+        self._remaining = None  # data bytes left, None until the data chunk starts
+        self.resample = None
+
+    def _parse_header(self):
+        data = self._header
+        if len(data) < 12:
+            return None
+        if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Not a WAV file")
+        offset = 12
+        fmt = None
+        while offset + 8 <= len(data):
+            chunk_id, size = data[offset:offset + 4], struct.unpack("<I", data[offset + 4:offset + 8])[0]
+            if chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError("WAV data chunk before fmt chunk")
+                codec, channels, rate, bits = fmt
+                if codec == 1 and bits == 16:
+                    dtype = "<i2"
+                elif codec == 3 and bits == 32:
+                    dtype = "<f4"
+                else:
+                    raise ValueError(f"Unsupported WAV encoding (format {codec}, {bits}-bit); send 16-bit PCM")
+                PCMDecoder.__init__(self, rate, channels, dtype)
+                # Streamed WAVs are written before their length is known (size 0 or 0xFFFFFFFF)
+                self._remaining = size if 0 < size < 0xFFFFFFFF else float("inf")
+                return data[offset + 8:]
+            if offset + 8 + size > len(data):
+                return None
+            if chunk_id == b"fmt ":
+                codec, channels, rate = struct.unpack("<HHI", data[offset + 8:offset + 16])
+                bits = struct.unpack("<H", data[offset + 22:offset + 24])[0]
+                if codec == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE: the real format is the subformat GUID's first word
+                    codec = struct.unpack("<H", data[offset + 32:offset + 34])[0]
+                fmt = (codec, channels, rate, bits)
+            offset += 8 + size + (size & 1)
+        return None
+
+    def feed(self, data):
+        if self._remaining is None:
+            self._header += data
+            data = self._parse_header()
+            if data is None:
+                return np.zeros(0, dtype=np.float32)
+            self._header = b""
+        data = data[:self._remaining] if self._remaining != float("inf") else data
+        self._remaining -= len(data)
+        return self._convert(data)
+
+
+class FFmpegDecoder:
+    """Compressed audio (Opus, MP3, ...) decoded to 16 kHz mono by an ffmpeg subprocess as bytes arrive"""
+
+    def __init__(self, input_format=None):
+        command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-fflags", "nobuffer",
+                   "-probesize", "32768", "-analyzeduration", "0"]
+        if input_format:
+            command += ["-f", input_format]
+        command += ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-flush_packets", "1", "pipe:1"]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise ValueError("Compressed audio needs ffmpeg on the server; send WAV or audio/L16 instead")
+        self.pcm = PCMDecoder()
+        self._output = queue.Queue()
+        self._reader = threading.Thread(target=self._read, name="ffmpeg-reader", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            block = self.process.stdout.read1(LISTEN_READ_BYTES)
+            if not block:
+                self._output.put(None)
+                return
+            self._output.put(block)
+
+    def _drain(self, block=False):
+        out = []
+        while True:
+            try:
+                data = self._output.get(block=block)
+            except queue.Empty:
+                break
+            if data is None:
+                break
+            out.append(self.pcm.feed(data))
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+    def feed(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise ValueError(f"Could not decode audio: {self.process.stderr.read().decode(errors='replace').strip()}")
+        return self._drain()
+
+    def close(self):
+        """Signal end of input and return whatever ffmpeg still had buffered"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        samples = self._drain(block=True)
+        if self.process.wait() != 0 and not len(samples):
+            error = self.process.stderr.read().decode(errors="replace").strip()
+            if error:
+                raise ValueError(f"Could not decode audio: {error}")
+        return samples
+
+    def abort(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+def open_decoder(content_type):
+    """Decoder for a request body of the given Content-Type"""
+    mime, _, params = (content_type or "").partition(";")
+    mime = mime.strip().lower()
+    options = dict(p.strip().split("=", 1) for p in params.split(";") if "=" in p)
+    if mime in _WAV_TYPES:
+        return WavDecoder()
+    if mime in _PCM_TYPES:
+        return PCMDecoder(int(options.get("rate", SAMPLE_RATE)), int(options.get("channels", 1)))
+    return FFmpegDecoder(_FFMPEG_FORMATS.get(mime))
+
+
+# -------- VOICE ACTIVITY DETECTION --------
+class Segmenter:
+    """Energy VAD that cuts a stream of samples into utterance segments and detects end of speech"""
+
+    def __init__(self, vad_db=LISTEN_VAD_DB, margin_db=LISTEN_VAD_MARGIN_DB, pause_ms=LISTEN_PAUSE_MS,
+                 end_silence_ms=LISTEN_END_SILENCE_MS, segment_max_seconds=LISTEN_SEGMENT_MAX_SECONDS,
+                 max_seconds=LISTEN_MAX_SECONDS):
+        self.frame = SAMPLE_RATE * LISTEN_FRAME_MS // 1000
+        self.vad_db = vad_db
+        self.margin_db = margin_db
+        self.pause_frames = pause_ms // LISTEN_FRAME_MS
+        self.end_frames = end_silence_ms // LISTEN_FRAME_MS
+        self.min_speech_frames = LISTEN_MIN_SPEECH_MS // LISTEN_FRAME_MS
+        self.segment_max_frames = int(segment_max_seconds * 1000) // LISTEN_FRAME_MS
+        self.max_frames = int(max_seconds * 1000) // LISTEN_FRAME_MS
+        self.noise_db = -70.0
+        self.frames = 0
+        self.done = False
+        self.heard_speech = False
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._preroll = deque(maxlen=LISTEN_PREROLL_MS // LISTEN_FRAME_MS)
+        self._current = None  # frames of the open segment
+        self._voiced = 0
+        self._silence = 0  # consecutive unvoiced frames
+
+    def _is_voiced(self, frame):
+        db = 10 * np.log10(float(np.mean(frame * frame)) + 1e-10)
+        voiced = db > max(self.vad_db, self.noise_db + self.margin_db)
+        if not voiced:
+            # Follow the noise floor down at once and up slowly
+            self.noise_db = db if db < self.noise_db else self.noise_db + 0.05 * (db - self.noise_db)
+        return voiced
+
+    def _close(self):
+        segment, voiced = self._current, self._voiced
+        self._current = None
+        self._voiced = 0
+        if voiced >= self.min_speech_frames:
+            self.heard_speech = True
+            return np.concatenate(segment)
+        return None
+
+    def feed(self, samples):
+        """Add samples; returns the segments that closed (the speaker paused or stopped)"""
+        segments = []
+        self._buffer = np.concatenate([self._buffer, samples])
+        offset = 0
+        while not self.done and offset + self.frame <= len(self._buffer):
+            frame = self._buffer[offset:offset + self.frame]
+            offset += self.frame
+            self.frames += 1
+            voiced = self._is_voiced(frame)
+            self._silence = 0 if voiced else self._silence + 1
+
+            if self._current is None:
+                if voiced:
+                    self._current = list(self._preroll) + [frame]
+                    self._voiced = 1
+                    self._preroll.clear()
+                else:
+                    self._preroll.append(frame)
+            else:
+                self._current.append(frame)
+                self._voiced += voiced
+                if self._silence >= self.pause_frames or len(self._current) >= self.segment_max_frames:
+                    segment = self._close()
+                    if segment is not None:
+                        segments.append(segment)
+
+            if (self.heard_speech and self._current is None and self._silence >= self.end_frames) \
+                    or self.frames >= self.max_frames:
+                self.done = True
+        self._buffer = self._buffer[offset:]
+        return segments
+
+    def finish(self):
+        """End of input: close the open segment, if it holds speech"""
+        segment = self._close() if self._current is not None else None
+        return [segment] if segment is not None else []
+
+
+# -------- TRANSCRIPTION --------
+class ListenSession:
+    """Decoder + segmenter + the transcript so far for one /listen request"""
+
+    def __init__(self, content_type):
+        self.decoder = open_decoder(content_type)
+        self.segmenter = Segmenter()
+        self.texts = []
+        self.started = time.perf_counter()
+        self.transcribe_seconds = 0.0
+        self.segments = 0
+
+    def feed(self, data):
+        return self.segmenter.feed(self.decoder.feed(data))
+
+    def finish(self):
+        segments = []
+        if not self.segmenter.done:
+            segments = self.segmenter.feed(self.decoder.close())
+        return segments + self.segmenter.finish()
+
+    @property
+    def done(self):
+        return self.segmenter.done
+
+    def prompt(self):
+        """Earlier segments' text, so Whisper keeps names and spelling consistent across cuts"""
+        return " ".join(self.texts) or None
+
+    def add(self, text, seconds):
+        self.segments += 1
+        self.transcribe_seconds += seconds
+        text = text.strip()
+        if text:
+            self.texts.append(text)
+
+    def close(self):
+        if isinstance(self.decoder, FFmpegDecoder):
+            self.decoder.abort()
+        _count(requests=1, endpointed=int(self.segmenter.done), segments=self.segments,
+               audio_seconds=self.segmenter.frames * LISTEN_FRAME_MS / 1000,
+               transcribe_seconds=self.transcribe_seconds)
+
+    @property
+    def text(self):
+        return " ".join(self.texts)
+
+
+def iter_body(stream, size=LISTEN_READ_BYTES):
+    """Chunks of a file-like request body as they arrive"""
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        chunk = read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def transcribe_stream(chunks, content_type, transcribe):
+    """Transcribe speech from an iterable of body chunks with `transcribe(samples, prompt)`.
+
+    Segments are transcribed while later audio is still arriving; returns as soon as
+    the speaker has stopped, without reading the rest of the body.
+    """
+    session = ListenSession(content_type)
+    try:
+        for chunk in chunks:
+            for segment in session.feed(chunk):
+                start = time.perf_counter()
+                session.add(transcribe(segment, session.prompt()), time.perf_counter() - start)
+            if session.done:
+                break
+        for segment in session.finish():
+            start = time.perf_counter()
+            session.add(transcribe(segment, session.prompt()), time.perf_counter() - start)
+    finally:
+        session.close()
+    return session.text
+
+
+async def transcribe_stream_async(chunks, content_type, transcribe):
+    """transcribe_stream() for an async iterator of chunks and an awaitable `transcribe`"""
+    session = ListenSession(content_type)
+    try:
+        async for chunk in chunks:
+            for segment in session.feed(chunk):
+                start = time.perf_counter()
+                session.add(await transcribe(segment, session.prompt()), time.perf_counter() - start)
+            if session.done:
+                break
+        for segment in session.finish():
+            start = time.perf_counter()
+            session.add(await transcribe(segment, session.prompt()), time.perf_counter() - start)
+    finally:
+        session.close()
+    return session.text
@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# Services load their models and datasets as named steps. A step starts as soon as the
+# steps it depends on are done, up to STARTUP_THREADS at once (model loading is mostly
+# file I/O and torch ops that release the GIL). After loading, each step runs its
+# warm-up inference so lazy kernel and allocator setup doesn't land on the first request.
+STARTUP_THREADS = int(os.environ.get("STARTUP_THREADS", 4))
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1") == "1"
+
+
+class _Step:
+    __slots__ = ("name", "load", "after", "warmup", "state", "started", "load_seconds", "warmup_seconds", "error")
+
+    def __init__(self, name, load, after, warmup):
+        self.name = name
+        self.load = load
+        self.after = after
+        self.warmup = warmup
+        self.state = "pending"
+        self.started = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.error = None
+
+
+class Startup:
+    """A service's load steps, run once per process in parallel threads, then warmed up"""
+
+    def __init__(self, name, threads=STARTUP_THREADS, warmup=STARTUP_WARMUP):
+        self.name = name
+        self.threads = threads
+        self.warmup = warmup
+        self._steps = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._running = False
+        self._t0 = None
+        self.total_seconds = None
+        self.error = None
+
+    def step(self, name, after=(), warmup=None):
+        """Decorator registering a load function, the steps it needs first and an optional warm-up"""
+        def register(load):
+            self._steps[name] = _Step(name, load, tuple(after), warmup)
+            return load
+        return register
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def run(self):
+        """Load and warm up everything, blocking until done; later calls wait for (or reuse) the first run"""
+        with self._lock:
+            owner = not self._running and not self._done.is_set()
+            self._running = True
+        if owner:
+            try:
+                self._run_steps()
+            except Exception as e:
+                self.error = e
+            finally:
+                self._done.set()
+        self._done.wait()
+        if self.error is not None:
+            raise RuntimeError(f"{self.name} startup failed: {self.error}") from self.error
+
+    def start(self):
+        """run() on a background thread, so the process can answer readiness probes meanwhile"""
+        def run_logged():
+            try:
+                self.run()
+            except RuntimeError as e:
+                logger.error(str(e))
+        threading.Thread(target=run_logged, name=f"startup-{self.name}", daemon=True).start()
+
+    def _run_step(self, step):
+        step.started = time.perf_counter() - self._t0
+        step.state = "loading"
+        start = time.perf_counter()
+        step.load()
+        step.load_seconds = time.perf_counter() - start
+        if self.warmup and step.warmup is not None:
+            step.state = "warming"
+            start = time.perf_counter()
+            step.warmup()
+            step.warmup_seconds = time.perf_counter() - start
+        step.state = "ready"
+
+    def _run_steps(self):
+        for step in self._steps.values():
+            missing = [dep for dep in step.after if dep not in self._steps]
+            if missing:
+                raise ValueError(f"Step {step.name!r} depends on unknown steps {missing}")
+        self._t0 = time.perf_counter()
+        done = set()
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(self.threads, thread_name_prefix=f"startup-{self.name}") as pool:
+            while len(done) < len(self._steps):
+                for step in self._steps.values():
+                    if step.state == "pending" and step.name not in running.values() \
+                            and all(dep in done for dep in step.after):
+                        running[pool.submit(self._run_step, step)] = step.name
+                if not running:
+                    raise ValueError(f"Dependency cycle among steps {sorted(set(self._steps) - done)}")
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        self._steps[name].state = "failed"
+                        self._steps[name].error = repr(error)
+                        for other in running:
+                            other.cancel()
+                        raise RuntimeError(f"step {name!r}: {error}") from error
+                    done.add(name)
+        self.total_seconds = time.perf_counter() - self._t0
+        logger.info(self.summary())
+
+    def status(self):
+        """Readiness plus per-step state and timings"""
+        return {
+            "service": self.name,
+            "ready": self.ready,
+            "error": repr(self.error) if self.error is not None else None,
+            "total_seconds": self.total_seconds,
+            "steps": {
+                step.name: {
+                    "state": step.state,
+                    "started": step.started,
+                    "load_seconds": step.load_seconds,
+                    "warmup_seconds": step.warmup_seconds,
+                    "error": step.error,
+                }
+                for step in self._steps.values()
+            },
+        }
+
+    def summary(self):
+        """Per-step timing breakdown; `serial` is how long loading one step after another would take"""
+        serial = sum((s.load_seconds or 0) + (s.warmup_seconds or 0) for s in self._steps.values())
+        lines = [f"{self.name} startup: {self.total_seconds or 0:.2f}s with {self.threads} threads "
+                 f"(serial {serial:.2f}s)"]
+        for step in sorted(self._steps.values(), key=lambda s: s.started if s.started is not None else float("inf")):
+            lines.append(
+                f"  {step.name:<18} start {step.started or 0:6.2f}s  load {step.load_seconds or 0:6.2f}s  "
+                f"warm-up {step.warmup_seconds or 0:5.2f}s  {step.state}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,139 @@
+"""Concurrency stress test: every response's audio must be the audio of its own text.
+
+Usage:
+    # server under test, with the deterministic stub TTS and both caches off
+    TTS_BACKEND=stub TTS_CACHE_MAX_BYTES=0 RESPONSE_CACHE_SIZE=0 gunicorn -w 4 --threads 8 -b :8002 rag_flask_api:app
+
+    python stress_audio.py --url http://localhost:8002 --path /ask --concurrency 64 --requests 1000
+    python stress_audio.py --url http://localhost:8003 --path /recommend --voice en-US-AvaNeural
+    python stress_audio.py --offline --concurrency 64    # no server: AudioStore + stub backend in threads
+
+The stub backend stamps sha256(voice, text) into every MP3 frame. For each response,
+the script downloads audio_url and checks that the stamp matches the response text.
+Run the server with TTS_SEGMENTS=0: stitched replies carry one stamp per segment.
+Pre-rendered clips are real edge-tts audio and are counted but not checked.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+import tts_backends
+
+QUERIES = [
+    "hi pie, how are you today?",
+    "What can you help me with?",
+    "Can you find out who scratched my car last night?",
+    "My sister has been missing for two days and no one knows her whereabouts.",
+    "Someone keeps stealing my mail. I want to catch them.",
+    "I think someone is using my identity. Can you find out who?",
+]
+LOCATIONS = ["Dallas, Texas", "Miami, Florida", "Denver, Colorado", "Seattle, Washington"]
+
+_TAG_OFFSET = tts_backends.MP3_TAG_OFFSET
+
+
+def frame_stamps(data):
+    """Distinct digests stamped into the stub's frames"""
+    size = tts_backends.MP3_FRAME_BYTES
+    return {data[i + _TAG_OFFSET:i + _TAG_OFFSET + 32] for i in range(0, len(data) - size + 1, size)}
+
+
+def check(data, text, voice):
+    """'ok', 'mismatch' or 'empty' for one downloaded clip"""
+    if not data:
+        return "empty"
+    return "ok" if frame_stamps(data) == {tts_backends.stub_audio_digest(text, voice)} else "mismatch"
+
+
+def build_payload(path, n):
+    query = f"{QUERIES[n % len(QUERIES)]} ({n})"
+    if path == "/recommend":
+        return {"backstory": query, "location": LOCATIONS[n % len(LOCATIONS)]}
+    return {"query": query}
+
+
+async def run_http(args):
+    import aiohttp
+    results = {"ok": 0, "mismatch": 0, "empty": 0, "unchecked": 0, "http_error": 0}
+    counter = iter(range(args.requests))
+    base = args.url.rstrip("/")
+
+    async def worker(session):
+        for n in counter:
+            async with session.post(base + args.path, json=build_payload(args.path, n)) as resp:
+                body = await resp.json()
+            text = body.get("response") or body.get("error")
+            audio_url = body.get("audio_url")
+            if not text or not audio_url:
+                results["http_error"] += 1
+                continue
+            if audio_url.startswith("/static/prerendered/"):
+                results["unchecked"] += 1
+                continue
+            async with session.get(base + audio_url) as resp:
+                data = await resp.read() if resp.status == 200 else b""
+            outcome = check(data, text, args.voice)
+            results[outcome] += 1
+            if outcome != "ok" and args.verbose:
+                print(f"{outcome}: {text[:60]!r} -> {audio_url}")
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=0)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    return results
+
+
+def run_offline(args):
+    """Flask-style request threads, each with its own asyncio.run(), writing through one AudioStore"""
+    import audio_store
+    backend = tts_backends.StubTTSBackend(latency_ms=5, chunk_ms=1)
+    results = {"ok": 0, "mismatch": 0, "empty": 0}
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    with tempfile.TemporaryDirectory() as scratch:
+        store = audio_store.AudioStore(directory=scratch)
+
+        def worker():
+            for n in counter:
+                text = f"{QUERIES[n % len(QUERIES)]} ({n})"
+                path = asyncio.run(store.save(lambda tmp_path: backend.save(text, args.voice, tmp_path)))
+                with open(path, "rb") as f:
+                    outcome = check(f.read(), text, args.voice)
+                with lock:
+                    results[outcome] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results["files"] = len([name for name in os.listdir(scratch) if name.endswith(".mp3")])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8002")
+    parser.add_argument("--path", default="/ask", choices=["/ask", "/recommend"])
+    parser.add_argument("--voice", default="en-US-AvaNeural", help="voice the service synthesizes with")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_offline(args) if args.offline else asyncio.run(run_http(args))
+    elapsed = time.perf_counter() - start
+    print(f"{args.requests} requests at concurrency {args.concurrency} in {elapsed:.1f}s: {results}")
+    bad = results.get("mismatch", 0) + results.get("empty", 0)
+    raise SystemExit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
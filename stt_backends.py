@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Whisper is loaded on the first transcription, so replicas that only serve text never
+# pay for it. WHISPER_BACKEND picks the engine: openai (the whisper package, fp32 on
+# CPU) or faster (faster-whisper / CTranslate2, int8 by default). Both decode greedily
+# in WHISPER_LANGUAGE, skipping language detection and the temperature fallback.
+WHISPER_BACKEND = os.environ.get("WHISPER_BACKEND", "openai")
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "int8")  # faster-whisper only
+WHISPER_LANGUAGE = os.environ.get("WHISPER_LANGUAGE", "en")
+WHISPER_THREADS = int(os.environ.get("WHISPER_THREADS", 0))  # 0 = library default
+WHISPER_PRELOAD = os.environ.get("WHISPER_PRELOAD", "0") == "1"
+
+SAMPLE_RATE = 16000
+
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+
+class Transcriber:
+    """Speech-to-text engine; subclasses implement _load() and _transcribe()"""
+
+    name = None
+
+    def __init__(self, model=WHISPER_MODEL, language=WHISPER_LANGUAGE, threads=WHISPER_THREADS):
+        self.model_name = model
+        self.language = language or None
+        self.threads = threads
+        self.model = None
+        self.load_seconds = None
+        self.calls = 0
+        self.audio_seconds = 0.0
+        self.transcribe_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    start = time.perf_counter()
+                    self.model = self._load()
+                    self.load_seconds = time.perf_counter() - start
+                    logger.info(f"Loaded {self.name} Whisper {self.model_name} in {self.load_seconds:.1f}s")
+        return self.model
+
+    def transcribe(self, audio, prompt=None):
+        """Text for a file path or 16 kHz float32 samples; `prompt` is the preceding transcript"""
+        self.load()
+        start = time.perf_counter()
+        text = self._transcribe(audio, prompt)
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.transcribe_seconds += elapsed
+        if not isinstance(audio, str):
+            self.audio_seconds += len(audio) / SAMPLE_RATE
+        return text.strip()
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "load_seconds": self.load_seconds,
+            "calls": self.calls,
+            "audio_seconds": round(self.audio_seconds, 2),
+            "real_time_factor": round(self.transcribe_seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+        }
+
+
+class OpenAIWhisper(Transcriber):
+    name = "openai"
+
+    def _load(self):
+        import torch
+        import whisper
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        return whisper.load_model(self.model_name, device="cpu")
+
+    def _transcribe(self, audio, prompt):
+        # transcribe() installs kv-cache hooks on the shared model, so calls are serialized
+        with self._lock:
+            result = self.model.transcribe(
+                audio, language=self.language, initial_prompt=prompt, temperature=0.0,
+                condition_on_previous_text=False, fp16=False
+            )
+        return result["text"]
+
+
+class FasterWhisper(Transcriber):
+    """faster-whisper (CTranslate2): int8 weights and int8 GEMMs on CPU"""
+
+    name = "faster"
+
+    def __init__(self, compute_type=WHISPER_COMPUTE_TYPE, **kwargs):
+        super().__init__(**kwargs)
+        self.compute_type = compute_type
+
+    def _load(self):
+        from faster_whisper import WhisperModel
+        return WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                            cpu_threads=self.threads)
+
+    def _transcribe(self, audio, prompt):
+        segments, _ = self.model.transcribe(
+            audio, language=self.language, initial_prompt=prompt, beam_size=1, best_of=1,
+            temperature=0.0, condition_on_previous_text=False, without_timestamps=True
+        )
+        return "".join(segment.text for segment in segments)
+
+    def stats(self):
+        info = super().stats()
+        info["compute_type"] = self.compute_type
+        return info
+
+
+TRANSCRIBERS = {
+    "openai": OpenAIWhisper,
+    "faster": FasterWhisper,
+}
+
+
+def create_transcriber(name=WHISPER_BACKEND, model=WHISPER_MODEL, **kwargs):
+    if name not in TRANSCRIBERS:
+        raise ValueError(f"Unknown WHISPER_BACKEND {name!r}; expected one of {sorted(TRANSCRIBERS)}")
+    return TRANSCRIBERS[name](model=model, **kwargs)
+
+
+def get_transcriber():
+    """Return the process-wide transcriber; the model itself loads on first use"""
+    global _transcriber
+    if _transcriber is None:
+        with _transcriber_lock:
+            if _transcriber is None:
+                _transcriber = create_transcriber()
+    return _transcriber
+
+
+def transcribe(audio, prompt=None):
+    return get_transcriber().transcribe(audio, prompt)
+
+
+def stats():
+    return get_transcriber().stats()
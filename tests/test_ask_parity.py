@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("starlette")
+from starlette.testclient import TestClient
+
+import asgi_app
+import rag_flask_api
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Flask and ASGI clients for the rag service, marked ready without loading any models"""
+    done = threading.Event()
+    done.set()
+    monkeypatch.setattr(rag_flask_api.startup, "_done", done)
+    app = asgi_app.create_app("rag")
+    app.state.service.module = rag_flask_api
+    app.state.service.ready = True
+    return rag_flask_api.app.test_client(), TestClient(app)
+
+
+@pytest.mark.parametrize("body", [{}, {"query": ""}, {"query": "   "}])
+def test_invalid_query_gets_the_same_400_from_both_servers(clients, body):
+    flask_client, asgi_client = clients
+    flask_response = flask_client.post("/ask", json=body)
+    asgi_response = asgi_client.post("/ask", json=body)
+    assert flask_response.status_code == asgi_response.status_code == 400
+    assert flask_response.get_json() == asgi_response.json() == {"error": "Invalid input", "audio_url": ""}
@@ -0,0 +1,51 @@
+import pytest
+
+import audio_jobs
+import tts_backends
+from audio_cache import AudioCache
+
+VOICE = "en-US-AvaNeural"
+
+
+class FlakyBackend(tts_backends.StubTTSBackend):
+    """Stub backend whose first save fails"""
+
+    def __init__(self):
+        super().__init__(latency_ms=0, chunk_ms=0)
+        self.saves = 0
+
+    async def save(self, text, voice, path):
+        self.saves += 1
+        if self.saves == 1:
+            raise RuntimeError("edge hiccup")
+        await super().save(text, voice, path)
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_backends, "_backend", FlakyBackend())
+    return audio_jobs.AudioJobs(AudioCache(directory=str(tmp_path)))
+
+
+def test_retry_after_failure_serves_the_new_audio(jobs):
+    key = jobs.submit("Hello there", VOICE)
+    with pytest.raises(RuntimeError, match="edge hiccup"):
+        jobs.wait(key, timeout=5)
+    with pytest.raises(RuntimeError, match="edge hiccup"):
+        jobs.wait(key, timeout=0)  # the failure is remembered for pollers
+
+    assert jobs.submit("Hello there", VOICE) == key
+    path = jobs.wait(key, timeout=5)
+    assert path == jobs.path_for_key(key)
+    assert jobs.wait(key, timeout=0) == path
+    assert jobs.stats()["failed"] == 1 and jobs.stats()["completed"] == 1
+
+
+def test_audio_on_disk_wins_over_a_remembered_failure(jobs):
+    key = jobs.submit("Hello there", VOICE)
+    with pytest.raises(RuntimeError):
+        jobs.wait(key, timeout=5)
+    # Another worker synthesized it meanwhile
+    with open(jobs.path_for_key(key), "wb") as f:
+        f.write(tts_backends.StubTTSBackend().render("Hello there", VOICE))
+    assert jobs.wait(key, timeout=0) == jobs.path_for_key(key)
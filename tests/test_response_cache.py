@@ -0,0 +1,40 @@
+import numpy as np
+
+from response_cache import ResponseCache
+
+
+def embedding(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_miss_is_remembered_in_both_tiers(tmp_path):
+    cache = ResponseCache(maxsize=4)
+    audio = tmp_path / "hello.mp3"
+    audio.write_bytes(b"mp3")
+
+    response, audio_path, remember = cache.answer("Hello!", lambda: embedding(1, 0), lambda text, e: "Hi there")
+    assert (response, audio_path) == ("Hi there", None)
+    remember(str(audio))
+
+    assert cache.answer("hello", lambda: embedding(1, 0), None)[:2] == ("Hi there", str(audio))
+    assert cache.answer("hey you", lambda: embedding(1, 0.01), None)[:2] == ("Hi there", str(audio))
+
+
+def test_hit_with_evicted_audio_relinks_without_a_second_put(tmp_path):
+    cache = ResponseCache(maxsize=4)
+    cache.answer("Hello", lambda: embedding(1, 0), lambda text, e: "Hi there")[2](str(tmp_path / "gone.mp3"))
+    fresh = tmp_path / "fresh.mp3"
+    fresh.write_bytes(b"mp3")
+
+    response, audio_path, remember = cache.answer("hello", lambda: embedding(1, 0), None)
+    assert (response, audio_path) == ("Hi there", None)
+    remember(str(fresh))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.answer("Hello", lambda: embedding(1, 0), None)[:2] == ("Hi there", str(fresh))
+
+
+def test_never_cache_responses_are_not_stored():
+    cache = ResponseCache(maxsize=4)
+    cache.answer("what?", lambda: embedding(0, 1), lambda text, e: "Sorry", never_cache=("Sorry",))[2]("x.mp3")
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,24 @@
+import io
+
+import numpy as np
+import pytest
+
+import tts_backends
+
+
+def test_frames_are_tagged_with_the_text_digest():
+    data = tts_backends.StubTTSBackend().render("Hello there", "en-US-AvaNeural")
+    digest = tts_backends.stub_audio_digest("Hello there", "en-US-AvaNeural")
+    size, offset = tts_backends.MP3_FRAME_BYTES, tts_backends.MP3_TAG_OFFSET
+    assert len(data) % size == 0
+    assert {data[i + offset:i + offset + len(digest)] for i in range(0, len(data), size)} == {digest}
+
+
+def test_stub_audio_decodes_to_a_tone():
+    av = pytest.importorskip("av")
+    data = tts_backends.StubTTSBackend().render("A sentence long enough for a couple of seconds of audio", "v")
+    with av.open(io.BytesIO(data), format="mp3") as container:
+        pcm = np.concatenate([f.to_ndarray().reshape(-1) for f in container.decode(audio=0)])[2048:]
+    spectrum = np.abs(np.fft.rfft(pcm))
+    assert np.fft.rfftfreq(len(pcm), 1 / 44100)[spectrum.argmax()] == pytest.approx(459, abs=5)
+    assert 0.1 < np.abs(pcm).max() < 0.5
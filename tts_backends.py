@@ -0,0 +1,329 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+
+import audio_cache
+import audio_store
+import tts_segments
+
+logger = logging.getLogger(__name__)
+
+# TTS_BACKEND picks the synthesizer behind every speak(): edge (edge-tts, needs network),
+# local (pyttsx3 + ffmpeg, offline) or stub (deterministic tone MP3, no I/O).
+# With TTS_FALLBACK set, a primary call that fails or takes longer than TTS_TIMEOUT
+# seconds is retried on the fallback, and the primary is skipped for TTS_COOLDOWN seconds.
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "edge")
+TTS_FALLBACK = os.environ.get("TTS_FALLBACK", "")
+TTS_TIMEOUT = float(os.environ.get("TTS_TIMEOUT", 10))
+TTS_COOLDOWN = float(os.environ.get("TTS_COOLDOWN", 30))
+
+# Stub timing: delay before the first chunk, pacing between chunks, audio length per character
+TTS_STUB_LATENCY_MS = float(os.environ.get("TTS_STUB_LATENCY_MS", 0))
+TTS_STUB_CHUNK_MS = float(os.environ.get("TTS_STUB_CHUNK_MS", 0))
+TTS_STUB_MS_PER_CHAR = float(os.environ.get("TTS_STUB_MS_PER_CHAR", 60))
+
+LOCAL_TTS_RATE = int(os.environ.get("LOCAL_TTS_RATE", 175))
+
+READ_BYTES = 16 * 1024
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class TTSBackend:
+    """Text-to-speech engine producing MP3; subclasses implement stream() and/or save()"""
+
+    name = None
+
+    def cache_voice(self, voice):
+        """Voice label for cache keys, so different engines never share cached clips"""
+        return voice if self.name == "edge" else f"{self.name}:{voice}"
+
+    def stream(self, text, voice):
+        """Async iterator of MP3 bytes as they are produced"""
+        raise NotImplementedError
+
+    async def open_stream(self, text, voice):
+        """(cache voice of the engine actually producing the audio, async iterator of MP3 bytes)"""
+        return self.cache_voice(voice), self.stream(text, voice)
+
+    async def save(self, text, voice, path):
+        with open(path, "wb") as f:
+            async for chunk in self.stream(text, voice):
+                f.write(chunk)
+
+    async def fetch(self, cache, text, voice):
+        """Cached audio path for (voice, text), synthesizing into the cache on a miss"""
+        return await cache.fetch(text, self.cache_voice(voice), lambda path: self.save(text, voice, path))
+
+
+class EdgeTTSBackend(TTSBackend):
+    name = "edge"
+
+    async def stream(self, text, voice):
+        import edge_tts
+        async for chunk in edge_tts.Communicate(text, voice).stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+    async def save(self, text, voice, path):
+        import edge_tts
+        await edge_tts.Communicate(text, voice).save(path)
+
+
+class LocalTTSBackend(TTSBackend):
+    """Offline synthesis with pyttsx3 (espeak/SAPI/NSSS), converted to MP3 by pydub/ffmpeg.
+
+    Neural voice names have no local equivalent, so every voice uses the system default.
+    """
+
+    name = "local"
+
+    def __init__(self, rate=LOCAL_TTS_RATE):
+        self.rate = rate
+        self._lock = threading.Lock()  # pyttsx3 engines are not thread-safe
+
+    def _render(self, text, path):
+        import pyttsx3
+        from pydub import AudioSegment
+        wav_path = f"{path}.{uuid.uuid4().hex}.wav"
+        try:
+            with self._lock:
+                engine = pyttsx3.init()
+                engine.setProperty("rate", self.rate)
+                engine.save_to_file(text, wav_path)
+                engine.runAndWait()
+            AudioSegment.from_wav(wav_path).export(path, format="mp3")
+        finally:
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+    async def save(self, text, voice, path):
+        await asyncio.to_thread(self._render, text, path)
+
+    async def stream(self, text, voice):
+        path = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"local_tts_{uuid.uuid4().hex}.mp3")
+        try:
+            await self.save(text, voice, path)
+            with open(path, "rb") as f:
+                while True:
+                    block = f.read(READ_BYTES)
+                    if not block:
+                        return
+                    yield block
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# One MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, mono, no padding -> 417 bytes, ~26.1 ms.
+# Each of its two granules codes a single nonzero MDCT line (line 11, Huffman table 1,
+# no scalefactors), which repeated frame after frame decodes to a steady ~459 Hz sine at
+# about -12 dBFS. The 3 bytes of main data are followed by ancillary data for the tag.
+MP3_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+MP3_FRAME_BYTES = 417
+MP3_FRAME_MS = 1152 / 44.1
+MP3_TONE_GAIN = 202  # global_gain: each step of 4 doubles the amplitude
+
+
+def _pack_bits(fields):
+    """Big-endian (value, width) bit fields -> bytes, zero-padded to a byte boundary"""
+    value, width = 0, 0
+    for v, n in fields:
+        value, width = value << n | v, width + n
+    pad = -width % 8
+    return (value << pad).to_bytes((width + pad) // 8, "big")
+
+
+# Lines 0-9 as five (0, 0) pairs ("1"), then lines 10-11 as (0, 1) ("001") with a + sign bit
+_TONE_GRANULE = ((1, 1),) * 5 + ((0b001, 3), (0, 1))
+_TONE_GRANULE_SIDE_INFO = (
+    (sum(n for _, n in _TONE_GRANULE), 12),  # part2_3_length
+    (6, 9),  # big_values: 6 pairs
+    (MP3_TONE_GAIN, 8),
+    (0, 4), (0, 1),  # scalefac_compress, window_switching_flag: long blocks, no scalefactors
+    (1, 5), (1, 5), (1, 5), (0, 4), (0, 3),  # table_select x3, region0/1_count
+    (0, 1), (0, 1), (0, 1),  # preflag, scalefac_scale, count1table_select
+)
+_TONE_FRAME = MP3_FRAME_HEADER + _pack_bits(((0, 9), (0, 5), (0, 4)) + _TONE_GRANULE_SIDE_INFO * 2) \
+    + _pack_bits(_TONE_GRANULE * 2)
+MP3_TAG_OFFSET = len(_TONE_FRAME)
+
+
+def stub_audio_digest(text, voice):
+    return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).digest()
+
+
+def tone_mp3_frame(tag=b""):
+    """A playable tone frame carrying up to 393 bytes of tag in its ancillary data"""
+    frame = _TONE_FRAME + tag[:MP3_FRAME_BYTES - MP3_TAG_OFFSET]
+    return frame + bytes(MP3_FRAME_BYTES - len(frame))
+
+
+class StubTTSBackend(TTSBackend):
+    """Deterministic tone MP3 sized to the text, after a configurable latency.
+
+    Every frame carries sha256(voice, text), so a clip can be traced back to its text.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms=TTS_STUB_LATENCY_MS, chunk_ms=TTS_STUB_CHUNK_MS,
+                 ms_per_char=TTS_STUB_MS_PER_CHAR, frames_per_chunk=8):
+        self.latency_ms = latency_ms
+        self.chunk_ms = chunk_ms
+        self.ms_per_char = ms_per_char
+        self.frames_per_chunk = frames_per_chunk
+        self.calls = 0
+
+    def frame_count(self, text):
+        return max(1, round(len(text) * self.ms_per_char / MP3_FRAME_MS))
+
+    def render(self, text, voice):
+        """The complete clip stream()/save() produce for (voice, text)"""
+        return tone_mp3_frame(stub_audio_digest(text, voice)) * self.frame_count(text)
+
+    async def stream(self, text, voice):
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        frame = tone_mp3_frame(stub_audio_digest(text, voice))
+        remaining = self.frame_count(text)
+        while remaining > 0:
+            n = min(self.frames_per_chunk, remaining)
+            remaining -= n
+            yield frame * n
+            if remaining and self.chunk_ms:
+                await asyncio.sleep(self.chunk_ms / 1000)
+
+
+class FailoverBackend(TTSBackend):
+    """Primary backend with a fallback for errors and slow calls, plus a cooldown after failures"""
+
+    def __init__(self, primary, fallback, timeout=TTS_TIMEOUT, cooldown=TTS_COOLDOWN):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.name = primary.name
+        self.failovers = 0
+        self._skip_until = 0.0
+
+    def cache_voice(self, voice):
+        return self.primary.cache_voice(voice)
+
+    def _healthy(self):
+        return time.monotonic() >= self._skip_until
+
+    def _trip(self, e):
+        self.failovers += 1
+        self._skip_until = time.monotonic() + self.cooldown
+        logger.warning(f"TTS backend {self.primary.name} failed ({e!r}); using {self.fallback.name} "
+                       f"for the next {self.cooldown:.0f}s")
+
+    async def save(self, text, voice, path):
+        if self._healthy():
+            try:
+                return await asyncio.wait_for(self.primary.save(text, voice, path), self.timeout)
+            except Exception as e:
+                self._trip(e)
+        await self.fallback.save(text, voice, path)
+
+    async def fetch(self, cache, text, voice):
+        # Fallback clips are cached under the fallback's own key, so the primary's
+        # cache entry is never filled with substitute audio
+        path = cache.get(self.primary.cache_voice(voice), text)
+        if path is not None:
+            return path
+        if self._healthy():
+            try:
+                return await asyncio.wait_for(self.primary.fetch(cache, text, voice), self.timeout)
+            except Exception as e:
+                self._trip(e)
+        return await self.fallback.fetch(cache, text, voice)
+
+    async def open_stream(self, text, voice):
+        # The engine is chosen on the first chunk; once audio has gone out it can't switch
+        if self._healthy():
+            chunks = self.primary.stream(text, voice)
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                first = b""
+            except Exception as e:
+                await chunks.aclose()
+                self._trip(e)
+            else:
+                return self.primary.cache_voice(voice), _prepend(first, chunks)
+        return await self.fallback.open_stream(text, voice)
+
+    async def stream(self, text, voice):
+        _, chunks = await self.open_stream(text, voice)
+        async for chunk in chunks:
+            yield chunk
+
+    def stats(self):
+        return {"failovers": self.failovers, "primary_skipped": not self._healthy()}
+
+
+async def _prepend(first, chunks):
+    if first:
+        yield first
+    async for chunk in chunks:
+        yield chunk
+
+
+BACKENDS = {
+    "edge": EdgeTTSBackend,
+    "local": LocalTTSBackend,
+    "stub": StubTTSBackend,
+}
+
+
+def create_backend(name, fallback=""):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend {name!r}; expected one of {sorted(BACKENDS)}")
+    backend = BACKENDS[name]()
+    if fallback:
+        if fallback not in BACKENDS:
+            raise ValueError(f"Unknown TTS fallback {fallback!r}; expected one of {sorted(BACKENDS)}")
+        backend = FailoverBackend(backend, BACKENDS[fallback]())
+    return backend
+
+
+def get_backend():
+    """Return the process-wide backend configured by TTS_BACKEND / TTS_FALLBACK"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(TTS_BACKEND, TTS_FALLBACK)
+                if tts_segments.TTS_SEGMENTS:
+                    _backend = tts_segments.SegmentedBackend(_backend)
+                logger.info(f"TTS backend: {TTS_BACKEND}" + (f" (fallback {TTS_FALLBACK})" if TTS_FALLBACK else ""))
+    return _backend
+
+
+async def synthesize(text, voice):
+    """Path of an audio file for text: prerendered, from the TTS cache, or a fresh per-request file"""
+    prerendered = audio_cache.find_prerendered(voice, text)
+    if prerendered is not None:
+        return prerendered
+    cache = audio_cache.get_cache()
+    if cache is not None:
+        # Replies come from a fixed set, so most requests are served from the cache
+        return await get_backend().fetch(cache, text, voice)
+    # Uniquely named, so concurrent requests never share a file; the store's sweep evicts old ones
+    return await audio_store.get_store().save(lambda tmp_path: get_backend().save(text, voice, tmp_path))
+
+
+def stats():
+    backend = get_backend()
+    info = {"backend": TTS_BACKEND, "fallback": TTS_FALLBACK or None}
+    if hasattr(backend, "stats"):
+        info.update(backend.stats())
+    return info
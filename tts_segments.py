@@ -0,0 +1,149 @@
+import os
+import re
+import uuid
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# TTS_SEGMENTS=1 synthesizes long replies sentence by sentence, TTS_SEGMENT_PARALLELISM
+# at a time, and stitches the cached segment MP3s into one file without re-encoding.
+# Texts shorter than TTS_SEGMENT_MIN_CHARS are synthesized whole.
+TTS_SEGMENTS = os.environ.get("TTS_SEGMENTS", "0") == "1"
+TTS_SEGMENT_PARALLELISM = int(os.environ.get("TTS_SEGMENT_PARALLELISM", 4))
+TTS_SEGMENT_MIN_CHARS = int(os.environ.get("TTS_SEGMENT_MIN_CHARS", 80))
+TTS_SEGMENT_MIN_SEGMENT_CHARS = 12  # shorter pieces are merged into a neighbour
+
+_sentence_end = re.compile(r"(?<=[.!?])\s+")
+_phrases = []  # recurring leading phrases split off into their own cached segment
+_phrases_lock = threading.Lock()
+
+
+def register_phrase(phrase):
+    """Treat `phrase` as its own segment wherever a sentence starts with it"""
+    with _phrases_lock:
+        if phrase not in _phrases:
+            _phrases.append(phrase)
+            _phrases.sort(key=len, reverse=True)
+
+
+def split_segments(text):
+    """Split text at sentence ends and after registered phrases, merging very short pieces"""
+    pieces = []
+    for sentence in _sentence_end.split(text.strip()):
+        for phrase in _phrases:
+            if sentence.startswith(phrase) and len(sentence) > len(phrase):
+                pieces.extend([phrase, sentence[len(phrase):].strip()])
+                break
+        else:
+            pieces.append(sentence)
+
+    segments = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if segments and len(piece) < TTS_SEGMENT_MIN_SEGMENT_CHARS:
+            segments[-1] = f"{segments[-1]} {piece}"
+        else:
+            segments.append(piece)
+    if len(segments) > 1 and len(segments[0]) < TTS_SEGMENT_MIN_SEGMENT_CHARS:
+        segments[1] = f"{segments[0]} {segments[1]}"
+        del segments[0]
+    return segments
+
+
+# -------- MP3 FRAME STITCHING --------
+_BITRATES_KBPS = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 Layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2/2.5 Layer III
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _frame_length(data, offset):
+    """Byte length of the Layer III frame starting at offset, or None if there is no valid header"""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 0x3  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (data[offset + 1] >> 1) & 0x3
+    bitrate_idx = data[offset + 2] >> 4
+    rate_idx = (data[offset + 2] >> 2) & 0x3
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    bitrate = _BITRATES_KBPS[1 if version == 3 else 2][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    padding = (data[offset + 2] >> 1) & 0x1
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+
+def mp3_frames(data):
+    """The MPEG audio frames of an MP3 file: ID3 tags and a leading Xing/Info/VBRI frame removed"""
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+    while start < end and _frame_length(data, start) is None:
+        start += 1  # resync on stray bytes before the first frame
+    length = _frame_length(data, start)
+    if length and any(tag in data[start:start + length] for tag in (b"Xing", b"Info", b"VBRI")):
+        start += length  # its frame count/duration would describe only this segment
+    return data[start:end]
+
+
+def stitch(paths, out_path):
+    """Concatenate MP3 segments frame-wise into out_path (same encoder settings, no re-encode)"""
+    with open(out_path, "wb") as out:
+        for path in paths:
+            with open(path, "rb") as f:
+                out.write(mp3_frames(f.read()))
+
+
+class SegmentedBackend:
+    """Wraps a TTS backend so cached fetches of long texts are synthesized per segment, in parallel"""
+
+    def __init__(self, backend, parallelism=TTS_SEGMENT_PARALLELISM, min_chars=TTS_SEGMENT_MIN_CHARS):
+        self.backend = backend
+        self.parallelism = parallelism
+        self.min_chars = min_chars
+        self.segmented = 0
+        self.segments = 0
+
+    def __getattr__(self, attr):
+        return getattr(self.backend, attr)
+
+    async def _fetch_segment(self, cache, segment, voice, semaphore):
+        async with semaphore:
+            return await self.backend.fetch(cache, segment, voice)
+
+    async def fetch(self, cache, text, voice):
+        segments = split_segments(text) if len(text) >= self.min_chars else [text]
+        if len(segments) < 2:
+            return await self.backend.fetch(cache, text, voice)
+        cache_voice = self.backend.cache_voice(voice)
+        path = cache.get(cache_voice, text)
+        if path is not None:
+            return path
+
+        semaphore = asyncio.Semaphore(self.parallelism)
+        paths = await asyncio.gather(*(self._fetch_segment(cache, s, voice, semaphore) for s in segments))
+        tmp_path = f"{cache.path_for(cache_voice, text)}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                stitch(paths, tmp_path)
+            except FileNotFoundError:
+                # A segment was evicted in between; fetch again (re-synthesizing at worst)
+                paths = [await self.backend.fetch(cache, s, voice) for s in segments]
+                stitch(paths, tmp_path)
+            self.segmented += 1
+            self.segments += len(segments)
+            return cache.put(cache_voice, text, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        info = self.backend.stats() if hasattr(self.backend, "stats") else {}
+        info.update({"segmented_texts": self.segmented, "segments": self.segments})
+        return info